@@ -0,0 +1,15 @@
+"""Application configuration, loaded once per process from the project root .env file"""
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+# ENV_FILE points a process at another file, e.g. the load-test harness's isolated settings
+ENV_PATH = Path(os.getenv("ENV_FILE") or PROJECT_ROOT / ".env")
+
+# Default location of the SQLite caches and indexes the services keep; outside datasets/, which is served under /files
+CACHE_DIR = PROJECT_ROOT / "backend" / ".cache"
+
+# Every module that reads the environment imports this one first, so the file is parsed exactly once
+load_dotenv(dotenv_path=ENV_PATH, override=True)
@@ -1,65 +1,248 @@
 """Wardrobe.AI Backend - Virtual try-on for hairstyles and clothing using Hugging Face APIs"""
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
-import uuid
-import shutil
+import asyncio
+import json
 import logging
 import os
-from typing import Optional, List, Dict, Any
-from PIL import Image
-from dotenv import load_dotenv
-
-# Load environment variables from root .env file
-project_root = Path(__file__).resolve().parent.parent.parent
-env_path = project_root / '.env'
-load_dotenv(dotenv_path=env_path, override=True)
+import time
+from typing import Optional, List, Dict, Any, Tuple
 
+# Loads the project root .env file before any service reads the environment
+from app import config  # noqa: F401
 from app.services.idm_vton_service import get_idm_vton_service, initialize_idm_vton_service
 from app.services.google_search_service import get_google_search_service
 from app.services.openai_service import get_openai_service
+from app.services.tryon_job_service import get_tryon_job_queue, TryOnJob, JOB_DONE, JOB_RUNNING
+from app.services.tryon_cache_service import (
+    TryOnResultCache,
+    get_tryon_result_cache,
+    initialize_tryon_result_cache,
+)
+from app.services.upload_store_service import get_upload_store, initialize_upload_store, UploadTooLargeError
+from app.services.image_preprocessing_service import VARIANT_FORMATS, get_image_preprocessor
+from app.services.hairstyle_index_service import get_hairstyle_index, initialize_hairstyle_index
+from app.services.image_variant_service import get_image_variant_store, initialize_image_variant_store
+from app.services.storage_service import get_storage_manager, initialize_storage_manager
+from app.services.shared_state import initialize_shared_state
+from app.services.chat_compaction import count_tokens
+from app.services.admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, UpstreamBusyError
+from app.services import metrics
+from app.services.metrics import MetricsMiddleware, timed
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def save_and_convert_to_png(upload_file: UploadFile, save_dir: Path) -> Path:
-    """Saves an uploaded file and converts it to PNG, returning the new path."""
-    # Create a unique filename to avoid conflicts
-    temp_path = save_dir / f"{uuid.uuid4()}{Path(upload_file.filename).suffix}"
-    with open(temp_path, "wb") as f:
-        shutil.copyfileobj(upload_file.file, f)
+async def store_upload(upload_file: UploadFile) -> Tuple[str, Path]:
+    """Stores an uploaded image in the upload store, returning its id and normalized image path."""
+    try:
+        with timed("upload_save"):
+            return await get_upload_store().save(upload_file.file, upload_file.filename)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # If it's already a PNG, just return the path
-    if temp_path.suffix.lower() == ".png":
-        return temp_path
 
-    # Convert to PNG
-    png_path = temp_path.with_suffix(".png")
-    try:
-        with Image.open(temp_path) as img:
-            # Using .convert("RGB") to handle formats like WEBP that might have an alpha channel
-            # and to ensure compatibility with models that expect 3-channel images.
-            rgb_img = img.convert("RGB")
-            rgb_img.save(png_path, "PNG")
-        
-        temp_path.unlink()  # Remove the original non-PNG file
-        logger.info(f"Successfully converted {temp_path.name} to {png_path.name}")
-        return png_path
-    except Exception:
-        logger.error(f"Failed to convert {temp_path.name} to PNG.", exc_info=True)
-        # If conversion fails, re-raise as an HTTPException
-        raise HTTPException(status_code=400, detail=f"Invalid or unsupported image file: {upload_file.filename}")
+class RequestSizeLimitMiddleware:
+    """ASGI middleware rejecting request bodies over a byte limit with 413 before they are buffered."""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds the {self.max_bytes / 1024 / 1024:g} MB limit"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited():
+            # Chunked bodies carry no Content-Length, so count what actually arrives
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+def too_busy(error: UpstreamBusyError) -> HTTPException:
+    """429 telling the client when to retry a request rejected by admission control."""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+async def resolve_image(upload_file: Optional[UploadFile], image_id: Optional[str], field: str) -> Tuple[str, Path]:
+    """Returns the id and path of an image given either a fresh upload or a previously stored id."""
+    if upload_file is not None:
+        return await store_upload(upload_file)
+    if image_id:
+        path = get_upload_store().get(image_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail=f"Unknown {field}_id: {image_id}")
+        return image_id, path
+    raise HTTPException(status_code=400, detail=f"Either {field} or {field}_id is required")
+
+
+def run_clothing_tryon(
+    cache_key: str,
+    person_path: Path,
+    clothing_path: Path,
+    garment_description: str,
+    auto_mask: bool,
+    auto_crop: bool,
+    denoise_steps: int,
+    seed: int,
+    priority: int
+) -> str:
+    """Runs a blocking try-on and stores the result in the GENERATED cache, returning its public URL."""
+    cache = get_tryon_result_cache()
+
+    # An identical job may have completed while this one was waiting in the queue
+    cached_filename = cache.get(cache_key)
+    if cached_filename:
+        logger.info(f"Clothing try-on served from cache: {cached_filename}")
+        return f"/files/generated/{cached_filename}"
+
+    service = get_idm_vton_service()
+    result_path = service.try_on(
+        person_image=person_path,
+        garment_image=clothing_path,
+        garment_description=garment_description,
+        is_checked=auto_mask,
+        is_checked_crop=auto_crop,
+        denoise_steps=denoise_steps,
+        seed=seed,
+        priority=priority
+    )
+
+    # Copy result to generated folder under its content-addressed cache name
+    output_filename = cache.put(cache_key, result_path)
+
+    logger.info(f"Clothing try-on completed: {GENERATED / output_filename}")
+    return f"/files/generated/{output_filename}"
+
+
+def start_clothing_tryon(
+    person_id: str,
+    person_path: Path,
+    clothing_id: str,
+    clothing_path: Path,
+    garment_description: str,
+    auto_mask: bool,
+    auto_crop: bool,
+    denoise_steps: int,
+    seed: int,
+    priority: int = PRIORITY_INTERACTIVE
+) -> Tuple[Optional[str], Optional[TryOnJob]]:
+    """Returns the cached result URL for a try-on if there is one, otherwise queues it (at the given priority) and returns the job."""
+    cache_key = TryOnResultCache.make_key(
+        person_id,
+        clothing_id,
+        garment_description=garment_description,
+        auto_mask=auto_mask,
+        auto_crop=auto_crop,
+        denoise_steps=denoise_steps,
+        seed=seed
+    )
+    cached_filename = get_tryon_result_cache().get(cache_key)
+    if cached_filename:
+        logger.info(f"Clothing try-on served from cache: {cached_filename}")
+        return f"/files/generated/{cached_filename}", None
+
+    job = get_tryon_job_queue().submit(partial(
+        run_clothing_tryon,
+        cache_key,
+        person_path,
+        clothing_path,
+        garment_description,
+        auto_mask,
+        auto_crop,
+        denoise_steps,
+        seed,
+        priority
+    ), priority)
+    return None, job
+
+
+# Connect to upstreams and load lazily imported libraries in the background after startup
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes")
+warmup_state: Dict[str, Any] = {"status": "enabled" if STARTUP_WARMUP else "disabled", "seconds": None}
+
+
+async def warm_up():
+    """Pay the first-request costs (Gradio connections, PIL in the workers, the tokenizer, the hairstyle index) before traffic arrives"""
+    warmup_state["status"] = "running"
+    started = time.perf_counter()
+    await asyncio.gather(
+        get_image_preprocessor().warm_up(),
+        asyncio.to_thread(get_idm_vton_service().warm_up),
+        asyncio.to_thread(count_tokens, "warm-up"),
+        asyncio.to_thread(get_hairstyle_index().ensure_loaded),
+        return_exceptions=True
+    )
+    warmup_state["status"] = "done"
+    warmup_state["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"Warm-up finished in {warmup_state['seconds']}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers on startup and stop them on shutdown"""
+    preprocessor = get_image_preprocessor()
+    preprocessor.start()
+    job_queue = get_tryon_job_queue()
+    await job_queue.start()
+    openai_service = get_openai_service()
+    await openai_service.startup()
+    storage = get_storage_manager()
+    await storage.start()
+    # Serving starts immediately; warm-up only shortens the first requests
+    warmup_task = asyncio.create_task(warm_up()) if STARTUP_WARMUP else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    await storage.stop()
+    await job_queue.stop()
+    preprocessor.shutdown()
+    await get_google_search_service().aclose()
+    await openai_service.aclose()
 
 
 app = FastAPI(
     title="Wardrobe.AI API",
     description="Virtual try-on for clothing",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    max_bytes=int(float(os.getenv("UPLOAD_MAX_REQUEST_MB", "100")) * 1024 * 1024)
+)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -71,12 +254,64 @@ app.add_middleware(
 # Setup directories
 UPLOADS = Path("../datasets/uploads")
 GENERATED = Path("../datasets/generated")
+# Not under ../datasets: everything there is publicly served under /files
+CACHE = Path(".cache")
 
 UPLOADS.mkdir(parents=True, exist_ok=True)
 GENERATED.mkdir(parents=True, exist_ok=True)
+CACHE.mkdir(parents=True, exist_ok=True)
+
+# Caches, try-on job status and rate limits are shared by every worker process (uvicorn --workers N)
+shared_state = initialize_shared_state()
+
+# The storage manager bounds the size of every directory the services below write to
+storage = initialize_storage_manager(CACHE / "storage.sqlite3")
+storage.add_area(
+    "uploads",
+    UPLOADS,
+    float(os.getenv("STORAGE_UPLOADS_MAX_MB", "2048")),
+    float(os.getenv("STORAGE_UPLOADS_MAX_AGE_DAYS", "30"))
+)
+storage.add_area(
+    "generated",
+    GENERATED,
+    float(os.getenv("STORAGE_GENERATED_MAX_MB", os.getenv("TRYON_CACHE_MAX_MB", "1024"))),
+    float(os.getenv("STORAGE_GENERATED_MAX_AGE_DAYS", "30"))
+)
+storage.add_area(
+    "variants",
+    CACHE / "variants",
+    float(os.getenv("STORAGE_VARIANTS_MAX_MB", "512")),
+    float(os.getenv("STORAGE_VARIANTS_MAX_AGE_DAYS", "30"))
+)
+
+initialize_idm_vton_service()
+initialize_tryon_result_cache(GENERATED)
+initialize_upload_store(UPLOADS)
+initialize_hairstyle_index(Path("../datasets"), CACHE / "hairstyle_index")
+initialize_image_variant_store({"uploads": UPLOADS, "generated": GENERATED}, CACHE / "variants")
+
+# Variant URLs change whenever the source or parameters change, so they can be cached for a long time
+IMAGE_VARIANT_MAX_AGE = int(os.getenv("IMAGE_VARIANT_MAX_AGE", "31536000"))
+
+
+class TrackedStaticFiles(StaticFiles):
+    """Static files that report reads of managed files to the storage manager, keeping them off the eviction list"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        # Hidden directories hold in-progress writes
+        if any(part.startswith(".") for part in path.split("/")):
+            raise HTTPException(status_code=404)
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 206, 304):
+            area, _, relative = path.partition("/")
+            if area in storage.areas and relative:
+                storage.touch(area, storage.areas[area].directory / relative)
+        return response
+
 
 # Mount static files
-app.mount("/files", StaticFiles(directory="../datasets"), name="files")
+app.mount("/files", TrackedStaticFiles(directory="../datasets"), name="files")
 
 
 @app.get("/")
@@ -102,14 +337,76 @@ def health():
 
     return {
         "status": "healthy",
-        "services": services_status
+        "services": services_status,
+        "idm_vton_backends": get_idm_vton_service().stats(),
+        "admission": {
+            "idm_vton": get_idm_vton_service().admission.stats(),
+            "search": get_google_search_service().admission.stats(),
+            "openai": get_openai_service().admission.stats()
+        },
+        "single_flight": {
+            "idm_vton": get_idm_vton_service().flights.stats(),
+            "search": get_google_search_service().flights.stats(),
+            "openai": get_openai_service().flights.stats()
+        },
+        "tryon_queue": get_tryon_job_queue().stats(),
+        "tryon_cache": get_tryon_result_cache().stats(),
+        "search_cache": get_google_search_service().cache_stats(),
+        "product_catalog": get_google_search_service().catalog_stats(),
+        "hairstyle_index": get_hairstyle_index().stats(),
+        "image_variants": get_image_variant_store().stats(),
+        "openai_cache": get_openai_service().cache_stats(),
+        "chat_compaction": get_openai_service().compactor.stats(),
+        "storage": get_storage_manager().stats(),
+        "shared_state": shared_state.stats() if shared_state is not None else {"backend": "none"},
+        "warm_up": warmup_state
     }
 
 
-@app.post("/api/clothing/try-on")
+@app.get("/api/metrics")
+def get_metrics():
+    """
+    Metrics in the Prometheus text exposition format
+
+    Latency histograms per route, processing stage and upstream call, in-flight gauges,
+    upstream errors by type, try-on queue depth and cache hit ratios.
+    """
+    queue = get_tryon_job_queue().stats()
+    metrics.TRYON_QUEUE_DEPTH.set(queue["queue_depth"])
+    metrics.TRYON_JOBS_RUNNING.set(queue["jobs"][JOB_RUNNING])
+    search = get_google_search_service()
+    openai_service = get_openai_service()
+    metrics.record_cache("search", search.cache_stats())
+    metrics.record_cache("openai", openai_service.cache_stats())
+    metrics.record_cache("chat_summary", openai_service.compactor.stats()["summary_cache"])
+    metrics.record_cache("tryon_results", get_tryon_result_cache().stats())
+    variants = get_image_variant_store().stats()
+    metrics.record_cache("image_variants", {"hits": variants["hits"], "misses": variants["generated"]})
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post("/api/uploads")
+async def upload_image(image: UploadFile = File(..., description="Image to store")):
+    """
+    Store an image for later reference
+
+    Identical images are stored once. Pass the returned id as `person_image_id` or
+    `clothing_image_id` instead of re-uploading the file.
+
+    Returns:
+        JSON with the image id and its URL
+    """
+    image_id, _ = await store_upload(image)
+    return {"id": image_id, "url": get_upload_store().url_for(image_id)}
+
+
+@app.post("/api/clothing/try-on", status_code=202)
 async def clothing_tryon(
-    person_image: UploadFile = File(..., description="Image of the person"),
-    clothing_image: UploadFile = File(..., description="Image of the clothing item"),
+    response: Response,
+    person_image: Optional[UploadFile] = File(default=None, description="Image of the person"),
+    clothing_image: Optional[UploadFile] = File(default=None, description="Image of the clothing item"),
+    person_image_id: Optional[str] = Form(default=None, description="Id of a previously uploaded person image"),
+    clothing_image_id: Optional[str] = Form(default=None, description="Id of a previously uploaded clothing image"),
     garment_description: str = Form(default="A clothing item", description="Description of the garment"),
     auto_mask: bool = Form(default=True, description="Use automatic masking"),
     auto_crop: bool = Form(default=False, description="Automatically crop the image"),
@@ -119,65 +416,342 @@ async def clothing_tryon(
     """
     Virtual try-on for clothing using IDM-VTON
 
-    Upload a person image and a clothing image to see how the clothing looks on the person.
+    Upload a person image and a clothing image (or pass the ids returned by `POST /api/uploads`)
+    to queue a try-on job. The response contains a job id; poll `GET /api/clothing/try-on/{job_id}`
+    for the result. Requests identical to a previous one are answered immediately from the result
+    cache with status `done`.
     """
     try:
-        # Save and convert uploaded files to PNG
-        person_path = save_and_convert_to_png(person_image, UPLOADS)
-        clothing_path = save_and_convert_to_png(clothing_image, UPLOADS)
-
-        logger.info(f"Processing clothing try-on request")
-
-        # Call IDM-VTON service
-        service = get_idm_vton_service()
-        result_path = service.try_on(
-            person_image=person_path,
-            garment_image=clothing_path,
-            garment_description=garment_description,
-            is_checked=auto_mask,
-            is_checked_crop=auto_crop,
-            denoise_steps=denoise_steps,
-            seed=seed
+        # Store uploads (or look up previously stored images), normalizing both in parallel
+        (person_id, person_path), (clothing_id, clothing_path) = await asyncio.gather(
+            resolve_image(person_image, person_image_id, "person_image"),
+            resolve_image(clothing_image, clothing_image_id, "clothing_image")
         )
 
-        # Copy result to generated folder with a unique name
-        output_filename = f"{uuid.uuid4()}.png"
-        output_path = GENERATED / output_filename
-        shutil.copy(result_path, output_path)
-
-        logger.info(f"Clothing try-on completed: {output_path}")
+        cached_result, job = start_clothing_tryon(
+            person_id,
+            person_path,
+            clothing_id,
+            clothing_path,
+            garment_description,
+            auto_mask,
+            auto_crop,
+            denoise_steps,
+            seed
+        )
+        if cached_result:
+            response.status_code = 200
+            return {
+                "success": True,
+                "job_id": None,
+                "status": "done",
+                "result": cached_result,
+                "cached": True,
+                "person_image_id": person_id,
+                "clothing_image_id": clothing_id,
+                "message": "Virtual try-on completed successfully"
+            }
+
+        logger.info(f"Queued clothing try-on request as job {job.id}")
 
         return {
             "success": True,
-            "result": f"/files/generated/{output_filename}",
-            "message": "Virtual try-on completed successfully"
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/api/clothing/try-on/{job.id}",
+            "cached": False,
+            "person_image_id": person_id,
+            "clothing_image_id": clothing_id,
+            "message": "Virtual try-on queued"
         }
 
+    except UpstreamBusyError as e:
+        logger.warning(f"Rejecting clothing try-on: {e}")
+        raise too_busy(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in clothing try-on: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/clothing/try-on/batch")
+async def clothing_tryon_batch(
+    person_image: Optional[UploadFile] = File(default=None, description="Image of the person"),
+    person_image_id: Optional[str] = Form(default=None, description="Id of a previously uploaded person image"),
+    clothing_images: List[UploadFile] = File(default=[], description="Images of the clothing items"),
+    clothing_image_ids: List[str] = Form(default=[], description="Ids of previously uploaded clothing images"),
+    garment_descriptions: List[str] = Form(default=[], description="Descriptions, one per garment in order"),
+    auto_mask: bool = Form(default=True, description="Use automatic masking"),
+    auto_crop: bool = Form(default=False, description="Automatically crop the image"),
+    denoise_steps: int = Form(default=30, description="Number of denoising steps"),
+    seed: int = Form(default=42, description="Random seed for reproducibility")
+):
+    """
+    Try one person image against many garments
+
+    Garments are the uploaded `clothing_images` followed by `clothing_image_ids`;
+    `garment_descriptions` are matched to them by position. Try-ons run with at most
+    TRYON_BATCH_CONCURRENCY in flight and results are streamed as NDJSON in completion
+    order: one `batch` line, then one `result` line per garment with its `index`. A failing
+    garment is reported in its own line without aborting the rest of the batch.
+    """
+    try:
+        person_id, person_path = await resolve_image(person_image, person_image_id, "person_image")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in batch clothing try-on: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    garments: List[Tuple[Optional[UploadFile], Optional[str]]] = (
+        [(upload, None) for upload in clothing_images] + [(None, image_id) for image_id in clothing_image_ids]
+    )
+    if not garments:
+        raise HTTPException(status_code=400, detail="At least one clothing image or clothing_image_id is required")
+
+    # Store every garment before streaming starts: uploaded files are not readable afterwards
+    resolved = await asyncio.gather(
+        *(resolve_image(upload, image_id, "clothing_image") for upload, image_id in garments),
+        return_exceptions=True
+    )
+
+    concurrency = asyncio.Semaphore(int(os.getenv("TRYON_BATCH_CONCURRENCY", "2")))
+
+    async def run_garment(index: int) -> Dict[str, Any]:
+        entry = {"type": "result", "index": index}
+        outcome = resolved[index]
+        if isinstance(outcome, BaseException):
+            detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            return {**entry, "status": "failed", "error": detail}
+
+        clothing_id, clothing_path = outcome
+        entry["clothing_image_id"] = clothing_id
+        description = garment_descriptions[index] if index < len(garment_descriptions) else "A clothing item"
+        try:
+            async with concurrency:
+                cached_result, job = start_clothing_tryon(
+                    person_id,
+                    person_path,
+                    clothing_id,
+                    clothing_path,
+                    description,
+                    auto_mask,
+                    auto_crop,
+                    denoise_steps,
+                    seed,
+                    PRIORITY_BATCH
+                )
+                if cached_result:
+                    return {**entry, "status": "done", "result": cached_result, "cached": True}
+                await job.wait()
+        except Exception as e:
+            logger.warning(f"Batch try-on garment {index} failed: {e}")
+            return {**entry, "status": "failed", "error": str(e)}
+
+        if job.status != JOB_DONE:
+            return {**entry, "status": job.status, "error": job.error, "job_id": job.id}
+        return {**entry, "status": job.status, "result": job.result, "cached": False, "job_id": job.id}
+
+    async def stream_results():
+        yield json.dumps({"type": "batch", "person_image_id": person_id, "count": len(garments)}) + "\n"
+        tasks = [asyncio.create_task(run_garment(i)) for i in range(len(garments))]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # Client went away: stop waiting (queued jobs still finish and populate the cache)
+            for task in tasks:
+                task.cancel()
+
+    logger.info(f"Starting batch clothing try-on with {len(garments)} garments")
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.get("/api/clothing/try-on/{job_id}")
+def clothing_tryon_status(job_id: str):
+    """
+    Get the status of a queued try-on job
+
+    Returns:
+        JSON with status (queued, running, done or failed) and, when done, the result URL
+    """
+    status = get_tryon_job_queue().status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown try-on job: {job_id}")
+    return status
+
+
+@app.get("/api/images/{root}/{path:path}")
+async def image_variant(
+    root: str,
+    path: str,
+    request: Request,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    format: str = "auto",
+    q: Optional[int] = None
+):
+    """
+    Serve a resized, re-encoded variant of an uploaded or generated image
+
+    Variants are rendered once in the preprocessing process pool and cached on disk. Responses
+    carry a strong ETag and a long max-age; `If-None-Match` revalidation returns 304 without
+    touching the image.
+
+    Args:
+        root: "uploads" or "generated" (the same folders served under /files)
+        path: Image path within the root, e.g. the file name from a try-on result URL
+        w: Maximum width in pixels
+        h: Maximum height in pixels
+        format: "webp", "jpeg" or "auto" (WebP when the browser accepts it)
+        q: Encoder quality 1-100 (default: IMAGE_VARIANT_QUALITY)
+
+    Returns:
+        The variant image
+    """
+    fmt = format
+    if fmt == "auto":
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+
+    store = get_image_variant_store()
+    try:
+        key, source, variant, params = store.locate(root, path, w, h, fmt, q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={IMAGE_VARIANT_MAX_AGE}"}
+    if format == "auto":
+        headers["Vary"] = "Accept"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers=headers)
+
+    try:
+        variant = await store.ensure(source, variant, params)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    return FileResponse(variant, media_type=VARIANT_FORMATS[fmt][1], headers=headers)
+
+
+@app.post("/api/storage/pins")
+def pin_file(url: str = Body(..., embed=True, description="URL of an uploaded or generated file")):
+    """
+    Keep a file (e.g. a try-on result the user saved) out of storage eviction
+
+    Returns:
+        JSON with the pinned area and path
+    """
+    return _set_pinned(url, True)
+
+
+@app.delete("/api/storage/pins")
+def unpin_file(url: str = Body(..., embed=True, description="URL of a previously pinned file")):
+    """
+    Make a pinned file subject to the storage budgets again
+
+    Returns:
+        JSON with the unpinned area and path
+    """
+    return _set_pinned(url, False)
+
+
+def _set_pinned(url: str, pinned: bool) -> Dict[str, Any]:
+    storage = get_storage_manager()
+    try:
+        area, path = storage.resolve(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    changed = storage.pin(area, path) if pinned else storage.unpin(area, path)
+    if not changed:
+        raise HTTPException(status_code=404, detail=f"File not found: {url}")
+    return {"success": True, "area": area, "path": path.relative_to(storage.areas[area].root).as_posix(), "pinned": pinned}
+
+
+@app.post("/api/hairstyles/similar")
+async def similar_hairstyles(
+    image: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),
+    k: int = Form(5),
+    style: Optional[str] = Form(None)
+):
+    """
+    Find the reference hairstyles most similar to a photo
+
+    Args:
+        image: Photo to match (or pass `image_id` of a previous upload)
+        image_id: Id returned by /api/uploads or a previous request
+        k: Number of matches to return (max: 50)
+        style: Optional hairstyle folder to restrict matches to (Straight, Wavy, curly, dreadlocks, kinky)
+
+    Returns:
+        JSON with the image id and the matches ordered by distance
+    """
+    image_digest, image_path = await resolve_image(image, image_id, "image")
+    index = get_hairstyle_index()
+    if not await asyncio.to_thread(index.ensure_loaded):
+        raise HTTPException(
+            status_code=503,
+            detail="Hairstyle index not built. Run: python -m scripts.build_hairstyle_index"
+        )
+
+    try:
+        matches = await asyncio.to_thread(index.query, image_path, min(k, 50), style)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"image_id": image_digest, "matches": matches}
+
+
 @app.get("/api/search")
-async def search_products(query: str, num_results: int = 10):
+async def search_products(
+    query: str,
+    num_results: int = 10,
+    mode: str = "auto",
+    brand: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None
+):
     """
-    Search for clothing/products using Google Custom Search API
+    Search for clothing/products in the local catalog and via Google Custom Search API
 
     Args:
         query: Search query string
-        num_results: Number of results to return (default: 10)
+        num_results: Number of results to return (default: 10, max: 100)
+        mode: "auto" (local catalog first, Google when local recall is low), "local" or "google"
+        brand: Optional brand filter
+        min_price: Optional minimum price
+        max_price: Optional maximum price
 
     Returns:
         JSON with search results
     """
     try:
         service = get_google_search_service()
-        results = service.search_products(query, num_results=num_results)
+        results = await service.search_products(
+            query,
+            num_results=num_results,
+            mode=mode,
+            brand=brand,
+            min_price=min_price,
+            max_price=max_price
+        )
 
         logger.info(f"Search completed for query: '{query}' - Found {len(results)} results")
 
         return {"results": results}
 
+    except UpstreamBusyError as e:
+        raise too_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error in product search: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -196,14 +770,14 @@ async def ai_chat(
         context: Optional context with closet info and preferences
 
     Returns:
-        JSON with AI response
+        JSON with AI response and prompt token usage after compaction
     """
     try:
         service = get_openai_service()
-        response = await service.get_chat_response(messages, context)
-
-        return {"response": response}
+        return await service.get_chat_response(messages, context)
 
+    except UpstreamBusyError as e:
+        raise too_busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -211,10 +785,78 @@ async def ai_chat(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/ai/chat/stream")
+async def ai_chat_stream(
+    request: Request,
+    messages: List[Dict[str, str]] = Body(...),
+    context: Optional[Dict[str, Any]] = Body(default=None)
+):
+    """
+    Stream the AI stylist chat response token by token
+
+    The response is a server-sent event stream: one `data: {"delta": "..."}` event per
+    chunk, then `data: {"done": true, "usage": {...}}` with the prompt token counts after
+    compaction, as in /api/ai/chat. An upstream failure after streaming has started
+    is reported as an `event: error` with `{"detail": "..."}`. Generation stops as soon as
+    the client disconnects.
+
+    Args:
+        messages: List of chat messages with 'type' and 'text' fields
+        context: Optional context with closet info and preferences
+
+    Returns:
+        text/event-stream of response deltas
+    """
+    service = get_openai_service()
+    usage: Dict[str, Any] = {}
+    chunks = service.stream_chat_response(messages, context, usage=usage)
+
+    # Wait for the first chunk so configuration and upstream errors still map to status codes
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except UpstreamBusyError as e:
+        raise too_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in AI chat stream: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def event(payload: Dict[str, Any], name: Optional[str] = None) -> str:
+        prefix = f"event: {name}\n" if name else ""
+        return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+    async def stream_events():
+        try:
+            if first is not None:
+                yield event({"delta": first})
+                async for delta in chunks:
+                    if await request.is_disconnected():
+                        logger.info("Chat stream client disconnected; stopping generation")
+                        return
+                    yield event({"delta": delta})
+            yield event({"done": True, "usage": usage})
+        except Exception as e:
+            logger.error(f"Error in AI chat stream: {e}", exc_info=True)
+            yield event({"detail": str(e)}, name="error")
+        finally:
+            # Closes the upstream OpenAI response
+            await chunks.aclose()
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/api/ai/analyze-image")
 async def analyze_image(
     image_url: str = Body(...),
-    prompt: Optional[str] = Body(default=None)
+    prompt: Optional[str] = Body(default=None),
+    use_cache: bool = Body(default=True)
 ):
     """
     Analyze fashion image using AI
@@ -222,16 +864,19 @@ async def analyze_image(
     Args:
         image_url: URL of the image to analyze
         prompt: Optional custom analysis prompt
+        use_cache: Set to false to force a fresh analysis instead of a cached one
 
     Returns:
         JSON with AI analysis
     """
     try:
         service = get_openai_service()
-        analysis = await service.analyze_image(image_url, prompt)
+        analysis = await service.analyze_image(image_url, prompt, use_cache=use_cache)
 
         return {"analysis": analysis}
 
+    except UpstreamBusyError as e:
+        raise too_busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -240,12 +885,13 @@ async def analyze_image(
 
 
 @app.post("/api/ai/recommendations")
-async def generate_recommendations(preferences: Dict[str, Any] = Body(...)):
+async def generate_recommendations(preferences: Dict[str, Any] = Body(...), use_cache: bool = True):
     """
     Generate clothing recommendations based on preferences using real Google Shopping results
 
     Args:
         preferences: User preferences (purpose, brands, price, size, etc.)
+        use_cache: Query flag; set to false to generate fresh item types instead of cached ones
 
     Returns:
         JSON with recommended items from real stores
@@ -257,12 +903,15 @@ async def generate_recommendations(preferences: Dict[str, Any] = Body(...)):
         # Pass Google Search service to get real products
         recommendations = await openai_service.generate_clothing_recommendations(
             preferences,
-            google_search_service=google_service
+            google_search_service=google_service,
+            use_cache=use_cache
         )
 
         logger.info(f"Generated {len(recommendations)} real product recommendations")
         return {"recommendations": recommendations}
 
+    except UpstreamBusyError as e:
+        raise too_busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
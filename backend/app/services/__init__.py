@@ -5,15 +5,51 @@ This package contains all the backend services for the Wardrobe.AI application:
 - idm_vton_service: Virtual try-on using IDM-VTON via Hugging Face API
 - google_search_service: Product search using Google Custom Search API
 - openai_service: AI Stylist chat and recommendations using OpenAI API
+- tryon_job_service: Background job queue that runs try-ons off the event loop
+- tryon_cache_service: Content-addressed cache of generated try-on results
+- upload_store_service: Deduplicating, content-addressed store for uploaded images
+- image_preprocessing_service: Process pool that normalizes images to the try-on resolution
+- hairstyle_index_service: Memory-mapped descriptor index for similar-hairstyle search
+- image_variant_service: Disk cache of resized, re-encoded image variants
+- storage_service: Size and age budgets with LRU eviction for the file directories
+- admission: Per-upstream concurrency, rate limits and priority wait queues
+- shared_state: Caches, job status and rate-limit buckets shared by the worker processes
 """
 
 from .idm_vton_service import get_idm_vton_service, initialize_idm_vton_service
 from .google_search_service import get_google_search_service
 from .openai_service import get_openai_service
+from .tryon_job_service import get_tryon_job_queue, QueueFullError, WorkersStalledError
+from .tryon_cache_service import get_tryon_result_cache, initialize_tryon_result_cache
+from .upload_store_service import get_upload_store, initialize_upload_store, UploadTooLargeError
+from .image_preprocessing_service import get_image_preprocessor
+from .hairstyle_index_service import get_hairstyle_index, initialize_hairstyle_index
+from .image_variant_service import get_image_variant_store, initialize_image_variant_store
+from .storage_service import get_storage_manager, initialize_storage_manager
+from .admission import UpstreamBusyError
+from .shared_state import get_shared_state, initialize_shared_state
 
 __all__ = [
     "get_idm_vton_service",
     "initialize_idm_vton_service",
     "get_google_search_service",
     "get_openai_service",
+    "get_tryon_job_queue",
+    "QueueFullError",
+    "WorkersStalledError",
+    "get_tryon_result_cache",
+    "initialize_tryon_result_cache",
+    "get_upload_store",
+    "initialize_upload_store",
+    "UploadTooLargeError",
+    "get_image_preprocessor",
+    "get_hairstyle_index",
+    "initialize_hairstyle_index",
+    "get_image_variant_store",
+    "initialize_image_variant_store",
+    "get_storage_manager",
+    "initialize_storage_manager",
+    "UpstreamBusyError",
+    "get_shared_state",
+    "initialize_shared_state",
 ]
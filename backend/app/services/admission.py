@@ -0,0 +1,358 @@
+"""
+Admission control for calls to external APIs
+
+Each upstream gets an `AdmissionController`: at most `max_concurrency` calls in flight, an
+optional token bucket limiting the call rate, and a bounded wait queue ordered by priority
+(interactive requests before batch work). When the queue is full, or a caller has waited
+longer than `queue_timeout`, `UpstreamBusyError` is raised with an estimate of when capacity
+frees up, which the API returns as HTTP 429 with a Retry-After header.
+
+Given a shared-state backend, the token bucket is shared by every worker process, so the rate
+limit holds for the deployment. Concurrency limits and queues are per process. A caller then
+takes a slot first and a token from the shared bucket second, outside the controller's lock
+(and, for `slot`, off the event loop), so a busy database never blocks other callers.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTIONS
+from .shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Assumed duration of a call until one has been measured
+DEFAULT_HOLD_SECONDS = 1.0
+
+
+class UpstreamBusyError(Exception):
+    """Raised when a call is rejected because its upstream is at capacity"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A caller in the wait queue; woken whenever it may have become admissible"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future: Optional[asyncio.Future] = None
+
+    def arm(self):
+        """Prepare for the next wake-up; call before checking for admission"""
+        if self.loop is None:
+            self.event.clear()
+        else:
+            self.future = self.loop.create_future()
+
+    def wake(self):
+        """Safe to call from any thread"""
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve, self.future)
+
+    @staticmethod
+    def _resolve(future: Optional[asyncio.Future]):
+        if future is not None and not future.done():
+            future.set_result(None)
+
+
+class AdmissionController:
+    """Concurrency limit, token-bucket rate limit and bounded priority wait queue for one upstream"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        rate: float = 0.0,
+        burst: int = 0,
+        max_queue: int = 64,
+        queue_timeout: float = 30.0,
+        shared: Optional[SharedState] = None
+    ):
+        """
+        Initialize the controller
+
+        Args:
+            name: Upstream name used in logs, errors and metrics
+            max_concurrency: Calls allowed in flight at once
+            rate: Calls per second allowed on average (0 for no rate limit)
+            burst: Calls allowed back to back when the bucket is full (default: max(1, rate))
+            max_queue: Callers allowed to wait; further callers are rejected at once
+            queue_timeout: Seconds a caller waits for admission before being rejected
+            shared: Optional shared-state backend holding the token bucket for all worker processes
+        """
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.shared = shared if rate else None
+
+        self.active = 0
+        self.tokens = float(self.burst)
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_hold: Optional[float] = None
+
+        self._refilled_at = time.monotonic()
+        self._waiters: List[Tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        logger.info(
+            f"Admission control for {name}: {self.max_concurrency} concurrent, "
+            f"rate {rate:g}/s (burst {self.burst}{', shared' if self.shared else ''}), "
+            f"queue {max_queue}, wait timeout {queue_timeout:g}s"
+        )
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[None]:
+        """
+        Hold one call slot for the duration of the block
+
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+
+        Raises:
+            UpstreamBusyError: If the wait queue is full or admission takes longer than queue_timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.queue_timeout
+        waiter = self._admit_or_enqueue(priority, loop)
+        if waiter is not None:
+            try:
+                while True:
+                    waiter.arm()
+                    admitted, token_wait = self._poll(waiter)
+                    if admitted:
+                        break
+                    remaining = self._remaining(deadline)
+                    try:
+                        await asyncio.wait_for(waiter.future, min(remaining, token_wait or remaining))
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._abandon(waiter)
+                raise
+
+        if self.shared is not None:
+            try:
+                while True:
+                    token_wait = await asyncio.to_thread(self._take_shared_token)
+                    if not token_wait:
+                        break
+                    await asyncio.sleep(min(token_wait, self._remaining(deadline)))
+            except BaseException:
+                self._release(None)
+                raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    @contextmanager
+    def slot_sync(self, priority: int = PRIORITY_INTERACTIVE) -> Iterator[None]:
+        """Blocking equivalent of `slot` for worker threads"""
+        deadline = time.monotonic() + self.queue_timeout
+        waiter = self._admit_or_enqueue(priority, None)
+        if waiter is not None:
+            try:
+                while True:
+                    waiter.arm()
+                    admitted, token_wait = self._poll(waiter)
+                    if admitted:
+                        break
+                    remaining = self._remaining(deadline)
+                    waiter.event.wait(min(remaining, token_wait or remaining))
+            except BaseException:
+                self._abandon(waiter)
+                raise
+
+        if self.shared is not None:
+            try:
+                while True:
+                    token_wait = self._take_shared_token()
+                    if not token_wait:
+                        break
+                    time.sleep(min(token_wait, self._remaining(deadline)))
+            except BaseException:
+                self._release(None)
+                raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a newly queued call would be admitted"""
+        with self._lock:
+            return self._retry_after()
+
+    def stats(self) -> Dict[str, Any]:
+        """Limits, current load and admission counters"""
+        with self._lock:
+            tokens = self._tokens() if self.rate else None
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "queued_batch": sum(1 for priority, _, _ in self._waiters if priority >= PRIORITY_BATCH),
+                "max_queue": self.max_queue,
+                "rate": self.rate or None,
+                "tokens": round(tokens, 2) if tokens is not None else None,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_hold_s": round(self.avg_hold, 3) if self.avg_hold is not None else None,
+            }
+
+    def _admit_or_enqueue(self, priority: int, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Take a slot at once if nobody is waiting and one is free, otherwise join the queue"""
+        with self._lock:
+            if not self._waiters and self._try_take()[0]:
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                ADMISSION_REJECTIONS.inc(upstream=self.name, reason="queue_full")
+                retry_after = self._retry_after()
+                logger.warning(f"Rejecting {self.name} call: {len(self._waiters)} callers waiting")
+                raise UpstreamBusyError(
+                    f"{self.name} is at capacity ({len(self._waiters)} requests waiting); retry in {retry_after}s",
+                    retry_after
+                )
+            waiter = _Waiter(loop)
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+            self._publish()
+            return waiter
+
+    def _poll(self, waiter: _Waiter) -> Tuple[bool, Optional[float]]:
+        """
+        Admit a queued caller if it is first in line and a slot and token are free
+
+        Returns:
+            Tuple of (admitted, seconds until the next token if only the rate limit is holding it back)
+        """
+        with self._lock:
+            if self._waiters[0][2] is not waiter:
+                return False, None
+            admitted, token_wait = self._try_take()
+            if admitted:
+                heapq.heappop(self._waiters)
+                # The next caller may be admissible too, e.g. after a burst of releases
+                if self._waiters:
+                    self._waiters[0][2].wake()
+            return admitted, token_wait
+
+    def _remaining(self, deadline: float) -> float:
+        """Seconds left to wait, raising once the deadline has passed"""
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            return remaining
+        with self._lock:
+            self.timed_out += 1
+            retry_after = self._retry_after()
+        ADMISSION_REJECTIONS.inc(upstream=self.name, reason="timeout")
+        logger.warning(f"Rejecting {self.name} call after waiting {self.queue_timeout:g}s for admission")
+        raise UpstreamBusyError(
+            f"{self.name} is at capacity (waited {self.queue_timeout:g}s); retry in {retry_after}s",
+            retry_after
+        )
+
+    def _abandon(self, waiter: _Waiter):
+        """Remove a caller that gave up (timeout or cancellation) from the queue"""
+        with self._lock:
+            for i, (_, _, queued) in enumerate(self._waiters):
+                if queued is waiter:
+                    self._waiters.pop(i)
+                    heapq.heapify(self._waiters)
+                    break
+            if self._waiters:
+                self._waiters[0][2].wake()
+            self._publish()
+
+    def _release(self, held: Optional[float]):
+        """Free a slot; `held` is None if the call was never made"""
+        with self._lock:
+            self.active -= 1
+            if held is not None:
+                self.avg_hold = held if self.avg_hold is None else 0.8 * self.avg_hold + 0.2 * held
+            if self._waiters:
+                self._waiters[0][2].wake()
+            self._publish()
+
+    def _try_take(self) -> Tuple[bool, Optional[float]]:
+        """
+        Take a slot, and a token from a local bucket, if both are free (caller holds the lock)
+
+        Returns:
+            Tuple of (taken, seconds until the next token if only the rate limit is holding it back)
+        """
+        if self.active >= self.max_concurrency:
+            return False, None
+        if self.rate and self.shared is None:
+            token_wait = self._take_token()
+            if token_wait:
+                return False, token_wait
+        self.active += 1
+        self.admitted += 1
+        self._publish()
+        return True, None
+
+    def _take_token(self) -> float:
+        """Take a token from the local bucket; 0 on success, otherwise seconds until one is available"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def _take_shared_token(self) -> float:
+        """Take a token from the shared bucket; blocks on the database, so never called with the lock held"""
+        token_wait = self.shared.take_token(f"admission:{self.name}", self.rate, self.burst)
+        # Remember the level for stats and Retry-After; after a successful take it is at least 0
+        self.tokens = 1 - token_wait * self.rate if token_wait else 0.0
+        return token_wait
+
+    def _tokens(self) -> float:
+        """Tokens in the bucket (for a shared bucket, the level last seen)"""
+        if self.shared is not None:
+            return self.tokens
+        self._refill(time.monotonic())
+        return self.tokens
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _retry_after(self) -> int:
+        """Time for the queue ahead to drain through the slots (and the token bucket), rounded up"""
+        ahead = len(self._waiters) + 1
+        hold = self.avg_hold if self.avg_hold is not None else DEFAULT_HOLD_SECONDS
+        seconds = ahead * hold / self.max_concurrency
+        if self.rate:
+            seconds = max(seconds, (ahead - self._tokens()) / self.rate)
+        return max(1, math.ceil(seconds))
+
+    def _publish(self):
+        ADMISSION_ACTIVE.set(self.active, upstream=self.name)
+        ADMISSION_QUEUED.set(len(self._waiters), upstream=self.name)
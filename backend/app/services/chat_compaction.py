@@ -0,0 +1,210 @@
+"""Token counting and rolling-summary compaction for stylist chat history"""
+import hashlib
+import json
+import logging
+import math
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .shared_state import get_shared_state
+from .ttl_cache import TTLCache, FRESH
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tokens that prime the assistant reply
+REPLY_PRIMING_TOKENS = 2
+# Fallback when tiktoken is not installed: roughly four characters per token for English text
+CHARS_PER_TOKEN = 4
+# Recent prefixes probed for a summary when the conversation's latest-summary pointer does not match
+SUMMARY_LOOKBACK = 8
+
+_encodings: Dict[str, Any] = {}
+
+
+def _get_encoding(model: str):
+    """Load the tiktoken encoding for a model once; None when tiktoken (or its data) is unavailable"""
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.info(f"tiktoken unavailable ({e}); estimating chat tokens from text length")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Count the tokens in a piece of text, exactly with tiktoken or approximately without it"""
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], model: str = "gpt-4o-mini") -> int:
+    """Count the prompt tokens of a list of chat messages"""
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        content = message.get("content") or ""
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        total += MESSAGE_OVERHEAD_TOKENS + count_tokens(content, model)
+    return total
+
+
+def _prefix_digests(messages: List[Dict[str, Any]]) -> List[str]:
+    """Chained digests of every prefix: element k identifies messages[:k]"""
+    digests = [hashlib.sha256(b"").hexdigest()]
+    for message in messages:
+        chained = hashlib.sha256(digests[-1].encode("ascii"))
+        chained.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+        digests.append(chained.hexdigest())
+    return digests
+
+
+def _pointer_key(digests: List[str]) -> str:
+    """Cache key of the latest summary of a conversation, identified by its first message"""
+    return f"latest:{digests[1]}"
+
+
+class ChatCompactor:
+    """
+    Keeps a chat prompt within a token budget
+
+    The system prompt and the most recent messages are sent verbatim; older messages are
+    replaced by a rolling summary. Summaries are cached under the digest of the exact messages
+    they cover, so conversations that share an opening never share or invalidate a summary, and
+    are only extended when the verbatim tail no longer fits the budget. Each extension leaves
+    headroom so the next several turns reuse the summary.
+
+    The latest summary of a conversation is also stored under the digest of its first message,
+    so the next turn finds it with a single lookup. When that pointer belongs to another
+    conversation with the same opening, only the last SUMMARY_LOOKBACK prefixes are probed.
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        budget: Optional[int] = None,
+        keep_messages: Optional[int] = None,
+        summary_max_tokens: Optional[int] = None
+    ):
+        """
+        Initialize the compactor
+
+        Args:
+            model: Model whose tokenizer is used for counting
+            budget: Maximum prompt tokens per request (reads CHAT_TOKEN_BUDGET, default: 3000)
+            keep_messages: Recent messages always sent verbatim (reads CHAT_KEEP_MESSAGES, default: 4)
+            summary_max_tokens: Length limit of the rolling summary (reads CHAT_SUMMARY_MAX_TOKENS, default: 300)
+        """
+        self.model = model
+        self.budget = budget or int(os.getenv("CHAT_TOKEN_BUDGET", "3000"))
+        self.keep_messages = keep_messages or int(os.getenv("CHAT_KEEP_MESSAGES", "4"))
+        self.summary_max_tokens = summary_max_tokens or int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+        self.summaries = TTLCache(
+            maxsize=int(os.getenv("CHAT_SUMMARY_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("CHAT_SUMMARY_TTL", "86400")),
+            name="chat summary cache",
+            shared=get_shared_state(),
+            namespace="chat_summaries"
+        )
+        self.summaries_computed = 0
+
+    async def compact(
+        self,
+        messages: List[Dict[str, Any]],
+        summarize: Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[str]]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Fit a formatted chat prompt into the token budget
+
+        Args:
+            messages: System message followed by the conversation, in OpenAI format
+            summarize: Coroutine taking (previous summary or None, messages to fold in) and returning the new summary
+
+        Returns:
+            Tuple of (messages to send, usage dict with prompt_tokens, original_prompt_tokens
+            and summarized_messages)
+        """
+        original_tokens = count_message_tokens(messages, self.model)
+        usage = {
+            "prompt_tokens": original_tokens,
+            "original_prompt_tokens": original_tokens,
+            "summarized_messages": 0,
+        }
+        if original_tokens <= self.budget:
+            return messages, usage
+
+        system, history = messages[0], messages[1:]
+        system_tokens = count_message_tokens([system], self.model)
+        available = self.budget - system_tokens - self.summary_max_tokens - MESSAGE_OVERHEAD_TOKENS
+
+        digests = _prefix_digests(history)
+        covered, summary = await self._latest_summary(history, digests)
+
+        if summary is None or count_message_tokens(history[covered:], self.model) > available:
+            split = self._split_point(history, available)
+            if split > covered:
+                try:
+                    summary = await summarize(summary, history[covered:split])
+                    covered = split
+                    self.summaries_computed += 1
+                    entry = {"covered": covered, "digest": digests[covered], "summary": summary}
+                    await self.summaries.set(digests[covered], entry)
+                    await self.summaries.set(_pointer_key(digests), entry)
+                    logger.info(f"Chat history summarized: {covered} messages folded into the rolling summary")
+                except Exception as e:
+                    # Without a summary, fall back to sending only what fits
+                    logger.warning(f"Chat summarization failed, truncating history instead: {e}")
+                    summary, covered = None, split
+
+        compacted = [system]
+        if summary:
+            compacted.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        compacted.extend(history[covered:])
+
+        usage["prompt_tokens"] = count_message_tokens(compacted, self.model)
+        usage["summarized_messages"] = covered
+        return compacted, usage
+
+    async def _latest_summary(self, history: List[Dict[str, Any]], digests: List[str]) -> Tuple[int, Optional[str]]:
+        """Number of messages covered by the longest cached summary of a prefix of the history, and that summary"""
+        if not history:
+            return 0, None
+        cached, state = await self.summaries.get(_pointer_key(digests))
+        if state == FRESH and cached["covered"] < len(history) and cached["digest"] == digests[cached["covered"]]:
+            return cached["covered"], cached["summary"]
+
+        # The pointer is missing or was moved by another conversation with the same opening
+        for end in range(len(history) - 1, max(len(history) - 1 - SUMMARY_LOOKBACK, 0), -1):
+            cached, state = await self.summaries.get(digests[end])
+            if state == FRESH:
+                return end, cached["summary"]
+        return 0, None
+
+    def stats(self) -> Dict[str, Any]:
+        """Budget settings and summary cache counters"""
+        return {
+            "token_budget": self.budget,
+            "summaries_computed": self.summaries_computed,
+            "summary_cache": self.summaries.stats(),
+        }
+
+    def _split_point(self, history: List[Dict[str, Any]], available: int) -> int:
+        """Index of the first message kept verbatim: the tail fills at most half the room, leaving headroom for later turns"""
+        split = len(history)
+        tail_tokens = 0
+        minimum = max(len(history) - self.keep_messages, 0)
+        while split > 0:
+            message_tokens = count_message_tokens([history[split - 1]], self.model) - REPLY_PRIMING_TOKENS
+            if split <= minimum and tail_tokens + message_tokens > available // 2:
+                break
+            tail_tokens += message_tokens
+            split -= 1
+        return split
@@ -0,0 +1,295 @@
+"""
+Packed, pre-normalized image dataset format
+
+An image folder dataset (one folder per class) is validated, deduplicated by content hash and
+perceptual hash, resized to a fixed resolution and written as raw uint8 RGB shards:
+
+    <output>/index.json               classes, image shape, shard files and one entry per image
+    <output>/shard_<run>_00000.bin    `shard_size` images of height x width x 3 bytes, back to back
+
+Readers memory-map the shards, so loading the dataset is near-instant and batches within a
+shard are zero-copy NumPy views. Each pack writes its shards under new names and replaces the
+index atomically before removing the previous shards, so an interrupted repack leaves the
+previous dataset readable.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    # cv2 and NumPy are loaded by the functions that use them, like in image_features
+    import numpy as np
+
+from .image_features import HASH_SIZE, dhash
+
+logger = logging.getLogger(__name__)
+
+PACK_VERSION = 1
+INDEX_FILE = "index.json"
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif"}
+
+# Images smaller than this on either side are rejected as thumbnails or icons
+MIN_SIDE = 64
+
+
+def _shard_name(run: str, shard: int) -> str:
+    return f"shard_{run}_{shard:05d}.bin"
+
+
+def normalize_file(path: str, width: int, height: int) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Validate and normalize one image; runs in a worker process
+
+    Args:
+        path: Source image
+        width: Output width
+        height: Output height
+
+    Returns:
+        Tuple of (status, result): status is "ok", "invalid" or "too_small"; result holds the
+        sha256 of the file, the packed dHash bits and the RGB pixels letterboxed to width x height
+    """
+    import cv2
+    import numpy as np
+
+    data = np.fromfile(path, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    if image is None:
+        return "invalid", None
+    h, w = image.shape[:2]
+    if min(h, w) < MIN_SIDE:
+        return "too_small", None
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # Fit inside the target and pad with white to keep the aspect ratio
+    scale = min(width / w, height / h)
+    resized = cv2.resize(
+        image,
+        (max(1, round(w * scale)), max(1, round(h * scale))),
+        interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    )
+    canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+    top = (height - resized.shape[0]) // 2
+    left = (width - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+
+    return "ok", {
+        "sha256": hashlib.sha256(data.tobytes()).hexdigest(),
+        "dhash": np.packbits(dhash(gray)),
+        "pixels": cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB),
+        "source_size": [w, h],
+    }
+
+
+def pack_dataset(
+    dataset_dir: Union[str, Path],
+    output_dir: Union[str, Path],
+    classes: Sequence[str],
+    size: Tuple[int, int] = (256, 256),
+    shard_size: int = 1024,
+    max_hash_distance: int = 4,
+    workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Build a packed dataset from class folders
+
+    Args:
+        dataset_dir: Directory containing one folder per class
+        output_dir: Directory the shards and index are written to (replaced if it exists)
+        classes: Class folder names; their order defines the integer labels
+        size: Output (width, height)
+        shard_size: Images per shard file
+        max_hash_distance: dHash Hamming distance at or below which images count as near-duplicates
+        workers: Decode worker processes (default: CPU count)
+
+    Returns:
+        Counts of packed, duplicate, near-duplicate, invalid and too-small images
+    """
+    import numpy as np
+
+    started = time.perf_counter()
+    dataset_dir, output_dir = Path(dataset_dir), Path(output_dir)
+    width, height = size
+
+    sources: List[Tuple[int, Path]] = []
+    for label, name in enumerate(classes):
+        class_dir = dataset_dir / name
+        if not class_dir.is_dir():
+            logger.warning(f"Class folder not found: {class_dir}")
+            continue
+        sources.extend(
+            (label, path) for path in sorted(class_dir.iterdir())
+            if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES
+        )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    run = uuid.uuid4().hex[:8]
+
+    counts = {"packed": 0, "duplicate": 0, "near_duplicate": 0, "invalid": 0, "too_small": 0}
+    entries: List[Dict[str, Any]] = []
+    shards: List[Dict[str, Any]] = []
+    seen_sha: Dict[str, str] = {}
+    # One row per kept image; sized for the worst case so keeping an image never copies the rest
+    kept_hashes = np.empty((len(sources), HASH_SIZE * HASH_SIZE // 8), dtype=np.uint8)
+    shard_file = None
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = executor.map(
+            normalize_file,
+            [str(path) for _, path in sources],
+            [width] * len(sources),
+            [height] * len(sources),
+            chunksize=8
+        )
+        for (label, path), (status, result) in zip(sources, results):
+            source = path.relative_to(dataset_dir).as_posix()
+            if status != "ok":
+                counts[status] += 1
+                logger.info(f"Skipping {source}: {status}")
+                continue
+
+            if result["sha256"] in seen_sha:
+                counts["duplicate"] += 1
+                logger.info(f"Skipping {source}: duplicate of {seen_sha[result['sha256']]}")
+                continue
+            if counts["packed"]:
+                distances = np.unpackbits(kept_hashes[:counts["packed"]] ^ result["dhash"], axis=1).sum(axis=1)
+                nearest = int(distances.argmin())
+                if distances[nearest] <= max_hash_distance:
+                    counts["near_duplicate"] += 1
+                    logger.info(f"Skipping {source}: near-duplicate of {entries[nearest]['source']}")
+                    continue
+
+            if shard_file is None or shards[-1]["count"] == shard_size:
+                if shard_file is not None:
+                    shard_file.close()
+                shards.append({"file": _shard_name(run, len(shards)), "count": 0})
+                shard_file = open(output_dir / shards[-1]["file"], "wb")
+            shard_file.write(result["pixels"].tobytes())
+
+            entries.append({
+                "label": label,
+                "class": classes[label],
+                "source": source,
+                "source_size": result["source_size"],
+                "sha256": result["sha256"],
+                "dhash": result["dhash"].tobytes().hex(),
+                "shard": len(shards) - 1,
+                "offset": shards[-1]["count"] * width * height * 3,
+            })
+            shards[-1]["count"] += 1
+            seen_sha[result["sha256"]] = source
+            kept_hashes[counts["packed"]] = result["dhash"]
+            counts["packed"] += 1
+
+    if shard_file is not None:
+        shard_file.close()
+
+    index = {
+        "version": PACK_VERSION,
+        "width": width,
+        "height": height,
+        "channels": 3,
+        "dtype": "uint8",
+        "shard_size": shard_size,
+        "classes": list(classes),
+        "shards": shards,
+        "entries": entries,
+    }
+    tmp = output_dir / f".{INDEX_FILE}.tmp"
+    tmp.write_text(json.dumps(index))
+    os.replace(tmp, output_dir / INDEX_FILE)
+
+    # Only now is the previous pack unreferenced; readers that still map its shards keep working
+    current = {shard["file"] for shard in shards}
+    for stale in output_dir.glob("shard_*.bin"):
+        if stale.name not in current:
+            stale.unlink()
+
+    counts["shards"] = len(shards)
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"Packed {counts['packed']} images into {output_dir}: {counts}")
+    return counts
+
+
+class PackedDataset:
+    """Read-only view of a packed dataset backed by memory-mapped shards"""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open a packed dataset
+
+        Args:
+            path: Directory written by `pack_dataset`
+        """
+        self.path = Path(path)
+        index = json.loads((self.path / INDEX_FILE).read_text())
+        if index.get("version") != PACK_VERSION:
+            raise ValueError(f"Unsupported packed dataset version: {index.get('version')}")
+
+        self.width = index["width"]
+        self.height = index["height"]
+        self.shard_size = index["shard_size"]
+        self.classes: List[str] = index["classes"]
+        self.entries: List[Dict[str, Any]] = index["entries"]
+        import numpy as np
+
+        self.labels = np.array([e["label"] for e in self.entries], dtype=np.int16)
+
+        self.shards: List["np.ndarray"] = [
+            np.memmap(
+                self.path / shard["file"],
+                dtype=np.uint8,
+                mode="r",
+                shape=(shard["count"], self.height, self.width, 3)
+            )
+            for shard in index["shards"]
+        ]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, i: int) -> "np.ndarray":
+        """One image as a (height, width, 3) view"""
+        shard, row = divmod(i, self.shard_size)
+        return self.shards[shard][row]
+
+    def batch(self, start: int, stop: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Images [start, stop) and their labels
+
+        Zero-copy when the range lies within one shard (see `iter_batches`); ranges that span
+        shards are concatenated into a new array.
+
+        Returns:
+            Tuple of (images as (n, height, width, 3) uint8, labels as (n,) int16)
+        """
+        import numpy as np
+
+        stop = min(stop, len(self))
+        first, last = start // self.shard_size, (stop - 1) // self.shard_size
+        if first == last:
+            offset = first * self.shard_size
+            images = self.shards[first][start - offset:stop - offset]
+        else:
+            images = np.concatenate([
+                self.shards[s][max(start - s * self.shard_size, 0):min(stop - s * self.shard_size, self.shard_size)]
+                for s in range(first, last + 1)
+            ])
+        return images, self.labels[start:stop]
+
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple["np.ndarray", "np.ndarray"]]:
+        """Yield zero-copy (images, labels) batches; batches never span shards, so the last one per shard may be short"""
+        for s, shard in enumerate(self.shards):
+            base = s * self.shard_size
+            for start in range(0, len(shard), batch_size):
+                stop = min(start + batch_size, len(shard))
+                yield shard[start:stop], self.labels[base + start:base + stop]
@@ -1,18 +1,33 @@
 """Google Custom Search service for product search"""
+import asyncio
 import logging
+import math
 import os
+import re
+from functools import partial
 from typing import List, Dict, Any, Optional
-from pathlib import Path
-from googleapiclient.discovery import build
-from dotenv import load_dotenv
+import httpx
 
-# Load .env file from project root directory
-project_root = Path(__file__).resolve().parent.parent.parent.parent
-env_path = project_root / '.env'
-load_dotenv(dotenv_path=env_path, override=True)
+from ..config import CACHE_DIR
+from .admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController, UpstreamBusyError
+from .metrics import upstream_call
+from .product_catalog import ProductCatalog, parse_price
+from .shared_state import get_shared_state
+from .single_flight import SingleFlight
+from .ttl_cache import TTLCache, FRESH, STALE
 
 logger = logging.getLogger(__name__)
 
+# The Custom Search API returns at most 10 results per request and 100 per query
+PAGE_SIZE = 10
+MAX_RESULTS = 100
+
+# Search modes: local catalog first with Google fallthrough, local only, or Google only
+SEARCH_AUTO = "auto"
+SEARCH_LOCAL = "local"
+SEARCH_GOOGLE = "google"
+SEARCH_MODES = (SEARCH_AUTO, SEARCH_LOCAL, SEARCH_GOOGLE)
+
 
 class GoogleSearchService:
     """Google Custom Search API service for finding clothing/products"""
@@ -37,96 +52,356 @@ class GoogleSearchService:
         if not self.search_engine_id:
             logger.warning("Custom Search Engine ID not found. Search functionality will be limited.")
 
-        self.service = None
-        if self.api_key:
-            try:
-                self.service = build("customsearch", "v1", developerKey=self.api_key)
-                logger.info("Google Custom Search service initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize Google Custom Search service: {e}")
-
-    def search_products(
+        # Results for popular queries barely change, so serve them from cache and refresh in the background
+        self.cache = TTLCache(
+            maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+            stale_ttl=float(os.getenv("SEARCH_CACHE_STALE_TTL", "86400")),
+            path=os.getenv("SEARCH_CACHE_PATH") or None,
+            name="search cache",
+            shared=get_shared_state(),
+            namespace="search"
+        )
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        self.flights = SingleFlight("search")
+
+        # Every product fetched from Google is kept in a local full-text catalog that can answer searches first
+        catalog_path = os.getenv("PRODUCT_CATALOG_PATH", str(CACHE_DIR / "product_catalog.sqlite3"))
+        self.catalog = ProductCatalog(catalog_path) if catalog_path else None
+        self.catalog_min_recall = float(os.getenv("PRODUCT_CATALOG_MIN_RECALL", "0.8"))
+        self.local_served = 0
+        self.google_fallthroughs = 0
+        self.local_fallbacks = 0
+
+        self.base_url = os.getenv("GOOGLE_SEARCH_BASE_URL", "https://customsearch.googleapis.com/customsearch/v1")
+        self.timeout = float(os.getenv("SEARCH_TIMEOUT", "10"))
+        self.max_connections = int(os.getenv("SEARCH_MAX_CONNECTIONS", "20"))
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Every result page is one API call; recommendation searches and refreshes wait behind user searches
+        self.admission = AdmissionController(
+            "google_cse",
+            max_concurrency=int(os.getenv("SEARCH_MAX_CONCURRENCY", str(self.max_connections))),
+            rate=float(os.getenv("SEARCH_RATE_LIMIT", "0")),
+            burst=int(os.getenv("SEARCH_RATE_BURST", "0")),
+            max_queue=int(os.getenv("SEARCH_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv("SEARCH_QUEUE_TIMEOUT", "5")),
+            shared=get_shared_state()
+        )
+
+        if self.api_key and self.search_engine_id:
+            logger.info("Google Custom Search service initialized successfully")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get or create the shared, connection-pooled HTTP client"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        """Cancel background refreshes and close the HTTP client and the product catalog"""
+        for task in list(self._refresh_tasks.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.catalog is not None:
+            self.catalog.close()
+            self.catalog = None
+
+    async def search_products(
         self,
         query: str,
         num_results: int = 10,
-        search_type: str = "shopping"
+        search_type: str = "shopping",
+        mode: str = SEARCH_GOOGLE,
+        brand: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        priority: int = PRIORITY_INTERACTIVE
     ) -> List[Dict[str, Any]]:
         """
-        Search for products using Google Custom Search
+        Search for products using the local catalog and/or Google Custom Search
+
+        In "auto" mode the local catalog answers when it has enough matches (at least
+        PRODUCT_CATALOG_MIN_RECALL of num_results) and Google is only queried otherwise; if
+        Google then fails (e.g. the daily quota is exhausted) the local matches are returned.
+        "local" never calls Google and "google" skips the catalog.
 
         Args:
             query: Search query string
-            num_results: Number of results to return (max 10 per request)
+            num_results: Number of results to return (max 100)
             search_type: Type of search (shopping, image, etc.)
+            mode: "auto", "local" or "google" (default: google)
+            brand: Optional brand filter (case-insensitive substring)
+            min_price: Optional minimum price
+            max_price: Optional maximum price
+            priority: Admission priority of the Custom Search calls (PRIORITY_BATCH for background work)
 
         Returns:
             List of search results with product information
+
+        Raises:
+            UpstreamBusyError: If Custom Search is at capacity and there are no local results to fall back to
         """
-        if not self.service or not self.search_engine_id:
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}'; expected one of {', '.join(SEARCH_MODES)}")
+
+        num = max(1, min(num_results, MAX_RESULTS))
+        filters = {"brand": brand, "min_price": min_price, "max_price": max_price}
+        local_results: List[Dict[str, Any]] = []
+        if mode != SEARCH_GOOGLE and self.catalog is not None and search_type != "image":
+            # SQLite FTS5 query; blocking, so it runs off the event loop
+            local_results = await asyncio.to_thread(partial(self.catalog.search, query, limit=num, **filters))
+            if mode == SEARCH_LOCAL or len(local_results) >= math.ceil(num * self.catalog_min_recall):
+                self.local_served += 1
+                logger.info(f"Search served from local catalog for query: {query} ({len(local_results)} results)")
+                return local_results
+            self.google_fallthroughs += 1
+            logger.info(f"Local catalog had {len(local_results)} results for query: {query}; querying Google")
+
+        if not self.api_key or not self.search_engine_id:
+            if local_results:
+                return local_results
             logger.warning("Google Search not properly configured. Returning fallback results.")
             return self._get_fallback_results(query)
 
         try:
-            # Add keywords to find specific product pages (not category pages)
-            # Using site-specific patterns to target individual product pages
-            enhanced_query = f"{query} site:amazon.com OR site:nike.com/t OR site:dickssportinggoods.com/p OR site:footlocker.com/product"
-
-            logger.info(f"Searching Google Custom Search for: {enhanced_query}")
-
-            # Build search parameters with USA location
-            search_params = {
-                "q": enhanced_query,
-                "cx": self.search_engine_id,
-                "num": min(num_results, 10),  # Google API max is 10 per request
-                "gl": "us",  # Geolocation: United States
-                "cr": "countryUS",  # Country restrict: USA
-                "lr": "lang_en"  # Language: English
-            }
-
-            # Add searchType if specified
-            if search_type == "image":
-                search_params["searchType"] = "image"
-
-            # Execute the search
-            result = self.service.cse().list(**search_params).execute()
-
-            # Process and format results
-            items = result.get("items", [])
-            formatted_results = []
-
-            for item in items:
-                image_url = self._extract_image(item)
-
-                # If we got a Google thumbnail, try to get the original image from metatags
-                if 'gstatic.com' in image_url or 'placeholder' in image_url:
-                    # Try harder to find a real product image
-                    if "pagemap" in item and "metatags" in item["pagemap"]:
-                        metatags = item["pagemap"]["metatags"][0] if item["pagemap"]["metatags"] else {}
-                        # Try all possible image fields
-                        for field in ["og:image:secure_url", "og:image", "twitter:image:src", "twitter:image"]:
-                            alt_img = metatags.get(field, "")
-                            if alt_img and 'gstatic' not in alt_img and len(alt_img) > 30:
-                                image_url = alt_img
-                                break
-
-                formatted_item = {
-                    "id": item.get("link", ""),
-                    "name": item.get("title", ""),
-                    "description": item.get("snippet", ""),
-                    "link": item.get("link", ""),
-                    "image": image_url,
-                    "price": self._extract_price(item),
-                    "brand": self._extract_brand(item)
-                }
-                formatted_results.append(formatted_item)
-
-            logger.info(f"Found {len(formatted_results)} results for query: {query}")
-            return formatted_results
-
+            results = await self._search_google(query, num, search_type, priority)
+        except UpstreamBusyError:
+            if local_results:
+                self.local_fallbacks += 1
+                logger.info(f"Custom Search is at capacity; returning {len(local_results)} local catalog results")
+                return local_results
+            raise
         except Exception as e:
             logger.error(f"Error during Google search: {e}", exc_info=True)
+            if local_results:
+                self.local_fallbacks += 1
+                logger.info(f"Returning {len(local_results)} local catalog results instead")
+                return local_results
             return self._get_fallback_results(query)
 
+        if any(value is not None for value in filters.values()):
+            results = self._apply_filters(results, **filters)
+        return results
+
+    async def _search_google(self, query: str, num: int, search_type: str, priority: int) -> List[Dict[str, Any]]:
+        """
+        Search Google Custom Search through the result cache
+
+        Result pages of 10 are fetched concurrently and merged. Results are cached by
+        normalized query, result count and search type. Fresh entries are returned directly;
+        stale entries are returned immediately and refreshed in the background. Identical
+        fetches in flight at the same time are made once.
+        """
+        enhanced_query = self._enhance_query(query)
+        cache_key = self._cache_key(enhanced_query, num, search_type)
+
+        cached, state = await self.cache.get(cache_key)
+        if state == FRESH:
+            logger.info(f"Search cache hit for query: {query}")
+            return [dict(item) for item in cached]
+        if state == STALE:
+            logger.info(f"Serving stale search results for query: {query}; refreshing in background")
+            self._schedule_refresh(cache_key, enhanced_query, num, search_type)
+            return [dict(item) for item in cached]
+
+        # Concurrent misses for the same query (e.g. a trending product) share one API call
+        formatted_results = await self.flights.run(
+            cache_key,
+            partial(self._fetch_and_cache, cache_key, enhanced_query, num, search_type, priority)
+        )
+        logger.info(f"Found {len(formatted_results)} results for query: {query}")
+        return [dict(item) for item in formatted_results]
+
+    @staticmethod
+    def _apply_filters(
+        results: List[Dict[str, Any]],
+        brand: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float]
+    ) -> List[Dict[str, Any]]:
+        """Apply the catalog's brand and price filters to Google results"""
+        filtered = []
+        for item in results:
+            if brand and brand.lower() not in (item.get("brand") or "").lower():
+                continue
+            amount = parse_price(item.get("price"))
+            if (min_price is not None or max_price is not None) and amount is None:
+                continue
+            if min_price is not None and amount < min_price:
+                continue
+            if max_price is not None and amount > max_price:
+                continue
+            filtered.append(item)
+        return filtered
+
+    def catalog_stats(self) -> Dict[str, Any]:
+        """Local catalog size and how often it answered searches"""
+        if self.catalog is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            **self.catalog.stats(),
+            "local_served": self.local_served,
+            "google_fallthroughs": self.google_fallthroughs,
+            "local_fallbacks": self.local_fallbacks,
+        }
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Search cache hit/miss counters"""
+        return self.cache.stats()
+
+    def _enhance_query(self, query: str) -> str:
+        """Normalize the user query and add site filters that target individual product pages"""
+        normalized = re.sub(r"\s+", " ", query).strip().lower()
+        # Add keywords to find specific product pages (not category pages)
+        # Using site-specific patterns to target individual product pages
+        return f"{normalized} site:amazon.com OR site:nike.com/t OR site:dickssportinggoods.com/p OR site:footlocker.com/product"
+
+    @staticmethod
+    def _cache_key(enhanced_query: str, num: int, search_type: str) -> str:
+        search_type = "image" if search_type == "image" else "web"
+        return f"{enhanced_query}|num={num}|searchType={search_type}"
+
+    def _schedule_refresh(self, cache_key: str, enhanced_query: str, num: int, search_type: str):
+        """Refresh a stale entry in the background, at most once at a time per key"""
+        if cache_key in self._refresh_tasks:
+            return
+
+        async def refresh():
+            try:
+                await self.flights.run(
+                    cache_key,
+                    partial(self._fetch_and_cache, cache_key, enhanced_query, num, search_type, PRIORITY_BATCH)
+                )
+            except Exception as e:
+                logger.warning(f"Background search refresh failed: {e}")
+            finally:
+                self._refresh_tasks.pop(cache_key, None)
+
+        self._refresh_tasks[cache_key] = asyncio.create_task(refresh())
+
+    async def _fetch_and_cache(
+        self,
+        cache_key: str,
+        enhanced_query: str,
+        num: int,
+        search_type: str,
+        priority: int
+    ) -> List[Dict[str, Any]]:
+        """Fetch results and store them in the cache"""
+        formatted_results = await self._fetch(enhanced_query, num, search_type, priority)
+        await self.cache.set(cache_key, [dict(item) for item in formatted_results])
+        return formatted_results
+
+    async def _fetch(self, enhanced_query: str, num: int, search_type: str, priority: int) -> List[Dict[str, Any]]:
+        """Fetch all result pages concurrently and merge them; raises if the first page fails"""
+        starts = range(1, num + 1, PAGE_SIZE)
+        pages = await asyncio.gather(
+            *(
+                self._fetch_page(enhanced_query, start, min(PAGE_SIZE, num - start + 1), search_type, priority)
+                for start in starts
+            ),
+            return_exceptions=True
+        )
+        if isinstance(pages[0], BaseException):
+            raise pages[0]
+
+        # Later pages are best effort; drop duplicates that appear on more than one page
+        formatted_results = []
+        seen_links = set()
+        for start, page in zip(starts, pages):
+            if isinstance(page, BaseException):
+                logger.warning(f"Search page starting at {start} failed: {page}")
+                continue
+            for item in page:
+                if item["link"] in seen_links:
+                    continue
+                seen_links.add(item["link"])
+                formatted_results.append(item)
+
+        if self.catalog is not None and search_type != "image":
+            await asyncio.to_thread(self.catalog.upsert, formatted_results)
+        return formatted_results
+
+    async def _fetch_page(
+        self,
+        enhanced_query: str,
+        start: int,
+        num: int,
+        search_type: str,
+        priority: int
+    ) -> List[Dict[str, Any]]:
+        """Call the Custom Search API for one page of results and format them"""
+        logger.info(f"Searching Google Custom Search for: {enhanced_query} (start={start})")
+
+        # Build search parameters with USA location
+        search_params = {
+            "q": enhanced_query,
+            "cx": self.search_engine_id,
+            "num": num,
+            "start": start,
+            "gl": "us",  # Geolocation: United States
+            "cr": "countryUS",  # Country restrict: USA
+            "lr": "lang_en"  # Language: English
+        }
+
+        # Add searchType if specified
+        if search_type == "image":
+            search_params["searchType"] = "image"
+
+        # Execute the search
+        # The key goes in a header so it never shows up in logged request URLs
+        async with self.admission.slot(priority):
+            with upstream_call("google_cse", "search"):
+                response = await self._get_client().get(
+                    self.base_url,
+                    params=search_params,
+                    headers={"X-goog-api-key": self.api_key}
+                )
+                response.raise_for_status()
+                result = response.json()
+
+        # Process and format results
+        items = result.get("items", [])
+        formatted_results = []
+
+        for item in items:
+            image_url = self._extract_image(item)
+
+            # If we got a Google thumbnail, try to get the original image from metatags
+            if 'gstatic.com' in image_url or 'placeholder' in image_url:
+                # Try harder to find a real product image
+                if "pagemap" in item and "metatags" in item["pagemap"]:
+                    metatags = item["pagemap"]["metatags"][0] if item["pagemap"]["metatags"] else {}
+                    # Try all possible image fields
+                    for field in ["og:image:secure_url", "og:image", "twitter:image:src", "twitter:image"]:
+                        alt_img = metatags.get(field, "")
+                        if alt_img and 'gstatic' not in alt_img and len(alt_img) > 30:
+                            image_url = alt_img
+                            break
+
+            formatted_item = {
+                "id": item.get("link", ""),
+                "name": item.get("title", ""),
+                "description": item.get("snippet", ""),
+                "link": item.get("link", ""),
+                "image": image_url,
+                "price": self._extract_price(item),
+                "brand": self._extract_brand(item)
+            }
+            formatted_results.append(formatted_item)
+
+        return formatted_results
+
     def _extract_image(self, item: Dict[str, Any]) -> str:
         """Extract product image URL from search result"""
         # Priority 1: Product images from pagemap
@@ -0,0 +1,295 @@
+"""
+Similarity index over the reference hairstyle dataset
+
+Descriptors are computed offline into a memory-mapped array with a JSON sidecar:
+
+    python -m scripts.build_hairstyle_index
+
+Rebuilds are incremental: images whose size and modification time are unchanged keep their
+existing descriptor rows.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    # NumPy is loaded with the index (see `load`), keeping it off the startup path
+    import numpy as np
+
+from .image_features import DESCRIPTOR_DIMS, describe, load_image
+
+logger = logging.getLogger(__name__)
+
+# Hairstyle categories shipped in datasets/
+STYLES = ("Straight", "Wavy", "curly", "dreadlocks", "kinky")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+# Bump when the descriptor changes so stale indexes are rebuilt from scratch
+INDEX_VERSION = 1
+
+FEATURES_FILE = "features.npy"
+METADATA_FILE = "metadata.json"
+
+
+def describe_file(path: str) -> Optional["np.ndarray"]:
+    """Compute the descriptor of one image file; runs in a worker process"""
+    image = load_image(path)
+    if image is None:
+        return None
+    return describe(image)
+
+
+class HairstyleIndex:
+    """Memory-mapped descriptor matrix of the hairstyle dataset with vectorized k-NN queries"""
+
+    def __init__(self, dataset_dir: Union[str, Path], index_dir: Union[str, Path]):
+        """
+        Initialize the hairstyle index
+
+        Args:
+            dataset_dir: Directory containing one folder per hairstyle (see STYLES)
+            index_dir: Directory the descriptor array and metadata are written to
+        """
+        self.dataset_dir = Path(dataset_dir)
+        self.index_dir = Path(index_dir)
+        self.features_path = self.index_dir / FEATURES_FILE
+        self.metadata_path = self.index_dir / METADATA_FILE
+
+        self._lock = threading.Lock()
+        self._features: Optional["np.ndarray"] = None
+        self._sq_norms: Optional["np.ndarray"] = None
+        self._entries: List[Dict[str, Any]] = []
+        self._style_ids: Optional["np.ndarray"] = None
+        self.built_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._features is not None
+
+    def ensure_loaded(self) -> bool:
+        """
+        Load the index unless it already is; blocking
+
+        Returns:
+            True if an index is loaded
+        """
+        return self.loaded or self.load()
+
+    def load(self) -> bool:
+        """
+        Memory-map the descriptor array built by `build`
+
+        Returns:
+            True if an index was found and loaded
+        """
+        if not self.features_path.exists() or not self.metadata_path.exists():
+            return False
+        import numpy as np
+
+        metadata = json.loads(self.metadata_path.read_text())
+        if metadata.get("version") != INDEX_VERSION or metadata.get("dims") != DESCRIPTOR_DIMS:
+            logger.warning(f"Hairstyle index at {self.index_dir} is outdated; rebuild it")
+            return False
+
+        features = np.load(self.features_path, mmap_mode="r")
+        entries = metadata["entries"]
+        if features.shape != (len(entries), DESCRIPTOR_DIMS):
+            logger.warning(f"Hairstyle index at {self.index_dir} is inconsistent; rebuild it")
+            return False
+
+        with self._lock:
+            self._features = features
+            # Precomputed so a query is one matrix-vector product
+            self._sq_norms = np.einsum("ij,ij->i", features, features)
+            self._entries = entries
+            self._style_ids = np.array([STYLES.index(e["style"]) for e in entries], dtype=np.int8)
+            self.built_at = metadata.get("built_at")
+        logger.info(f"Loaded hairstyle index with {len(entries)} images from {self.index_dir}")
+        return True
+
+    def build(self, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Build or incrementally update the index and load it
+
+        Args:
+            workers: Descriptor worker processes (default: CPU count)
+
+        Returns:
+            Counts of indexed, recomputed, reused, removed and unreadable images
+        """
+        import numpy as np
+
+        started = time.perf_counter()
+        previous_rows, previous_skipped, previous_features = self._previous_build()
+
+        files = []
+        for style in STYLES:
+            style_dir = self.dataset_dir / style
+            if not style_dir.is_dir():
+                logger.warning(f"Hairstyle folder not found: {style_dir}")
+                continue
+            for path in sorted(style_dir.iterdir()):
+                if path.suffix.lower() in IMAGE_SUFFIXES and path.is_file():
+                    stat = path.stat()
+                    files.append((style, path, stat.st_mtime, stat.st_size))
+
+        entries: List[Dict[str, Any]] = []
+        rows: List[Optional["np.ndarray"]] = []
+        skipped: Dict[str, List[float]] = {}
+        to_compute: List[Tuple[int, Dict[str, Any], Path]] = []
+        reused = 0
+
+        for style, path, mtime, size in files:
+            relative = path.relative_to(self.dataset_dir).as_posix()
+            entry = {"path": relative, "style": style, "mtime": mtime, "size": size}
+            previous = previous_rows.get(relative)
+            if previous is not None and previous[1:] == (mtime, size):
+                entries.append(entry)
+                rows.append(previous_features[previous[0]])
+                reused += 1
+            elif previous_skipped.get(relative) == [mtime, size]:
+                skipped[relative] = [mtime, size]
+            else:
+                to_compute.append((len(rows), entry, path))
+                entries.append(entry)
+                rows.append(None)
+
+        if to_compute:
+            logger.info(f"Computing descriptors for {len(to_compute)} hairstyle images")
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                descriptors = executor.map(describe_file, [str(p) for _, _, p in to_compute], chunksize=16)
+                for (row, entry, _), descriptor in zip(to_compute, descriptors):
+                    if descriptor is None:
+                        skipped[entry["path"]] = [entry["mtime"], entry["size"]]
+                    rows[row] = descriptor
+
+        keep = [i for i, row in enumerate(rows) if row is not None]
+        entries = [entries[i] for i in keep]
+        features = np.stack([rows[i] for i in keep]) if keep else np.zeros((0, DESCRIPTOR_DIMS), np.float32)
+
+        self._write(features, entries, skipped)
+        self.load()
+
+        stats = {
+            "images": len(entries),
+            "computed": len(to_compute) - sum(1 for _, e, _ in to_compute if e["path"] in skipped),
+            "reused": reused,
+            "removed": len(set(previous_rows) - {e["path"] for e in entries}),
+            "unreadable": len(skipped),
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+        logger.info(f"Hairstyle index built: {stats}")
+        return stats
+
+    def query(self, image_path: Union[str, Path], k: int = 5, style: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find the reference hairstyles most similar to an image
+
+        Args:
+            image_path: Path to the query image
+            k: Number of matches to return
+            style: Optional hairstyle folder to restrict matches to (see STYLES)
+
+        Returns:
+            Matches ordered by distance, each with path, url, style and distance
+
+        Raises:
+            RuntimeError: If the index has not been built
+            ValueError: If the image cannot be decoded or the style is unknown
+        """
+        if style is not None and style not in STYLES:
+            raise ValueError(f"Unknown hairstyle '{style}'; expected one of {', '.join(STYLES)}")
+        import numpy as np
+
+        with self._lock:
+            features, sq_norms, entries, style_ids = self._features, self._sq_norms, self._entries, self._style_ids
+        if features is None:
+            raise RuntimeError("Hairstyle index has not been built. Run: python -m scripts.build_hairstyle_index")
+
+        descriptor = describe_file(str(image_path))
+        if descriptor is None:
+            raise ValueError("Could not decode the query image")
+
+        # Squared Euclidean distance to every row: |x|^2 - 2 x.q + |q|^2
+        distances = sq_norms - 2.0 * (features @ descriptor) + float(descriptor @ descriptor)
+        if style is not None:
+            distances = np.where(style_ids == STYLES.index(style), distances, np.inf)
+
+        k = max(1, min(k, len(distances)))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+
+        return [
+            {
+                "path": entries[i]["path"],
+                "url": f"/files/{entries[i]['path']}",
+                "style": entries[i]["style"],
+                "distance": round(float(np.sqrt(max(distances[i], 0.0))), 4),
+            }
+            for i in top if np.isfinite(distances[i])
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Index size and style counts for health reporting"""
+        with self._lock:
+            entries = self._entries
+        counts = {style: 0 for style in STYLES}
+        for entry in entries:
+            counts[entry["style"]] += 1
+        return {"loaded": self.loaded, "images": len(entries), "styles": counts, "built_at": self.built_at}
+
+    def _previous_build(self) -> Tuple[Dict[str, Tuple[int, float, int]], Dict[str, List[float]], Optional["np.ndarray"]]:
+        """Rows, unreadable files and features of the existing index, if it is still compatible"""
+        if not self.load():
+            return {}, {}, None
+        import numpy as np
+
+        metadata = json.loads(self.metadata_path.read_text())
+        rows = {e["path"]: (i, e["mtime"], e["size"]) for i, e in enumerate(metadata["entries"])}
+        return rows, metadata.get("skipped", {}), np.asarray(self._features)
+
+    def _write(self, features: "np.ndarray", entries: List[Dict[str, Any]], skipped: Dict[str, List[float]]):
+        """Write the array and sidecar to temporary files and swap them in"""
+        import numpy as np
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        features_tmp = self.index_dir / f".{FEATURES_FILE}.tmp"
+        metadata_tmp = self.index_dir / f".{METADATA_FILE}.tmp"
+
+        with open(features_tmp, "wb") as f:
+            np.save(f, features.astype(np.float32))
+        metadata_tmp.write_text(json.dumps({
+            "version": INDEX_VERSION,
+            "dims": DESCRIPTOR_DIMS,
+            "built_at": time.time(),
+            "entries": entries,
+            "skipped": skipped,
+        }))
+        os.replace(features_tmp, self.features_path)
+        os.replace(metadata_tmp, self.metadata_path)
+
+
+# Singleton instance
+_hairstyle_index = None
+
+
+def initialize_hairstyle_index(dataset_dir: Union[str, Path], index_dir: Union[str, Path]):
+    """Initialize the singleton index; it is loaded on warm-up or first query (see `HairstyleIndex.ensure_loaded`)"""
+    global _hairstyle_index
+    if _hairstyle_index is None:
+        _hairstyle_index = HairstyleIndex(dataset_dir, index_dir)
+        if not _hairstyle_index.features_path.exists():
+            logger.warning("Hairstyle index not built yet. Run: python -m scripts.build_hairstyle_index")
+
+
+def get_hairstyle_index() -> HairstyleIndex:
+    """Get singleton hairstyle index instance"""
+    if _hairstyle_index is None:
+        raise RuntimeError("Hairstyle index has not been initialized")
+    return _hairstyle_index
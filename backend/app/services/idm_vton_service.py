@@ -1,46 +1,129 @@
 """IDM-VTON service using Hugging Face Gradio Client API"""
 import logging
 import os
+import threading
+import time
+from functools import partial
 from pathlib import Path
-from typing import Union, Optional
-from gradio_client import Client, handle_file
+from typing import TYPE_CHECKING, Any, Dict, List, Union, Optional
+
+if TYPE_CHECKING:
+    # gradio_client pulls in huggingface_hub and takes ~200 ms to import, so it is loaded on first connect
+    from gradio_client import Client
+
+from .admission import PRIORITY_INTERACTIVE, AdmissionController
+from .metrics import upstream_call
+from .shared_state import get_shared_state
+from .single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SPACE = "yisol/IDM-VTON"
+
+
+class SpaceBackend:
+    """One IDM-VTON Space (or Gradio URL) with its client and load/error counters"""
+
+    def __init__(self, name: str, hf_token: Optional[str] = None):
+        self.name = name
+        self.hf_token = hf_token
+        self.client: Optional["Client"] = None
+        self._client_lock = threading.Lock()
+
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.last_error: Optional[str] = None
+        self.total_latency = 0.0
+
+    def get_client(self) -> "Client":
+        """Get or create the Gradio client; creation is serialized so concurrent callers share one"""
+        with self._client_lock:
+            if self.client is None:
+                from gradio_client import Client
+
+                logger.info(f"Connecting to Hugging Face Space: {self.name}")
+                with upstream_call("idm_vton", "connect"):
+                    # Only pass hf_token if it's not None to avoid "Illegal header value" error
+                    if self.hf_token:
+                        self.client = Client(self.name, hf_token=self.hf_token)
+                    else:
+                        self.client = Client(self.name)
+            return self.client
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for tuning and health reporting"""
+        successes = self.requests - self.errors
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "connected": self.client is not None,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "avg_latency_s": round(self.total_latency / successes, 2) if successes else None,
+            "last_error": self.last_error,
+        }
+
 
 class IDMVTONService:
     """IDM-VTON virtual try-on using Hugging Face Spaces"""
 
-    def __init__(self, space_name: str = "yisol/IDM-VTON", hf_token: Optional[str] = None):
+    def __init__(
+        self,
+        spaces: Optional[List[str]] = None,
+        hf_token: Optional[str] = None,
+        timeout: Optional[float] = None
+    ):
         """
         Initialize IDM-VTON service
 
         Args:
-            space_name: Hugging Face Space name (default: yisol/IDM-VTON)
+            spaces: Space names or Gradio URLs to balance across (reads comma-separated
+                IDM_VTON_SPACES, default: yisol/IDM-VTON)
             hf_token: Hugging Face API token (optional, reads from HF_TOKEN env var if not provided)
+            timeout: Seconds to wait for one backend before failing over (reads IDM_VTON_TIMEOUT, default: 120)
         """
-        self.space_name = space_name
+        if not spaces:
+            spaces = [s.strip() for s in os.getenv("IDM_VTON_SPACES", DEFAULT_SPACE).split(",") if s.strip()]
         # Handle empty string tokens (from .env files with HF_TOKEN=)
         token = hf_token or os.getenv("HF_TOKEN")
         self.hf_token = token if token else None
-        self.client = None
-        logger.info(f"IDM-VTON service initialized with space: {space_name}")
+        self.timeout = timeout or float(os.getenv("IDM_VTON_TIMEOUT", "120"))
+        self.max_failures = int(os.getenv("IDM_VTON_MAX_FAILURES", "3"))
+        self.cooldown = float(os.getenv("IDM_VTON_COOLDOWN", "60"))
+
+        self.backends = [SpaceBackend(name, self.hf_token) for name in spaces]
+        self.flights = SingleFlight("idm_vton")
+
+        # The anonymous Space quota allows very little parallelism; excess try-ons wait here
+        self.admission = AdmissionController(
+            "idm_vton",
+            max_concurrency=int(os.getenv("IDM_VTON_MAX_CONCURRENCY", "2")),
+            rate=float(os.getenv("IDM_VTON_RATE_LIMIT", "0")),
+            burst=int(os.getenv("IDM_VTON_RATE_BURST", "0")),
+            max_queue=int(os.getenv("IDM_VTON_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("IDM_VTON_QUEUE_TIMEOUT", "120")),
+            shared=get_shared_state()
+        )
+        self._lock = threading.Lock()
+        logger.info(f"IDM-VTON service initialized with spaces: {', '.join(spaces)}")
         if self.hf_token:
             logger.info("Using authenticated Hugging Face token. ✅")
         else:
             logger.warning("No Hugging Face token provided. Using anonymous access (limited quota). ⚠️")
 
-    def _get_client(self) -> Client:
-        """Get or create Gradio client"""
-        if self.client is None:
-            logger.info(f"Connecting to Hugging Face Space: {self.space_name}")
-            # Only pass hf_token if it's not None to avoid "Illegal header value" error
-            if self.hf_token:
-                self.client = Client(self.space_name, hf_token=self.hf_token)
-            else:
-                self.client = Client(self.space_name)
-        return self.client
-
     def try_on(
         self,
         person_image: Union[str, Path],
@@ -50,10 +133,16 @@ class IDMVTONService:
         is_checked_crop: bool = False,
         denoise_steps: int = 30,
         seed: int = 42,
+        priority: int = PRIORITY_INTERACTIVE,
     ) -> str:
         """
         Perform virtual try-on
 
+        Routes the request to the least-loaded healthy backend and fails over to the
+        remaining backends on error or timeout. Identical requests made while one is
+        running wait for it and receive the same result (or error). Calls are admitted
+        by the service's admission controller, at most IDM_VTON_MAX_CONCURRENCY at a time.
+
         Args:
             person_image: Path to person image
             garment_image: Path to garment/clothing image
@@ -62,18 +151,128 @@ class IDMVTONService:
             is_checked_crop: Whether to auto-crop (default: False)
             denoise_steps: Number of denoising steps (default: 30)
             seed: Random seed (default: 42)
+            priority: Admission priority (PRIORITY_BATCH for batch try-ons)
 
         Returns:
             Path to the generated try-on image
+
+        Raises:
+            UpstreamBusyError: If no call slot frees up within IDM_VTON_QUEUE_TIMEOUT
+        """
+        # Uploads are content-addressed, so the paths identify the images
+        key = (
+            str(person_image),
+            str(garment_image),
+            garment_description,
+            is_checked,
+            is_checked_crop,
+            denoise_steps,
+            seed
+        )
+        return self.flights.run_sync(key, partial(
+            self._try_on,
+            person_image,
+            garment_image,
+            garment_description,
+            is_checked,
+            is_checked_crop,
+            denoise_steps,
+            seed,
+            priority
+        ))
+
+    def _try_on(
+        self,
+        person_image: Union[str, Path],
+        garment_image: Union[str, Path],
+        garment_description: str,
+        is_checked: bool,
+        is_checked_crop: bool,
+        denoise_steps: int,
+        seed: int,
+        priority: int
+    ) -> str:
+        """Run one try-on with failover across the backends once admitted"""
+        with self.admission.slot_sync(priority):
+            tried = set()
+            last_error: Optional[Exception] = None
+
+            while len(tried) < len(self.backends):
+                backend = self._acquire_backend(tried)
+                tried.add(backend.name)
+                started = time.monotonic()
+                try:
+                    result = self._predict(
+                        backend,
+                        person_image,
+                        garment_image,
+                        garment_description,
+                        is_checked,
+                        is_checked_crop,
+                        denoise_steps,
+                        seed
+                    )
+                    self._release_backend(backend, started, error=None)
+                    return result
+                except Exception as e:
+                    self._release_backend(backend, started, error=e)
+                    last_error = e
+                    logger.error(f"Error during virtual try-on on {backend.name}: {e}")
+                    if len(tried) < len(self.backends):
+                        logger.info("Failing over to the next IDM-VTON backend")
+
+            raise last_error
+
+    def max_duration(self) -> float:
         """
-        try:
-            client = self._get_client()
+        Longest an admitted try-on can take before failing: one timeout per backend
 
-            logger.info(f"Running virtual try-on with person: {person_image}, garment: {garment_image}")
+        The wait for admission (up to IDM_VTON_QUEUE_TIMEOUT) is not included. Try-on jobs reach
+        admission at most TRYON_WORKERS at a time, so they only wait there behind batch
+        try-ons; a job that does wait long is failed by its own timeout first.
+        """
+        return self.timeout * len(self.backends)
+
+    def warm_up(self):
+        """
+        Connect to every backend ahead of the first try-on
+
+        Blocking; run it off the event loop. Failures are logged and left for the first
+        request to retry.
+        """
+        for backend in self.backends:
+            try:
+                backend.get_client()
+            except Exception as e:
+                logger.warning(f"Could not warm up IDM-VTON backend {backend.name}: {e}")
 
-            # Call the Gradio API
-            # The API endpoint expects: dict(human_img, garm_img, garment_des, is_checked, is_checked_crop, denoise_steps, seed)
-            result = client.predict(
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-backend in-flight counts, error rates and latency"""
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+    def _predict(
+        self,
+        backend: SpaceBackend,
+        person_image: Union[str, Path],
+        garment_image: Union[str, Path],
+        garment_description: str,
+        is_checked: bool,
+        is_checked_crop: bool,
+        denoise_steps: int,
+        seed: int
+    ) -> str:
+        """Run one try-on against a specific backend"""
+        from gradio_client import handle_file
+
+        client = backend.get_client()
+
+        logger.info(f"Running virtual try-on on {backend.name} with person: {person_image}, garment: {garment_image}")
+
+        # Call the Gradio API
+        # The API endpoint expects: dict(human_img, garm_img, garment_des, is_checked, is_checked_crop, denoise_steps, seed)
+        with upstream_call("idm_vton", "predict"):
+            job = client.submit(
                 dict={"background": handle_file(str(person_image)), "layers": [], "composite": None},
                 garm_img=handle_file(str(garment_image)),
                 garment_des=garment_description,
@@ -83,17 +282,47 @@ class IDMVTONService:
                 seed=seed,
                 api_name="/tryon"
             )
+            try:
+                result = job.result(timeout=self.timeout)
+            except TimeoutError:
+                job.cancel()
+                raise TimeoutError(f"{backend.name} did not respond within {self.timeout:g}s")
+
+        logger.info(f"Virtual try-on completed on {backend.name}. Result: {result}")
+
+        # Result is typically a tuple with (image_path, mask_path) or just image_path
+        if isinstance(result, (tuple, list)):
+            return result[0]
+        return result
 
-            logger.info(f"Virtual try-on completed. Result: {result}")
+    def _acquire_backend(self, exclude: set) -> SpaceBackend:
+        """Pick the least-loaded backend not yet tried, preferring healthy ones, and count it as in flight"""
+        with self._lock:
+            candidates = [b for b in self.backends if b.name not in exclude]
+            healthy = [b for b in candidates if b.healthy]
+            backend = min(healthy or candidates, key=lambda b: (b.in_flight, b.error_rate))
+            backend.in_flight += 1
+            backend.requests += 1
+            return backend
 
-            # Result is typically a tuple with (image_path, mask_path) or just image_path
-            if isinstance(result, tuple):
-                return result[0]
-            return result
+    def _release_backend(self, backend: SpaceBackend, started: float, error: Optional[Exception]):
+        """Record the outcome of a request and take failing backends out of rotation for a while"""
+        with self._lock:
+            backend.in_flight -= 1
+            if error is None:
+                backend.consecutive_failures = 0
+                backend.total_latency += time.monotonic() - started
+                return
 
-        except Exception as e:
-            logger.error(f"Error during virtual try-on: {e}")
-            raise
+            backend.errors += 1
+            backend.consecutive_failures += 1
+            backend.last_error = str(error)
+            if backend.consecutive_failures >= self.max_failures:
+                backend.unhealthy_until = time.monotonic() + self.cooldown
+                logger.warning(
+                    f"IDM-VTON backend {backend.name} marked unhealthy for {self.cooldown:.0f}s "
+                    f"after {backend.consecutive_failures} consecutive failures"
+                )
 
 
 # Singleton instance
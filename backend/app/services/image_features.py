@@ -0,0 +1,103 @@
+"""Compact image descriptors for similarity search and near-duplicate detection"""
+from typing import TYPE_CHECKING, Optional, Union
+from pathlib import Path
+
+if TYPE_CHECKING:
+    # cv2 and NumPy take ~110 ms to import, so they are loaded by the functions that use them
+    import numpy as np
+
+# Side length images are reduced to before computing descriptors
+DESCRIPTOR_SIDE = 128
+
+# HSV histogram bins (hue, saturation, value)
+COLOR_BINS = (8, 4, 4)
+# Gradient orientation histogram bins over 0-180 degrees
+TEXTURE_BINS = 16
+# dHash grid size; the hash has HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 8
+
+# Relative weights of the descriptor parts in the squared Euclidean distance
+COLOR_WEIGHT = 1.0
+TEXTURE_WEIGHT = 1.0
+HASH_WEIGHT = 0.5
+
+DESCRIPTOR_DIMS = COLOR_BINS[0] * COLOR_BINS[1] * COLOR_BINS[2] + TEXTURE_BINS + HASH_SIZE * HASH_SIZE
+
+
+def load_image(path: Union[str, Path]) -> Optional["np.ndarray"]:
+    """Decode an image at reduced resolution as BGR; None if it cannot be decoded"""
+    import cv2
+    import numpy as np
+
+    data = np.fromfile(str(path), dtype=np.uint8)
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_REDUCED_COLOR_2)
+
+
+def trim_border(image: "np.ndarray", threshold: int = 250) -> "np.ndarray":
+    """Crop uniform white padding (e.g. from upload normalization) so it does not skew the histograms"""
+    import numpy as np
+
+    content = (image < threshold).any(axis=2)
+    rows = np.flatnonzero(content.any(axis=1))
+    cols = np.flatnonzero(content.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return image
+    return image[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+
+def dhash(gray: "np.ndarray", hash_size: int = HASH_SIZE) -> "np.ndarray":
+    """
+    Difference hash of a grayscale image
+
+    Args:
+        gray: 2-D uint8 image
+        hash_size: Grid size; the hash has hash_size * hash_size bits
+
+    Returns:
+        Boolean array of hash bits (pack with np.packbits for storage)
+    """
+    import cv2
+
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+
+def describe(image: "np.ndarray") -> "np.ndarray":
+    """
+    Descriptor combining color, texture and layout
+
+    The square roots of the normalized HSV and gradient-orientation histograms are unit
+    vectors, so Euclidean distance between them is the Hellinger distance; dHash bits are
+    scaled so the full hash contributes at most HASH_WEIGHT squared.
+
+    Args:
+        image: BGR uint8 image
+
+    Returns:
+        float32 vector of DESCRIPTOR_DIMS values
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.resize(trim_border(image), (DESCRIPTOR_SIDE, DESCRIPTOR_SIDE), interpolation=cv2.INTER_AREA)
+
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    color = cv2.calcHist([hsv], [0, 1, 2], None, list(COLOR_BINS), [0, 180, 0, 256, 0, 256]).ravel()
+    color = np.sqrt(color / max(color.sum(), 1.0))
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1)
+    magnitude, angle = cv2.cartToPolar(gx, gy, angleInDegrees=True)
+    texture, _ = np.histogram(angle % 180, bins=TEXTURE_BINS, range=(0, 180), weights=magnitude)
+    texture = np.sqrt(texture / max(texture.sum(), 1e-6))
+
+    bits = dhash(gray).astype(np.float32) / HASH_SIZE
+
+    return np.concatenate([
+        color * COLOR_WEIGHT,
+        texture * TEXTURE_WEIGHT,
+        bits * HASH_WEIGHT,
+    ]).astype(np.float32)
@@ -0,0 +1,266 @@
+"""Image preprocessing that normalizes try-on inputs to IDM-VTON's working resolution"""
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# IDM-VTON works on 3:4 portrait images at 768x1024
+MODEL_SIZE = (768, 1024)
+
+# Encodings offered for resized variants: format name -> (PIL format, media type, file suffix)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+}
+
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+_EXIF_ORIENTATION = 0x0112
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image has more pixels than the caller allows"""
+
+
+def preprocess_image(
+    source: Union[str, bytes],
+    destination: str,
+    size: Tuple[int, int] = MODEL_SIZE,
+    quality: int = 90,
+    max_pixels: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Decode, orient, fit and re-encode an image for the try-on model
+
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Args:
+        source: Path to the original image, or its contents
+        destination: Path the normalized JPEG is written to
+        size: Target (width, height); the image is scaled down to fit and padded to this aspect ratio
+        quality: JPEG quality
+        max_pixels: Reject images with more pixels than this before decoding them
+
+    Returns:
+        Dictionary with the original and normalized dimensions
+
+    Raises:
+        ImageTooLargeError: If the image has more than max_pixels pixels
+        ValueError: If the file is not a readable image
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            original_size = img.size
+            if max_pixels and img.width * img.height > max_pixels:
+                raise ImageTooLargeError(f"{img.width}x{img.height} exceeds the {max_pixels / 1e6:g} megapixel limit")
+            orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+            if img.format == "JPEG":
+                # Let libjpeg decode at a reduced scale (1/2, 1/4, 1/8) that still covers the target
+                draft_size = size[::-1] if orientation in _TRANSPOSED_ORIENTATIONS else size
+                img.draft("RGB", draft_size)
+
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGB")
+
+            # Only ever scale down, then pad to the model aspect ratio at that scale
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+            scale = max(img.width / size[0], img.height / size[1])
+            canvas_size = (round(size[0] * scale), round(size[1] * scale))
+            if img.size != canvas_size:
+                img = ImageOps.pad(img, canvas_size, color=(255, 255, 255))
+
+            img.save(destination, "JPEG", quality=quality)
+            return {"original_size": original_size, "size": img.size}
+    except ImageTooLargeError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Invalid or unsupported image file: {e}")
+
+
+def render_variant(
+    source: str,
+    destination: str,
+    width: Optional[int],
+    height: Optional[int],
+    fmt: str,
+    quality: int
+) -> Dict[str, Any]:
+    """
+    Write a resized, re-encoded copy of an image
+
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Args:
+        source: Path to the original image
+        destination: Path the variant is written to
+        width: Maximum width (None for no limit)
+        height: Maximum height (None for no limit)
+        fmt: Key of VARIANT_FORMATS
+        quality: Encoder quality (1-100)
+
+    Returns:
+        Dictionary with the original and variant dimensions
+
+    Raises:
+        ValueError: If the file is not a readable image
+    """
+    from PIL import Image, ImageOps
+
+    pil_format = VARIANT_FORMATS[fmt][0]
+    try:
+        with Image.open(source) as img:
+            original_size = img.size
+            bounds = (width or img.width, height or img.height)
+            if img.format == "JPEG":
+                img.draft("RGB", bounds)
+
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGB")
+            # Aspect ratio is kept and images are never scaled up
+            img.thumbnail(bounds, Image.Resampling.LANCZOS)
+
+            if pil_format == "WEBP":
+                img.save(destination, pil_format, quality=quality, method=4)
+            else:
+                img.save(destination, pil_format, quality=quality, optimize=True, progressive=True)
+            return {"original_size": original_size, "size": img.size}
+    except Exception as e:
+        raise ValueError(f"Invalid or unsupported image file: {e}")
+
+
+def _load_codecs():
+    """Import PIL and its format plugins in a worker process; PIL is kept off the application's import path"""
+    from PIL import Image
+
+    Image.init()
+
+
+class ImagePreprocessor:
+    """Runs preprocess_image in a process pool so uploads are normalized in parallel across cores"""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        size: Tuple[int, int] = MODEL_SIZE,
+        quality: Optional[int] = None
+    ):
+        """
+        Initialize the image preprocessor
+
+        Args:
+            workers: Number of worker processes (reads PREPROCESS_WORKERS, default: CPU count)
+            size: Target (width, height) for normalized images
+            quality: JPEG quality (reads PREPROCESS_JPEG_QUALITY, default: 90)
+        """
+        self.workers = workers or int(os.getenv("PREPROCESS_WORKERS", "0")) or os.cpu_count() or 1
+        self.size = size
+        self.quality = quality or int(os.getenv("PREPROCESS_JPEG_QUALITY", "90"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Start the worker processes"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"Image preprocessor started with {self.workers} worker processes")
+
+    async def warm_up(self):
+        """Spawn the worker processes and load the image codecs in each before the first upload arrives"""
+        if self._pool is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _load_codecs) for _ in range(self.workers)))
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("Image preprocessor stopped")
+
+    async def normalize(
+        self,
+        source: Union[Path, bytes],
+        destination: Path,
+        max_pixels: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Normalize an image off the event loop
+
+        Falls back to a thread when the process pool has not been started (e.g. in scripts).
+
+        Args:
+            source: Path to the original image, or its contents (decoded in memory, no temp file)
+            destination: Path the normalized JPEG is written to
+            max_pixels: Reject images with more pixels than this before decoding them
+
+        Returns:
+            Dictionary with the original and normalized dimensions
+        """
+        loop = asyncio.get_running_loop()
+        with timed("image_normalize"):
+            return await loop.run_in_executor(
+                self._pool,
+                preprocess_image,
+                source if isinstance(source, bytes) else str(source),
+                str(destination),
+                self.size,
+                self.quality,
+                max_pixels
+            )
+
+    async def render_variant(
+        self,
+        source: Path,
+        destination: Path,
+        width: Optional[int],
+        height: Optional[int],
+        fmt: str,
+        quality: int
+    ) -> Dict[str, Any]:
+        """
+        Resize and re-encode an image off the event loop
+
+        Args:
+            source: Path to the original image
+            destination: Path the variant is written to
+            width: Maximum width (None for no limit)
+            height: Maximum height (None for no limit)
+            fmt: Key of VARIANT_FORMATS
+            quality: Encoder quality (1-100)
+
+        Returns:
+            Dictionary with the original and variant dimensions
+        """
+        loop = asyncio.get_running_loop()
+        with timed("variant_render"):
+            return await loop.run_in_executor(
+                self._pool,
+                render_variant,
+                str(source),
+                str(destination),
+                width,
+                height,
+                fmt,
+                quality
+            )
+
+
+# Singleton instance
+_image_preprocessor = None
+
+
+def get_image_preprocessor() -> ImagePreprocessor:
+    """Get singleton image preprocessor instance"""
+    global _image_preprocessor
+    if _image_preprocessor is None:
+        _image_preprocessor = ImagePreprocessor()
+    return _image_preprocessor
@@ -0,0 +1,89 @@
+"""
+Image format and dimension sniffing from the first bytes of a file
+
+Identifies the container from its magic bytes and reads the pixel dimensions from the header,
+without decoding anything or importing PIL, so an upload can be rejected before the rest of it
+is read.
+"""
+import struct
+from typing import Optional, Tuple
+
+# Bytes that must be available to identify any supported format and, usually, its dimensions.
+# JPEG dimensions follow the EXIF/ICC segments, which can be larger; then they are not known yet.
+HEAD_SIZE = 64 * 1024
+
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+_JPEG_STANDALONE = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9}
+
+
+def sniff_image(head: bytes) -> Tuple[str, Optional[Tuple[int, int]]]:
+    """
+    Identify an image from its first bytes
+
+    Args:
+        head: Start of the file (HEAD_SIZE bytes, or the whole file if shorter)
+
+    Returns:
+        Tuple of (format name as used by PIL, (width, height) or None if not within `head`)
+
+    Raises:
+        ValueError: If the bytes do not start a supported image format
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG", _jpeg_size(head)
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(head) >= 24 and head[12:16] == b"IHDR":
+            return "PNG", struct.unpack(">II", head[16:24])
+        return "PNG", None
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP", _webp_size(head)
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF", struct.unpack("<HH", head[6:10]) if len(head) >= 10 else None
+    if head[:2] == b"BM":
+        if len(head) >= 26:
+            width, height = struct.unpack("<ii", head[18:26])
+            return "BMP", (abs(width), abs(height))
+        return "BMP", None
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        # Dimensions live in an IFD that can be anywhere in the file
+        return "TIFF", None
+    raise ValueError("not a JPEG, PNG, WebP, GIF, BMP or TIFF image")
+
+
+def _jpeg_size(head: bytes) -> Optional[Tuple[int, int]]:
+    """Walk the marker segments up to the first start-of-frame"""
+    i = 2
+    while i + 4 <= len(head):
+        if head[i] != 0xFF:
+            return None
+        marker = head[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE:
+            i += 2
+            continue
+        if marker in _JPEG_SOF:
+            if i + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", head[i + 2:i + 4])[0]
+    return None
+
+
+def _webp_size(head: bytes) -> Optional[Tuple[int, int]]:
+    """Read the canvas size of a lossy, lossless or extended WebP"""
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30:
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        b0, b1, b2, b3 = head[21:25]
+        return 1 + (((b1 & 0x3F) << 8) | b0), 1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6))
+    if chunk == b"VP8X" and len(head) >= 30:
+        return 1 + int.from_bytes(head[24:27], "little"), 1 + int.from_bytes(head[27:30], "little")
+    return None
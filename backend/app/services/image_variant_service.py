@@ -0,0 +1,164 @@
+"""Disk cache of resized, re-encoded variants of uploaded and generated images"""
+import hashlib
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .image_preprocessing_service import VARIANT_FORMATS, ImagePreprocessor, get_image_preprocessor
+from .storage_service import StorageManager, get_storage_manager
+
+logger = logging.getLogger(__name__)
+
+STORAGE_AREA = "variants"
+
+
+class ImageVariantStore:
+    """Generates each (image, size, format, quality) variant once and serves it from disk afterwards"""
+
+    def __init__(
+        self,
+        roots: Dict[str, Path],
+        directory: Path,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        storage: Optional[StorageManager] = None
+    ):
+        """
+        Initialize the variant store
+
+        Args:
+            roots: Public name -> directory of the images variants may be made from
+            directory: Directory the variants are cached in
+            preprocessor: Preprocessor whose process pool renders variants (default: the shared instance)
+            storage: Storage manager that bounds the variant cache (default: the shared instance)
+        """
+        self.roots = {name: Path(path).resolve() for name, path in roots.items()}
+        self.directory = Path(directory)
+        self.preprocessor = preprocessor or get_image_preprocessor()
+        self.storage = storage or get_storage_manager()
+        self.max_side = int(os.getenv("IMAGE_VARIANT_MAX_SIDE", "2048"))
+        self.default_quality = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+        self.hits = 0
+        self.generated = 0
+
+        self.incoming = self.directory / ".incoming"
+        self.incoming.mkdir(parents=True, exist_ok=True)
+
+    def locate(
+        self,
+        root: str,
+        path: str,
+        width: Optional[int],
+        height: Optional[int],
+        fmt: str,
+        quality: Optional[int]
+    ) -> Tuple[str, Path, Path, Dict[str, Any]]:
+        """
+        Resolve a variant request without generating anything
+
+        The key covers the source file's identity (path, size, modification time) and the
+        variant parameters, so it doubles as a strong ETag.
+
+        Args:
+            root: Name of one of the configured roots
+            path: Image path relative to the root
+            width: Maximum width, or None
+            height: Maximum height, or None
+            fmt: Key of VARIANT_FORMATS
+            quality: Encoder quality, or None for the default
+
+        Returns:
+            Tuple of (key, source path, variant path, normalized parameters)
+
+        Raises:
+            ValueError: If the root, format or parameters are invalid
+            FileNotFoundError: If the source image does not exist
+        """
+        if root not in self.roots:
+            raise ValueError(f"Unknown image root '{root}'; expected one of {', '.join(self.roots)}")
+        if fmt not in VARIANT_FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'; expected one of {', '.join(VARIANT_FORMATS)}")
+        for name, value in (("width", width), ("height", height)):
+            if value is not None and not 1 <= value <= self.max_side:
+                raise ValueError(f"{name} must be between 1 and {self.max_side}")
+        quality = quality or self.default_quality
+        if not 1 <= quality <= 100:
+            raise ValueError("quality must be between 1 and 100")
+
+        # Only regular files inside the root; hidden entries such as .incoming are never exposed
+        base = self.roots[root]
+        source = (base / path).resolve()
+        if not source.is_relative_to(base) or any(part.startswith(".") for part in source.relative_to(base).parts):
+            raise FileNotFoundError(path)
+        if not source.is_file():
+            raise FileNotFoundError(path)
+
+        stat = source.stat()
+        params = {"width": width, "height": height, "format": fmt, "quality": quality}
+        key = hashlib.sha256(
+            f"{root}/{source.relative_to(base).as_posix()}|{stat.st_size}|{stat.st_mtime_ns}|"
+            f"{width}|{height}|{fmt}|{quality}".encode()
+        ).hexdigest()
+        variant = self.directory / key[:2] / f"{key}{VARIANT_FORMATS[fmt][2]}"
+        return key, source, variant, params
+
+    async def ensure(self, source: Path, variant: Path, params: Dict[str, Any]) -> Path:
+        """
+        Return the cached variant, rendering it in the process pool on first use
+
+        Args:
+            source: Source image from `locate`
+            variant: Variant path from `locate`
+            params: Normalized parameters from `locate`
+
+        Returns:
+            Path of the variant file
+        """
+        if variant.exists():
+            self.hits += 1
+            self.storage.touch(STORAGE_AREA, variant)
+            return variant
+
+        # Render to a private temp file and publish atomically so concurrent requests never see partial files
+        tmp = self.incoming / f"{uuid.uuid4().hex}{variant.suffix}"
+        try:
+            await self.preprocessor.render_variant(
+                source,
+                tmp,
+                params["width"],
+                params["height"],
+                params["format"],
+                params["quality"]
+            )
+            variant.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, variant)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.storage.track(STORAGE_AREA, variant)
+
+        self.generated += 1
+        logger.info(f"Generated image variant {variant.name} from {source.name}")
+        return variant
+
+    def stats(self) -> Dict[str, Any]:
+        """Variant cache counters"""
+        return {"hits": self.hits, "generated": self.generated}
+
+
+# Singleton instance
+_image_variant_store = None
+
+
+def initialize_image_variant_store(roots: Dict[str, Path], directory: Path):
+    """Initialize the singleton store instance."""
+    global _image_variant_store
+    if _image_variant_store is None:
+        _image_variant_store = ImageVariantStore(roots, directory)
+
+
+def get_image_variant_store() -> ImageVariantStore:
+    """Get singleton image variant store instance"""
+    if _image_variant_store is None:
+        raise RuntimeError("Image variant store has not been initialized")
+    return _image_variant_store
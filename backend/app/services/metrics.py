@@ -0,0 +1,309 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+
+Counters, gauges and histograms are plain Python objects guarded by a lock, so recording a
+sample costs a dictionary lookup and a few additions. `timed` measures a stage of request
+handling and `upstream_call` wraps one call to an external API (latency, in-flight count and
+errors by type). `MetricsMiddleware` records latency per route.
+
+Values are per process: each uvicorn worker reports only what it recorded itself.
+"""
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+# Seconds; covers cache hits (ms) through Gradio try-ons (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_metrics: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric family with a fixed set of label names"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. requests in flight"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, one extra for +Inf, then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format"""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "wardrobe_stage_duration_seconds",
+    "Duration of internal processing stages",
+    ["stage"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "wardrobe_upstream_request_duration_seconds",
+    "Duration of calls to external APIs",
+    ["upstream", "operation"]
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "wardrobe_upstream_requests_in_flight",
+    "Calls to external APIs currently waiting for a response",
+    ["upstream"]
+)
+UPSTREAM_ERRORS = Counter(
+    "wardrobe_upstream_errors_total",
+    "Failed calls to external APIs by error type",
+    ["upstream", "operation", "type"]
+)
+HTTP_SECONDS = Histogram(
+    "wardrobe_http_request_duration_seconds",
+    "Duration of HTTP requests, including streamed bodies",
+    ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "wardrobe_http_requests_in_flight",
+    "HTTP requests currently being handled"
+)
+TRYON_QUEUE_DEPTH = Gauge(
+    "wardrobe_tryon_queue_depth",
+    "Try-on jobs waiting for a worker"
+)
+TRYON_JOBS_RUNNING = Gauge(
+    "wardrobe_tryon_jobs_running",
+    "Try-on jobs currently running"
+)
+ADMISSION_ACTIVE = Gauge(
+    "wardrobe_admission_active",
+    "Calls to external APIs holding an admission slot",
+    ["upstream"]
+)
+ADMISSION_QUEUED = Gauge(
+    "wardrobe_admission_queue_length",
+    "Calls to external APIs waiting for admission",
+    ["upstream"]
+)
+ADMISSION_REJECTIONS = Counter(
+    "wardrobe_admission_rejections_total",
+    "Calls rejected because their upstream was at capacity, by reason",
+    ["upstream", "reason"]
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "wardrobe_single_flight_calls_total",
+    "Upstream calls started (leader) and identical calls that waited on them (follower)",
+    ["flight", "role"]
+)
+CACHE_LOOKUPS = Gauge(
+    "wardrobe_cache_lookups",
+    "Cache lookups since startup by result",
+    ["cache", "result"]
+)
+CACHE_HIT_RATIO = Gauge(
+    "wardrobe_cache_hit_ratio",
+    "Fraction of cache lookups answered from the cache",
+    ["cache"]
+)
+
+
+def timed(stage: str):
+    """Context manager recording the duration of a processing stage"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def error_type(error: BaseException) -> str:
+    """Short, bounded label for an upstream failure"""
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return f"http_{status}"
+    return type(error).__name__
+
+
+@contextmanager
+def upstream_call(upstream: str, operation: str) -> Iterator[None]:
+    """
+    Record one call to an external API
+
+    Tracks the in-flight count, observes the latency and counts failures by error type.
+
+    Args:
+        upstream: API name, e.g. "openai"
+        operation: Call within the API, e.g. "vision"
+    """
+    UPSTREAM_IN_FLIGHT.inc(upstream=upstream)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        UPSTREAM_ERRORS.inc(upstream=upstream, operation=operation, type=error_type(e))
+        raise
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(upstream=upstream)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=upstream, operation=operation)
+
+
+def record_cache(cache: str, stats: Dict[str, Any]):
+    """Publish a cache's hit/miss counters (as returned by its stats()) as gauges"""
+    hits = stats.get("hits", 0) + stats.get("stale_hits", 0)
+    misses = stats.get("misses", 0)
+    CACHE_LOOKUPS.set(hits, cache=cache, result="hit")
+    CACHE_LOOKUPS.set(misses, cache=cache, result="miss")
+    if hits + misses:
+        CACHE_HIT_RATIO.set(round(hits / (hits + misses), 4), cache=cache)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests and latency per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Label by the matched route template (or mount prefix) to bound cardinality
+            route = getattr(scope.get("route"), "path", None) or scope.get("root_path") or "unmatched"
+            HTTP_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route,
+                status=status
+            )
@@ -1,58 +1,272 @@
 """OpenAI service for AI stylist chat and recommendations"""
+import asyncio
+import hashlib
+import importlib.util
 import logging
 import os
 import json
-from typing import List, Dict, Any, Optional
-from pathlib import Path
-from dotenv import load_dotenv
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 import httpx
 
-# Load .env file from project root directory
-project_root = Path(__file__).resolve().parent.parent.parent.parent
-env_path = project_root / '.env'
-load_dotenv(dotenv_path=env_path, override=True)
+from .chat_compaction import ChatCompactor
+from .admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController
+from .metrics import upstream_call
+from .shared_state import get_shared_state
+from .single_flight import SingleFlight
+from .ttl_cache import TTLCache, FRESH
 
 logger = logging.getLogger(__name__)
 
+# Operations not listed are interactive
+OPERATION_PRIORITY = {"recommendations": PRIORITY_BATCH}
+
 
 class OpenAIService:
     """OpenAI API service for AI stylist functionality"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         """
         Initialize OpenAI service
 
         Args:
             api_key: OpenAI API key (reads from OPENAI_API_KEY env var if not provided)
+            base_url: API base URL, e.g. a local stand-in for load tests
+                (reads OPENAI_BASE_URL, default: https://api.openai.com/v1)
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.base_url = "https://api.openai.com/v1"
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
         self.model = "gpt-4o-mini"
+        self.search_deadline = float(os.getenv("RECOMMENDATIONS_SEARCH_DEADLINE", "5"))
+
+        # Connection pool settings for the shared HTTP client
+        self.http2 = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+        self.max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+        self.max_keepalive_connections = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+        self.keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+
+        # Per-operation timeouts in seconds
+        self.timeouts = {
+            "chat": float(os.getenv("OPENAI_CHAT_TIMEOUT", "30")),
+            "vision": float(os.getenv("OPENAI_VISION_TIMEOUT", "60")),
+            "recommendations": float(os.getenv("OPENAI_RECOMMENDATIONS_TIMEOUT", "20")),
+            "summary": float(os.getenv("OPENAI_SUMMARY_TIMEOUT", "20")),
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Bound the calls in flight (and optionally their rate) below the account's rate limits;
+        # recommendation prompts wait behind interactive chat and image analysis
+        self.admission = AdmissionController(
+            "openai",
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+            rate=float(os.getenv("OPENAI_RATE_LIMIT", "0")),
+            burst=int(os.getenv("OPENAI_RATE_BURST", "0")),
+            max_queue=int(os.getenv("OPENAI_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv("OPENAI_QUEUE_TIMEOUT", "10")),
+            shared=get_shared_state()
+        )
+
+        # Vision analyses and recommendation prompts repeat across users, so keep their completions
+        # in the shared state (on disk, seen by every worker) unless a file of their own is configured
+        self.cache = TTLCache(
+            maxsize=int(os.getenv("OPENAI_CACHE_SIZE", "4096")),
+            ttl=float(os.getenv("OPENAI_CACHE_TTL", "604800")),
+            path=os.getenv("OPENAI_CACHE_PATH") or None,
+            name="OpenAI response cache",
+            shared=get_shared_state(),
+            namespace="openai"
+        )
+        self.flights = SingleFlight("openai")
+
+        # Long stylist sessions are trimmed to a token budget, older turns folded into a rolling summary
+        self.compactor = ChatCompactor(model=self.model)
 
         if not self.api_key:
             logger.warning("OpenAI API key not found. AI features will be unavailable.")
         else:
             logger.info("OpenAI service initialized successfully")
 
+    async def startup(self):
+        """Create the shared HTTP client; called from the application lifespan"""
+        self._get_client()
+
+    async def aclose(self):
+        """Close the shared HTTP client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get or create the shared, connection-pooled HTTP client"""
+        if self._client is None:
+            http2 = self.http2
+            if http2 and importlib.util.find_spec("h2") is None:
+                logger.warning("OPENAI_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+                http2 = False
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=http2,
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}"
+                },
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+            logger.info(f"OpenAI HTTP client created for {self.base_url} (http2: {http2})")
+        return self._client
+
+    async def _chat_completion(self, payload: Dict[str, Any], operation: str) -> str:
+        """
+        Call the chat completions endpoint on the shared client
+
+        Args:
+            payload: Request body (the model is filled in)
+            operation: Key into self.timeouts
+
+        Returns:
+            Content of the first choice
+
+        Raises:
+            UpstreamBusyError: If admission control rejects the call
+        """
+        async with self.admission.slot(OPERATION_PRIORITY.get(operation, PRIORITY_INTERACTIVE)):
+            with upstream_call("openai", operation):
+                response = await self._get_client().post(
+                    "/chat/completions",
+                    json={"model": self.model, **payload},
+                    timeout=self.timeouts[operation]
+                )
+                response.raise_for_status()
+                data = response.json()
+        return data["choices"][0]["message"]["content"]
+
+    async def _cached_chat_completion(self, payload: Dict[str, Any], operation: str, use_cache: bool = True) -> str:
+        """
+        Call the chat completions endpoint through the response cache
+
+        Args:
+            payload: Request body (the model is filled in)
+            operation: Key into self.timeouts
+            use_cache: Set to False to skip the lookup and force a fresh completion (the result is still stored);
+                otherwise concurrent identical requests share one completion
+
+        Returns:
+            Content of the first choice
+        """
+        cache_key = self._cache_key(operation, payload)
+        if not use_cache:
+            content = await self._chat_completion(payload, operation)
+            await self.cache.set(cache_key, content)
+            return content
+
+        cached, state = await self.cache.get(cache_key)
+        if state == FRESH:
+            logger.info(f"OpenAI {operation} response served from cache")
+            return cached
+
+        # A caller that accepts a cached answer also accepts one already being generated
+        async def complete() -> str:
+            content = await self._chat_completion(payload, operation)
+            await self.cache.set(cache_key, content)
+            return content
+
+        return await self.flights.run(cache_key, complete)
+
+    def _cache_key(self, operation: str, payload: Dict[str, Any]) -> str:
+        """Hash of the model, operation and full request body (prompt, image URL or data URL, parameters)"""
+        body = json.dumps({"model": self.model, "operation": operation, **payload}, sort_keys=True)
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Response cache hit/miss counters"""
+        return self.cache.stats()
+
     async def get_chat_response(
         self,
         messages: List[Dict[str, str]],
         context: Optional[Dict[str, Any]] = None
-    ) -> str:
+    ) -> Dict[str, Any]:
         """
         Get AI chat response
 
+        The history is compacted to CHAT_TOKEN_BUDGET before it is sent.
+
         Args:
             messages: List of message objects with 'type' and 'text' keys
             context: Optional context including closet info and preferences
 
         Returns:
-            AI response text
+            Dict with the AI response text under "response" and prompt token counts under "usage"
         """
         if not self.api_key:
             logger.error("OpenAI API key not configured. Please set OPENAI_API_KEY in backend/.env")
             raise ValueError("OpenAI API key not configured. Please add OPENAI_API_KEY to backend/.env")
 
+        try:
+            # Ensure API key is not empty
+            if not self.api_key or not self.api_key.strip():
+                raise ValueError("OpenAI API key is empty or invalid")
+
+            formatted_messages, usage = await self._prepare_chat_messages(messages, context)
+            response = await self._chat_completion(
+                {
+                    "messages": formatted_messages,
+                    "temperature": 0.7,
+                    "max_tokens": 500
+                },
+                operation="chat"
+            )
+            return {"response": response, "usage": usage}
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"OpenAI API HTTP error: {e.response.status_code} - {e.response.text}")
+            raise ValueError(f"OpenAI API error: {e.response.status_code}")
+        except Exception as e:
+            logger.error(f"Error calling OpenAI API: {e}", exc_info=True)
+            raise
+
+    async def _prepare_chat_messages(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Build the chat prompt and compact it to the token budget"""
+        formatted_messages = self._build_chat_messages(messages, context)
+        return await self.compactor.compact(formatted_messages, self._summarize_history)
+
+    async def _summarize_history(self, previous: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        """Fold older chat messages into the rolling conversation summary"""
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        return (await self._chat_completion(
+            {
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": "You maintain a running summary of a conversation between a user and their AI fashion stylist. "
+                                   "Keep the user's stated style, sizes, budget, occasions and brands, and the items that were "
+                                   "suggested, liked or rejected. Be concise and factual."
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Previous summary:\n{previous or 'None'}\n\nNew messages:\n{transcript}\n\nWrite the updated summary."
+                    }
+                ],
+                "temperature": 0.2,
+                "max_tokens": self.compactor.summary_max_tokens
+            },
+            operation="summary"
+        )).strip()
+
+    def _build_chat_messages(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Build the OpenAI message list: stylist system prompt followed by the conversation"""
         context = context or {}
 
         # Build system message
@@ -75,49 +289,87 @@ Be helpful, friendly, and provide specific fashion advice. When users describe w
                 "role": "user" if msg.get("type") == "user" else "assistant",
                 "content": msg.get("text", "")
             })
+        return formatted_messages
 
-        try:
-            # Ensure API key is not empty
-            if not self.api_key or not self.api_key.strip():
-                raise ValueError("OpenAI API key is empty or invalid")
+    async def stream_chat_response(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the AI chat response as it is generated
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.api_key}"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": formatted_messages,
-                        "temperature": 0.7,
-                        "max_tokens": 500
-                    }
-                )
+        Closing the generator (e.g. when the client disconnects) closes the upstream
+        response, so OpenAI stops generating tokens nobody will read.
 
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
+        Args:
+            messages: List of message objects with 'type' and 'text' keys
+            context: Optional context including closet info and preferences
+            usage: Optional dict updated with the prompt token counts after compaction, as
+                returned under "usage" by get_chat_response
+
+        Yields:
+            Text deltas of the response
+        """
+        if not self.api_key or not self.api_key.strip():
+            logger.error("OpenAI API key not configured. Please set OPENAI_API_KEY in backend/.env")
+            raise ValueError("OpenAI API key not configured. Please add OPENAI_API_KEY to backend/.env")
+
+        try:
+            formatted_messages, prompt_usage = await self._prepare_chat_messages(messages, context)
+            if usage is not None:
+                usage.update(prompt_usage)
+            async with self.admission.slot():
+                with upstream_call("openai", "chat_stream"):
+                    async with self._get_client().stream(
+                        "POST",
+                        "/chat/completions",
+                        json={
+                            "model": self.model,
+                            "messages": formatted_messages,
+                            "temperature": 0.7,
+                            "max_tokens": 500,
+                            "stream": True
+                        },
+                        timeout=self.timeouts["chat"]
+                    ) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            response.raise_for_status()
+
+                        # Server-sent events: one "data: {json}" line per chunk, terminated by "data: [DONE]"
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            choices = json.loads(data).get("choices") or []
+                            delta = choices[0].get("delta", {}).get("content") if choices else None
+                            if delta:
+                                yield delta
 
         except httpx.HTTPStatusError as e:
             logger.error(f"OpenAI API HTTP error: {e.response.status_code} - {e.response.text}")
             raise ValueError(f"OpenAI API error: {e.response.status_code}")
-        except Exception as e:
-            logger.error(f"Error calling OpenAI API: {e}", exc_info=True)
-            raise
 
     async def analyze_image(
         self,
         image_url: str,
-        prompt: Optional[str] = None
+        prompt: Optional[str] = None,
+        use_cache: bool = True
     ) -> str:
         """
         Analyze fashion image using GPT-4 Vision
 
+        Results are cached by model, prompt, image URL and parameters, and concurrent
+        requests for the same analysis share one API call.
+
         Args:
             image_url: URL of the image to analyze
             prompt: Optional custom prompt (uses default fashion analysis if not provided)
+            use_cache: Set to False to bypass the response cache
 
         Returns:
             AI analysis text
@@ -129,39 +381,30 @@ Be helpful, friendly, and provide specific fashion advice. When users describe w
         default_prompt = "Analyze this fashion image and describe the style, colors, patterns, and suggest similar items."
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.api_key}"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": prompt or default_prompt
-                                    },
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {
-                                            "url": image_url
-                                        }
+            return await self._cached_chat_completion(
+                {
+                    "messages": [
+                        {
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": prompt or default_prompt
+                                },
+                                {
+                                    "type": "image_url",
+                                    "image_url": {
+                                        "url": image_url
                                     }
-                                ]
-                            }
-                        ],
-                        "max_tokens": 500
-                    }
-                )
-
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
+                                }
+                            ]
+                        }
+                    ],
+                    "max_tokens": 500
+                },
+                operation="vision",
+                use_cache=use_cache
+            )
 
         except Exception as e:
             logger.error(f"Error analyzing image: {e}", exc_info=True)
@@ -170,7 +413,9 @@ Be helpful, friendly, and provide specific fashion advice. When users describe w
     async def generate_clothing_recommendations(
         self,
         preferences: Dict[str, Any],
-        google_search_service = None
+        google_search_service = None,
+        deadline: Optional[float] = None,
+        use_cache: bool = True
     ) -> List[Dict[str, Any]]:
         """
         Generate clothing recommendations based on preferences using Google Shopping
@@ -178,6 +423,8 @@ Be helpful, friendly, and provide specific fashion advice. When users describe w
         Args:
             preferences: Dictionary with user preferences (purpose, brands, price, size, etc.)
             google_search_service: Google search service to fetch real products
+            deadline: Seconds to wait for the product searches (default: RECOMMENDATIONS_SEARCH_DEADLINE)
+            use_cache: Set to False to bypass the response cache for the item-type prompt
 
         Returns:
             List of recommended clothing items from real stores
@@ -204,58 +451,76 @@ Item 4:
 Item 5:"""
 
         try:
-            # Get AI-generated clothing item types
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.api_key}"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": 0.8,
-                        "max_tokens": 100
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
-                items_text = data["choices"][0]["message"]["content"].strip()
-
-                # Parse the item types
-                item_types = []
-                for line in items_text.split('\n'):
-                    line = line.strip()
-                    # Remove "Item 1:", "1.", etc. prefixes
-                    if ':' in line:
-                        line = line.split(':', 1)[1].strip()
-                    elif line and line[0].isdigit():
-                        line = line.lstrip('0123456789.)-').strip()
-
-                    if line and len(line) > 3:
-                        item_types.append(line)
-
-                logger.info(f"AI-generated item types: {item_types}")
+            # Get AI-generated clothing item types (cached per prompt, i.e. per purpose, brand and price range)
+            items_text = (await self._cached_chat_completion(
+                {
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": 0.8,
+                    "max_tokens": 100
+                },
+                operation="recommendations",
+                use_cache=use_cache
+            )).strip()
+
+            # Parse the item types
+            item_types = []
+            for line in items_text.split('\n'):
+                line = line.strip()
+                # Remove "Item 1:", "1.", etc. prefixes
+                if ':' in line:
+                    line = line.split(':', 1)[1].strip()
+                elif line and line[0].isdigit():
+                    line = line.lstrip('0123456789.)-').strip()
+
+                if line and len(line) > 3:
+                    item_types.append(line)
+
+            logger.info(f"AI-generated item types: {item_types}")
 
             # Use Google Search to find real products for each item type
             all_results = []
             if google_search_service:
                 brand_filter = preferences.get('brands', '')
 
+                search_queries = []
                 for item_type in item_types[:5]:  # Take top 5 item types
                     # Build search query with brand and "men's"
                     if brand_filter and brand_filter.lower() != 'any':
-                        search_query = f"{brand_filter} men's {item_type}"
+                        search_queries.append(f"{brand_filter} men's {item_type}")
                     else:
-                        search_query = f"men's {item_type}"
-
-                    logger.info(f"Searching Google Shopping for: {search_query}")
-                    results = google_search_service.search_products(search_query, num_results=2)
-
-                    # Take the first result for this item type
-                    if results:
-                        all_results.append(results[0])
+                        search_queries.append(f"men's {item_type}")
+
+                # Search all item types concurrently; whatever has not arrived by the deadline is dropped
+                logger.info(f"Searching Google Shopping for: {search_queries}")
+                tasks = [
+                    asyncio.create_task(google_search_service.search_products(
+                        search_query,
+                        num_results=3,
+                        priority=PRIORITY_BATCH
+                    ))
+                    for search_query in search_queries
+                ]
+                done, pending = await asyncio.wait(tasks, timeout=deadline or self.search_deadline)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    logger.warning(f"{len(pending)} of {len(tasks)} product searches missed the deadline; returning partial results")
+
+                # Take the first result for each item type that was not already picked for another type
+                seen_links = set()
+                for search_query, task in zip(search_queries, tasks):
+                    if task not in done or task.cancelled():
+                        continue
+                    if task.exception():
+                        logger.warning(f"Product search for '{search_query}' failed: {task.exception()}")
+                        continue
+                    for result in task.result():
+                        link = result.get('link')
+                        if link and link in seen_links:
+                            continue
+                        seen_links.add(link)
+                        all_results.append(result)
+                        break
 
                 # Add unique IDs
                 for i, item in enumerate(all_results):
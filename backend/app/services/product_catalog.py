@@ -0,0 +1,237 @@
+"""Local full-text catalog of products seen in search results"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Column weights for bm25 ranking: name, description, brand
+RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+# Seconds between prunes of products no search has returned in max_age_days
+PRUNE_INTERVAL = 3600
+
+_PRICE_RE = re.compile(r"(\d[\d,]*(?:\.\d+)?)")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_LIKE_SPECIAL_RE = re.compile(r"[\\%_]")
+
+
+def parse_price(price: Optional[str]) -> Optional[float]:
+    """Extract the numeric amount from a formatted price such as "USD 49.99" or "$1,299"; None if there is none"""
+    if not price:
+        return None
+    match = _PRICE_RE.search(price)
+    if not match:
+        return None
+    try:
+        return float(match.group(1).replace(",", ""))
+    except ValueError:
+        return None
+
+
+class ProductCatalog:
+    """SQLite FTS5 index of formatted search results, upserted by product link"""
+
+    def __init__(self, path: Union[str, Path], max_age_days: Optional[float] = None):
+        """
+        Initialize the product catalog
+
+        Args:
+            path: SQLite file holding the catalog
+            max_age_days: Days a product is kept after Google last returned it; 0 keeps products
+                forever (reads PRODUCT_CATALOG_MAX_AGE_DAYS, default: 30)
+        """
+        self.path = Path(path)
+        self.max_age_days = max_age_days if max_age_days is not None else float(
+            os.getenv("PRODUCT_CATALOG_MAX_AGE_DAYS", "30")
+        )
+        self._last_prune = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Written from request handlers and background refreshes, so one connection is shared behind a lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        # Searches on one worker process must not wait for upserts on another
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                link TEXT NOT NULL UNIQUE,
+                name TEXT NOT NULL,
+                description TEXT NOT NULL,
+                image TEXT NOT NULL,
+                price TEXT NOT NULL,
+                amount REAL,
+                brand TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS products_amount ON products (amount);
+            CREATE INDEX IF NOT EXISTS products_updated_at ON products (updated_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, description, brand,
+                content='products', content_rowid='id', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, name, description, brand)
+                VALUES (new.id, new.name, new.description, new.brand);
+            END;
+            CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description, brand)
+                VALUES ('delete', old.id, old.name, old.description, old.brand);
+            END;
+            CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description, brand)
+                VALUES ('delete', old.id, old.name, old.description, old.brand);
+                INSERT INTO products_fts (rowid, name, description, brand)
+                VALUES (new.id, new.name, new.description, new.brand);
+            END;
+            """
+        )
+        self._db.commit()
+        self.prune()
+        logger.info(f"Product catalog initialized at {self.path} ({self.count()} products)")
+
+    def upsert(self, products: List[Dict[str, Any]]) -> int:
+        """
+        Insert or refresh products, keyed by link
+
+        Args:
+            products: Formatted search results (name, description, link, image, price, brand)
+
+        Returns:
+            Number of products written
+        """
+        now = time.time()
+        rows = [
+            (
+                p["link"],
+                p.get("name") or "",
+                p.get("description") or "",
+                p.get("image") or "",
+                p.get("price") or "N/A",
+                parse_price(p.get("price")),
+                p.get("brand") or "",
+                now
+            )
+            for p in products if p.get("link")
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.executemany(
+                """INSERT INTO products (link, name, description, image, price, amount, brand, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (link) DO UPDATE SET
+                    name = excluded.name,
+                    description = excluded.description,
+                    image = excluded.image,
+                    price = excluded.price,
+                    amount = excluded.amount,
+                    brand = excluded.brand,
+                    updated_at = excluded.updated_at""",
+                rows
+            )
+            self._db.commit()
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self.prune()
+        return len(rows)
+
+    def prune(self) -> int:
+        """
+        Delete products Google has not returned within max_age_days
+
+        Returns:
+            Number of products deleted
+        """
+        self._last_prune = time.time()
+        if self.max_age_days <= 0:
+            return 0
+        cutoff = self._last_prune - self.max_age_days * 86400
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM products WHERE updated_at < ?", (cutoff,)).rowcount
+            self._db.commit()
+        if deleted:
+            logger.info(f"Pruned {deleted} products older than {self.max_age_days:g} days from the catalog")
+        return deleted
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        brand: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ranked full-text search over the catalog
+
+        Every query word must match (as a prefix, after stemming); results are ordered by
+        bm25 with name matches weighted highest.
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of results
+            brand: Optional brand filter (case-insensitive substring; % and _ match literally)
+            min_price: Optional minimum price; products without a price are excluded
+            max_price: Optional maximum price; products without a price are excluded
+
+        Returns:
+            Products in the same format as Google search results
+        """
+        tokens = [t for t in _TOKEN_RE.findall(query.lower()) if len(t) > 1]
+        if not tokens:
+            return []
+
+        sql = [
+            "SELECT p.link, p.name, p.description, p.image, p.price, p.brand",
+            "FROM products_fts JOIN products p ON p.id = products_fts.rowid",
+            "WHERE products_fts MATCH ?",
+        ]
+        params: List[Any] = [" ".join(f'"{t}"*' for t in tokens)]
+        if brand:
+            sql.append("AND p.brand LIKE ? ESCAPE '\\'")
+            params.append("%" + _LIKE_SPECIAL_RE.sub(r"\\\g<0>", brand) + "%")
+        if min_price is not None:
+            sql.append("AND p.amount >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            sql.append("AND p.amount <= ?")
+            params.append(max_price)
+        sql.append(f"ORDER BY bm25(products_fts, {', '.join(str(w) for w in RANK_WEIGHTS)}) LIMIT ?")
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute("\n".join(sql), params).fetchall()
+
+        return [
+            {
+                "id": link,
+                "name": name,
+                "description": description,
+                "link": link,
+                "image": image,
+                "price": price,
+                "brand": brand_name,
+            }
+            for link, name, description, image, price, brand_name in rows
+        ]
+
+    def count(self) -> int:
+        """Number of products in the catalog"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Catalog size for health reporting"""
+        return {"products": self.count(), "path": str(self.path)}
+
+    def close(self):
+        """Close the SQLite connection"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,275 @@
+"""
+State shared by every worker process of the API
+
+With `uvicorn --workers N` each worker is a separate process with its own service singletons.
+Cache entries, try-on job status, rate-limit buckets and leases go through a shared-state
+backend instead, so a response computed by one worker is reused by the others, a job can be
+polled on any worker, and rate limits hold for the deployment rather than per process.
+
+The backend is chosen by SHARED_STATE_BACKEND:
+
+- `sqlite` (default): a SQLite database in WAL mode on local disk (SHARED_STATE_PATH). Readers
+  never block the writer and hot pages stay in the OS page cache, so no extra service is needed.
+- `none`: nothing is shared; each process keeps its own state, which suits a single worker.
+
+Another backend (e.g. Redis, for several hosts) implements the abstract methods of `SharedState`.
+The methods block on I/O; callers on the event loop run them with `asyncio.to_thread`.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from ..config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState(ABC):
+    """
+    Interface of a shared-state backend
+
+    Values are JSON-serializable. Timestamps are wall-clock (`time.time()`) so they are
+    comparable across processes.
+    """
+
+    name = "shared"
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        Look up an entry
+
+        Returns:
+            Tuple of (value, stored_at), or None if there is no entry
+        """
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, stored_at: Optional[float] = None):
+        """Store an entry, replacing any previous value"""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        """Remove an entry if it exists"""
+
+    @abstractmethod
+    def trim(self, namespace: str, keep: Optional[int], before: float) -> int:
+        """
+        Delete entries stored before `before`, then all but the newest `keep`
+
+        Returns:
+            Number of entries deleted
+        """
+
+    @abstractmethod
+    def take_token(self, bucket: str, rate: float, burst: int) -> float:
+        """
+        Take one token from a token bucket refilling at `rate` per second up to `burst`
+
+        Returns:
+            0 if a token was taken, otherwise seconds until one is available
+        """
+
+    @abstractmethod
+    def tokens(self, bucket: str, rate: float, burst: int) -> float:
+        """Tokens currently in a bucket, without taking one"""
+
+    @abstractmethod
+    def try_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """
+        Acquire or renew a lease, e.g. so only one worker runs a periodic task
+
+        Returns:
+            True if `holder` holds the lease for the next `ttl` seconds
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Backend name and entry counts for health reporting"""
+
+
+class SQLiteSharedState(SharedState):
+    """Shared state in a SQLite database in WAL mode, safe to open from several processes"""
+
+    name = "sqlite"
+
+    def __init__(self, path: Union[str, Path], busy_timeout: float = 5.0):
+        """
+        Open (and create if needed) the database
+
+        Args:
+            path: SQLite file shared by the worker processes
+            busy_timeout: Seconds to wait for another process's write transaction
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Autocommit; read-modify-write sequences take the write lock up front with BEGIN IMMEDIATE
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Durable across process crashes; only an OS crash can lose the last transactions
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS kv_age ON kv (namespace, stored_at);
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """
+        )
+        logger.info(f"Shared state at {self.path} (SQLite WAL)")
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, stored_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, namespace: str, key: str, value: Any, stored_at: Optional[float] = None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), stored_at if stored_at is not None else time.time())
+            )
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def trim(self, namespace: str, keep: Optional[int], before: float) -> int:
+        with self._lock, self._transaction():
+            deleted = self._db.execute(
+                "DELETE FROM kv WHERE namespace = ? AND stored_at < ?", (namespace, before)
+            ).rowcount
+            if keep is not None:
+                # Ordered by key within a timestamp, so entries written at the same instant are not all deleted
+                row = self._db.execute(
+                    "SELECT stored_at, key FROM kv WHERE namespace = ? ORDER BY stored_at DESC, key DESC LIMIT 1 OFFSET ?",
+                    (namespace, keep)
+                ).fetchone()
+                if row is not None:
+                    deleted += self._db.execute(
+                        "DELETE FROM kv WHERE namespace = ? AND (stored_at, key) <= (?, ?)", (namespace, *row)
+                    ).rowcount
+        return deleted
+
+    def take_token(self, bucket: str, rate: float, burst: int) -> float:
+        now = time.time()
+        with self._lock, self._transaction():
+            tokens = self._refilled(bucket, rate, burst, now)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (bucket, tokens, now)
+            )
+        return wait
+
+    def tokens(self, bucket: str, rate: float, burst: int) -> float:
+        with self._lock:
+            return self._refilled(bucket, rate, burst, time.time())
+
+    def try_lease(self, name: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock, self._transaction():
+            row = self._db.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != holder and row[1] > now:
+                return False
+            self._db.execute(
+                "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                (name, holder, now + ttl)
+            )
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db.execute("SELECT namespace, COUNT(*) FROM kv GROUP BY namespace").fetchall()
+        return {
+            "backend": self.name,
+            "path": str(self.path),
+            "entries": dict(rows),
+        }
+
+    def _refilled(self, bucket: str, rate: float, burst: int, now: float) -> float:
+        """Bucket level at `now` (caller holds the lock)"""
+        row = self._db.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (bucket,)).fetchone()
+        if row is None:
+            return float(burst)
+        return min(burst, row[0] + max(0.0, now - row[1]) * rate)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Write transaction holding the database lock from the first read (caller holds the lock)"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        else:
+            self._db.execute("COMMIT")
+
+
+BACKENDS = {
+    "sqlite": SQLiteSharedState,
+}
+
+# Singleton instance; None once initialized means nothing is shared (SHARED_STATE_BACKEND=none)
+_shared_state: Optional[SharedState] = None
+_initialized = False
+
+
+def initialize_shared_state(backend: Optional[str] = None, path: Optional[Union[str, Path]] = None) -> Optional[SharedState]:
+    """
+    Initialize the singleton shared-state backend
+
+    Args:
+        backend: Backend name (reads SHARED_STATE_BACKEND, default: sqlite); "none" to share nothing
+        path: Database file of the sqlite backend (reads SHARED_STATE_PATH, default: backend/.cache/shared_state.sqlite3)
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    global _shared_state, _initialized
+    if _initialized:
+        return _shared_state
+
+    backend = (backend or os.getenv("SHARED_STATE_BACKEND", "sqlite")).lower()
+    if backend == "none":
+        logger.info("Shared state disabled; caches, job status and rate limits are per process")
+    elif backend in BACKENDS:
+        _shared_state = BACKENDS[backend](path or os.getenv("SHARED_STATE_PATH") or CACHE_DIR / "shared_state.sqlite3")
+    else:
+        raise ValueError(f"Unknown SHARED_STATE_BACKEND '{backend}'; expected one of: {', '.join([*BACKENDS, 'none'])}")
+    _initialized = True
+    return _shared_state
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """Get the singleton shared-state backend, or None if state is not shared"""
+    return initialize_shared_state()
@@ -0,0 +1,145 @@
+"""
+Coalescing of identical concurrent upstream calls
+
+The first caller for a key (the leader) starts the call; callers arriving with the same key
+while it is in flight (followers) wait for the same outcome instead of calling the upstream
+again. Results and exceptions are delivered to every waiter. Nothing is remembered once the
+call finishes; caching results is left to the caller.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from .metrics import SINGLE_FLIGHT_CALLS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """An in-flight async call and the number of callers waiting on it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome with concurrent callers
+
+    `run` is for coroutines: the call runs as its own task, so a leader whose request is
+    cancelled (e.g. the client disconnected) does not fail the followers. The call is only
+    cancelled once every waiter has gone. `run_sync` is the blocking equivalent for worker
+    threads; a thread cannot be interrupted, so the leader always completes the call.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize the coalescing layer
+
+        Args:
+            name: Name used in logs and metrics, e.g. "search"
+        """
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self.cancelled = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._futures: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `func()`, or the identical call already in flight for `key`
+
+        Args:
+            key: Normalized identity of the call
+            func: Coroutine function making the upstream call; only invoked by the leader
+
+        Returns:
+            The call's result (the same object for every waiter; copy it before mutating)
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._finish(key, flight))
+            self._count("leader")
+        else:
+            self._count("follower")
+            logger.info(f"Coalesced {self.name} call with one already in flight")
+
+        flight.waiters += 1
+        try:
+            # The shield keeps one waiter's cancellation from cancelling the shared task
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.done():
+                raise
+            flight.waiters -= 1
+            if flight.waiters == 0:
+                # Nobody wants the result any more; later callers start a fresh call
+                self._finish(key, flight)
+                flight.task.cancel()
+                self.cancelled += 1
+                logger.info(f"Cancelled {self.name} call after its last waiter went away")
+            raise
+
+    def run_sync(self, key: Hashable, func: Callable[[], T]) -> T:
+        """
+        Call `func()`, or wait for the identical call already running in another thread
+
+        Args:
+            key: Normalized identity of the call
+            func: Blocking function making the upstream call; only invoked by the leader
+
+        Returns:
+            The call's result (the same object for every waiter; copy it before mutating)
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+        self._count("leader" if leader else "follower")
+
+        if not leader:
+            logger.info(f"Coalesced {self.name} call with one already in flight")
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls made, calls coalesced into them and calls abandoned by all their waiters"""
+        return {
+            "in_flight": len(self._flights) + len(self._futures),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "cancelled": self.cancelled,
+        }
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _count(self, role: str):
+        with self._lock:
+            if role == "leader":
+                self.leaders += 1
+            else:
+                self.followers += 1
+        SINGLE_FLIGHT_CALLS.inc(flight=self.name, role=role)
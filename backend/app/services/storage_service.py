@@ -0,0 +1,378 @@
+"""Size and age budgets for the upload, generated and variant directories"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from .shared_state import SharedState, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+# Full directory scans are expensive on large trees, so only every Nth sweep reconciles the index with the disk
+RECONCILE_EVERY = 12
+
+
+def shard_path(directory: Path, name: str) -> Path:
+    """Spread files named by a hex digest over 256 subdirectories (`ab/abcdef....png`)"""
+    return directory / name[:2] / name
+
+
+class StorageArea:
+    """One managed directory and its budgets"""
+
+    def __init__(self, name: str, directory: Path, max_bytes: int, max_age: float):
+        self.name = name
+        self.directory = Path(directory)
+        self.root = self.directory.resolve()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evictions = 0
+        self.bytes_evicted = 0
+
+
+class StorageManager:
+    """
+    Tracks every file in the managed directories in a SQLite access log and evicts the least
+    recently used unpinned files once a directory exceeds its size budget or a file exceeds
+    its idle-age budget
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        sweep_interval: Optional[float] = None,
+        grace: Optional[float] = None,
+        shared: Optional[SharedState] = None
+    ):
+        """
+        Initialize the storage manager
+
+        Args:
+            index_path: SQLite file holding the access log
+            sweep_interval: Seconds between background sweeps (reads STORAGE_SWEEP_INTERVAL, default: 300)
+            grace: Seconds after last access during which a file is never evicted, so inputs of
+                queued or running jobs stay in place (reads STORAGE_EVICTION_GRACE, default: 900)
+            shared: Optional shared-state backend electing the one worker process that sweeps
+        """
+        self.index_path = Path(index_path)
+        self.sweep_interval = sweep_interval or float(os.getenv("STORAGE_SWEEP_INTERVAL", "300"))
+        self.grace = grace if grace is not None else float(os.getenv("STORAGE_EVICTION_GRACE", "900"))
+        self.areas: Dict[str, StorageArea] = {}
+        self.shared = shared
+        self._holder = f"{os.getpid()}-{id(self)}"
+
+        self.sweeps = 0
+        self.last_sweep_at: Optional[float] = None
+        self.last_sweep_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Reads are recorded in memory and written in bulk by the sweeper thread
+        self._pending_access: Dict[Tuple[str, str], float] = {}
+        self._access_lock = threading.Lock()
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        # Every worker process records accesses in the same index
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                area TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                pinned INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (area, path)
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_lru ON files (area, pinned, last_access)")
+        self._db.commit()
+
+    def add_area(self, name: str, directory: Path, max_mb: float, max_age_days: float):
+        """
+        Put a directory under management
+
+        Args:
+            name: Area name, also the directory name under /files
+            directory: Directory to manage
+            max_mb: Size budget in megabytes (0 for unlimited)
+            max_age_days: Files not accessed for this many days are deleted (0 for no limit)
+        """
+        self.areas[name] = StorageArea(name, directory, int(max_mb * 1024 * 1024), max_age_days * 86400)
+        logger.info(
+            f"Storage area '{name}' at {directory}: "
+            f"budget {max_mb:g} MB, max idle age {max_age_days:g} days"
+        )
+
+    def track(self, area: str, path: Union[str, Path]):
+        """Record a file that was just written"""
+        relative = self._relative(area, path)
+        size = Path(path).stat().st_size
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                """INSERT INTO files (area, path, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (area, path) DO UPDATE SET size = excluded.size, last_access = excluded.last_access""",
+                (area, relative, size, now, now)
+            )
+            self._db.commit()
+
+    def touch(self, area: str, path: Union[str, Path]):
+        """Record a read; cheap enough to call on every request"""
+        try:
+            key = (area, self._relative(area, path))
+        except ValueError:
+            return
+        with self._access_lock:
+            self._pending_access[key] = time.time()
+
+    def pin(self, area: str, path: Union[str, Path]) -> bool:
+        """
+        Exempt a file from eviction (e.g. a result the user saved)
+
+        Returns:
+            False if the file does not exist
+        """
+        return self._set_pinned(area, path, True)
+
+    def unpin(self, area: str, path: Union[str, Path]) -> bool:
+        """Make a pinned file evictable again; False if the file does not exist"""
+        return self._set_pinned(area, path, False)
+
+    def resolve(self, url: str) -> Tuple[str, Path]:
+        """
+        Map a public /files URL to its area and path
+
+        Raises:
+            ValueError: If the URL is not inside a managed area
+        """
+        parts = url.split("?", 1)[0].split("/files/", 1)
+        if len(parts) != 2 or "/" not in parts[1]:
+            raise ValueError(f"Not a managed file URL: {url}")
+        name, relative = parts[1].split("/", 1)
+        if name not in self.areas:
+            raise ValueError(f"Not a managed file URL: {url}")
+        path = (self.areas[name].root / relative).resolve()
+        if not path.is_relative_to(self.areas[name].root):
+            raise ValueError(f"Not a managed file URL: {url}")
+        return name, path
+
+    async def start(self):
+        """Start the background sweeper; must be called from the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweeper())
+            logger.info(f"Storage sweeper started (interval: {self.sweep_interval:g}s)")
+
+    async def stop(self):
+        """Stop the sweeper and persist pending access times"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._flush_access()
+
+    def sweep(self) -> Dict[str, Any]:
+        """
+        Enforce the budgets of every area once
+
+        Returns:
+            Files and bytes evicted per area
+        """
+        started = time.perf_counter()
+        self._flush_access()
+        reconcile = self.sweeps % RECONCILE_EVERY == 0
+        result = {}
+        for area in self.areas.values():
+            if reconcile:
+                self._reconcile(area)
+            result[area.name] = self._enforce(area)
+
+        self.sweeps += 1
+        self.last_sweep_at = time.time()
+        self.last_sweep_seconds = round(time.perf_counter() - started, 3)
+        evicted = sum(r["files"] for r in result.values())
+        if evicted:
+            logger.info(f"Storage sweep evicted {evicted} files in {self.last_sweep_seconds}s: {result}")
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Bytes stored, evictions and sweep timing per area"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT area, COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(pinned), 0) FROM files GROUP BY area"
+            ).fetchall()
+        usage = {area: (files, size, pinned) for area, files, size, pinned in rows}
+        areas = {}
+        for area in self.areas.values():
+            files, size, pinned = usage.get(area.name, (0, 0, 0))
+            areas[area.name] = {
+                "files": files,
+                "bytes": size,
+                "max_bytes": area.max_bytes or None,
+                "pinned": pinned,
+                "evictions": area.evictions,
+                "bytes_evicted": area.bytes_evicted,
+            }
+        return {
+            "areas": areas,
+            "sweeps": self.sweeps,
+            "last_sweep_at": self.last_sweep_at,
+            "last_sweep_seconds": self.last_sweep_seconds,
+        }
+
+    async def _sweeper(self):
+        """
+        Sweep immediately, then every sweep_interval seconds, off the event loop
+
+        With several worker processes only the holder of the sweep lease enforces the budgets;
+        the others just write their buffered access times.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self._sweep_if_leader)
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {e}", exc_info=True)
+            await asyncio.sleep(self.sweep_interval)
+
+    def _sweep_if_leader(self):
+        """Sweep if this process holds (or takes over) the sweep lease, otherwise only flush access times"""
+        if self.shared is None or self.shared.try_lease("storage_sweep", self._holder, 2 * self.sweep_interval):
+            self.sweep()
+        else:
+            self._flush_access()
+
+    def _relative(self, area: str, path: Union[str, Path]) -> str:
+        return Path(path).resolve().relative_to(self.areas[area].root).as_posix()
+
+    def _set_pinned(self, area: str, path: Union[str, Path], pinned: bool) -> bool:
+        path = Path(path)
+        if not path.is_file():
+            return False
+        self.track(area, path)
+        with self._lock:
+            self._db.execute(
+                "UPDATE files SET pinned = ? WHERE area = ? AND path = ?",
+                (int(pinned), area, self._relative(area, path))
+            )
+            self._db.commit()
+        return True
+
+    def _flush_access(self):
+        """Write buffered access times to the log"""
+        with self._access_lock:
+            pending, self._pending_access = self._pending_access, {}
+        if not pending:
+            return
+        with self._lock:
+            self._db.executemany(
+                "UPDATE files SET last_access = MAX(last_access, ?) WHERE area = ? AND path = ?",
+                [(at, area, path) for (area, path), at in pending.items()]
+            )
+            self._db.commit()
+
+    def _reconcile(self, area: StorageArea):
+        """Index files written outside the manager and forget entries whose file is gone"""
+        on_disk = {}
+        for dirpath, dirnames, filenames in os.walk(area.directory):
+            # Hidden directories hold in-progress writes
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                full = Path(dirpath) / filename
+                try:
+                    stat = full.stat()
+                except FileNotFoundError:
+                    continue
+                on_disk[full.relative_to(area.directory).as_posix()] = (stat.st_size, stat.st_mtime)
+
+        with self._lock:
+            indexed = {row[0] for row in self._db.execute("SELECT path FROM files WHERE area = ?", (area.name,))}
+            missing = [(area.name, path) for path in indexed - on_disk.keys()]
+            added = [
+                (area.name, path, size, mtime, mtime)
+                for path, (size, mtime) in on_disk.items() if path not in indexed
+            ]
+            self._db.executemany("DELETE FROM files WHERE area = ? AND path = ?", missing)
+            self._db.executemany(
+                "INSERT INTO files (area, path, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                added
+            )
+            self._db.commit()
+        if missing or added:
+            logger.info(f"Storage area '{area.name}' reconciled: {len(added)} files indexed, {len(missing)} forgotten")
+
+    def _enforce(self, area: StorageArea) -> Dict[str, int]:
+        """Delete idle files past the age budget, then least recently used files until under the size budget"""
+        now = time.time()
+        evictable = now - self.grace
+        victims = []
+        with self._lock:
+            if area.max_age:
+                victims.extend(self._db.execute(
+                    "SELECT path, size FROM files WHERE area = ? AND pinned = 0 AND last_access < ?",
+                    (area.name, min(now - area.max_age, evictable))
+                ).fetchall())
+
+            if area.max_bytes:
+                expired = {path for path, _ in victims}
+                total = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM files WHERE area = ?", (area.name,)
+                ).fetchone()[0] - sum(size for _, size in victims)
+                if total > area.max_bytes:
+                    for path, size in self._db.execute(
+                        "SELECT path, size FROM files WHERE area = ? AND pinned = 0 AND last_access < ? ORDER BY last_access",
+                        (area.name, evictable)
+                    ):
+                        if total <= area.max_bytes:
+                            break
+                        if path in expired:
+                            continue
+                        victims.append((path, size))
+                        total -= size
+
+            for path, size in victims:
+                full = area.directory / path
+                full.unlink(missing_ok=True)
+                # Drop shard directories once they are empty
+                parent = full.parent
+                while parent != area.directory:
+                    try:
+                        parent.rmdir()
+                    except OSError:
+                        break
+                    parent = parent.parent
+            self._db.executemany(
+                "DELETE FROM files WHERE area = ? AND path = ?",
+                [(area.name, path) for path, _ in victims]
+            )
+            self._db.commit()
+
+        freed = sum(size for _, size in victims)
+        area.evictions += len(victims)
+        area.bytes_evicted += freed
+        return {"files": len(victims), "bytes": freed}
+
+
+# Singleton instance
+_storage_manager = None
+
+
+def initialize_storage_manager(index_path: Path) -> StorageManager:
+    """Initialize the singleton storage manager instance."""
+    global _storage_manager
+    if _storage_manager is None:
+        _storage_manager = StorageManager(index_path, shared=get_shared_state())
+    return _storage_manager
+
+
+def get_storage_manager() -> StorageManager:
+    """Get singleton storage manager instance"""
+    if _storage_manager is None:
+        raise RuntimeError("Storage manager has not been initialized")
+    return _storage_manager
@@ -0,0 +1,140 @@
+"""Content-addressed on-disk cache for deterministic try-on results"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from .metrics import timed
+from .storage_service import StorageManager, get_storage_manager, shard_path
+
+logger = logging.getLogger(__name__)
+
+STORAGE_AREA = "generated"
+
+
+class TryOnResultCache:
+    """
+    Cache of generated try-on images, keyed by a hash of the inputs and parameters
+
+    Results live at generated/<key[:2]>/<key>.png, so a lookup is a single stat. Size and age
+    budgets and LRU eviction are handled by the storage manager's "generated" area.
+    """
+
+    def __init__(self, directory: Path, storage: Optional[StorageManager] = None):
+        """
+        Initialize the try-on result cache
+
+        Args:
+            directory: Directory the cached result images are written to (served under /files/generated)
+            storage: Storage manager tracking access to the results (default: the shared instance)
+        """
+        self.directory = Path(directory)
+        self.storage = storage or get_storage_manager()
+        self.hits = 0
+        self.misses = 0
+
+        self.incoming = self.directory / ".incoming"
+        self.incoming.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Try-on result cache initialized at {self.directory}")
+
+    @staticmethod
+    def make_key(
+        person_digest: str,
+        garment_digest: str,
+        **params: Any
+    ) -> str:
+        """
+        Build the cache key for a try-on request
+
+        Args:
+            person_digest: SHA-256 of the person image bytes (the upload store id)
+            garment_digest: SHA-256 of the garment image bytes (the upload store id)
+            **params: Generation parameters (garment_description, auto_mask, auto_crop, denoise_steps, seed)
+
+        Returns:
+            Hex digest identifying the request
+        """
+        key = hashlib.sha256()
+        key.update(person_digest.encode())
+        key.update(garment_digest.encode())
+        key.update(json.dumps(params, sort_keys=True).encode())
+        return key.hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        """Sharded location of the result image for a key"""
+        return shard_path(self.directory, f"{key}.png")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached result
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            Path of the cached image relative to the cache directory, or None on a miss
+        """
+        path = self.path_for(key)
+        if not path.exists():
+            self.misses += 1
+            return None
+
+        self.storage.touch(STORAGE_AREA, path)
+        self.hits += 1
+        return path.relative_to(self.directory).as_posix()
+
+    def put(self, key: str, source: Union[str, Path]) -> str:
+        """
+        Store a generated image in the cache
+
+        Args:
+            key: Cache key from make_key
+            source: Path to the generated image
+
+        Returns:
+            Path of the cached image relative to the cache directory
+        """
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Copy next to the destination and publish atomically so readers never see a partial file
+        tmp = self.incoming / f"{uuid.uuid4().hex}.png"
+        with timed("result_copy"):
+            try:
+                shutil.copy(source, tmp)
+                os.replace(tmp, path)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+        self.storage.track(STORAGE_AREA, path)
+        return path.relative_to(self.directory).as_posix()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+# Singleton instance
+_tryon_result_cache = None
+
+
+def initialize_tryon_result_cache(directory: Path):
+    """Initialize the singleton cache instance."""
+    global _tryon_result_cache
+    if _tryon_result_cache is None:
+        _tryon_result_cache = TryOnResultCache(directory)
+
+
+def get_tryon_result_cache() -> TryOnResultCache:
+    """Get singleton try-on result cache instance"""
+    if _tryon_result_cache is None:
+        raise RuntimeError("Try-on result cache has not been initialized")
+    return _tryon_result_cache
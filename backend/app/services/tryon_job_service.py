@@ -0,0 +1,332 @@
+"""Background job queue for virtual try-on requests"""
+import asyncio
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .admission import PRIORITY_INTERACTIVE, UpstreamBusyError
+from .idm_vton_service import get_idm_vton_service
+from .metrics import ADMISSION_REJECTIONS
+from .shared_state import SharedState, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Shared-state namespace holding the status of every worker's jobs
+SHARED_NAMESPACE = "tryon_jobs"
+
+# Assumed try-on duration until one has been measured
+DEFAULT_JOB_SECONDS = 30.0
+
+# Headroom over the longest possible try-on for writing the result
+JOB_TIMEOUT_MARGIN = 30.0
+
+
+class QueueFullError(UpstreamBusyError):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class WorkersStalledError(UpstreamBusyError):
+    """Raised when a job is submitted while too many timed-out try-ons still hold their threads"""
+
+
+class TryOnJob:
+    """A single unit of try-on work and its current status"""
+
+    def __init__(self, func: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.priority = priority
+        self.status = JOB_QUEUED
+        self.result: Optional[Any] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    async def wait(self) -> "TryOnJob":
+        """Wait until the job is done or failed"""
+        await self._done.wait()
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public representation returned by the job status API"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class TryOnJobQueue:
+    """
+    Bounded priority queue of try-on jobs drained by a pool of workers off the event loop
+
+    Interactive jobs are started before batch jobs; jobs of equal priority run in submission order.
+    Job status is published to the shared state, so a job can be polled on any worker process.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue_size: Optional[int] = None,
+        job_timeout: Optional[float] = None,
+        result_ttl: Optional[float] = None,
+        shared: Optional[SharedState] = None,
+        max_job_duration: float = 0.0,
+        max_orphaned: Optional[int] = None
+    ):
+        """
+        Initialize the try-on job queue
+
+        Args:
+            workers: Number of concurrent try-on workers (reads TRYON_WORKERS, default: 2)
+            max_queue_size: Maximum number of waiting jobs (reads TRYON_QUEUE_SIZE, default: 32)
+            job_timeout: Seconds before a running job is failed (reads TRYON_JOB_TIMEOUT, default:
+                max_job_duration, else 180)
+            result_ttl: Seconds finished jobs stay queryable (reads TRYON_JOB_TTL, default: 3600)
+            shared: Optional shared-state backend the job status is published to
+            max_job_duration: Longest a job can legitimately take, e.g. a try-on failing over
+                across every backend; a shorter timeout is kept but logged
+            max_orphaned: Timed-out jobs whose threads may still be running before new jobs are
+                rejected (reads TRYON_MAX_ORPHANED_THREADS, default: workers)
+        """
+        self.workers = workers or int(os.getenv("TRYON_WORKERS", "2"))
+        self.max_queue_size = max_queue_size or int(os.getenv("TRYON_QUEUE_SIZE", "32"))
+        self.job_timeout = job_timeout or float(os.getenv("TRYON_JOB_TIMEOUT", "0")) or max_job_duration or 180.0
+        if self.job_timeout < max_job_duration:
+            logger.warning(
+                f"Try-on job timeout {self.job_timeout:g}s is shorter than a try-on failing over across every "
+                f"backend can take ({max_job_duration:g}s); such jobs will fail before failover finishes"
+            )
+        self.max_orphaned = max_orphaned or int(os.getenv("TRYON_MAX_ORPHANED_THREADS", "0")) or self.workers
+        self.result_ttl = result_ttl or float(os.getenv("TRYON_JOB_TTL", "3600"))
+        self.shared = shared
+        # Status writes run in order on one thread so the event loop never waits on the database
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tryon-status") if shared is not None else None
+
+        self.rejected = 0
+        self.orphaned = 0
+        self._orphan_lock = threading.Lock()
+        self.avg_job_seconds: Optional[float] = None
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: Dict[str, TryOnJob] = {}
+
+    async def start(self):
+        """Start the worker pool; must be called from the running event loop"""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queue_size)
+        # The blocking Gradio call holds its thread for the whole job, and a timed-out job keeps
+        # its thread until the call returns; submit() stops accepting jobs once max_orphaned
+        # threads are held that way, so the extra threads always leave one per worker
+        self._executor = ThreadPoolExecutor(max_workers=self.workers + self.max_orphaned, thread_name_prefix="tryon")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(
+            f"Try-on job queue started with {self.workers} workers "
+            f"(queue size: {self.max_queue_size}, timeout: {self.job_timeout}s)"
+        )
+
+    async def stop(self):
+        """Cancel the workers and release the thread pool"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        logger.info("Try-on job queue stopped")
+
+    def submit(self, func: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE) -> TryOnJob:
+        """
+        Enqueue a blocking try-on callable
+
+        Args:
+            func: Zero-argument callable performing the try-on; its return value becomes the job result
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: If the queue is at capacity; carries the estimated seconds until it has room
+            WorkersStalledError: If max_orphaned timed-out jobs are still holding their threads
+        """
+        if self._queue is None:
+            raise RuntimeError("Try-on job queue has not been started")
+
+        self._prune()
+        if self.orphaned >= self.max_orphaned:
+            self.rejected += 1
+            ADMISSION_REJECTIONS.inc(upstream="tryon_queue", reason="stalled")
+            raise WorkersStalledError(
+                f"{self.orphaned} timed-out try-ons are still running; retry in {self.job_timeout:.0f}s",
+                math.ceil(self.job_timeout)
+            )
+        job = TryOnJob(func, priority)
+        try:
+            self._queue.put_nowait((priority, next(self._sequence), job))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            ADMISSION_REJECTIONS.inc(upstream="tryon_queue", reason="queue_full")
+            retry_after = self.retry_after()
+            raise QueueFullError(
+                f"Try-on queue is full ({self.max_queue_size} jobs waiting); retry in {retry_after}s",
+                retry_after
+            )
+
+        self._jobs[job.id] = job
+        self._publish(job)
+        logger.info(f"Queued try-on job {job.id} (queue depth: {self._queue.qsize()})")
+        return job
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a queue slot frees, i.e. until the next running job finishes"""
+        job_seconds = self.avg_job_seconds if self.avg_job_seconds is not None else DEFAULT_JOB_SECONDS
+        return max(1, math.ceil(job_seconds / self.workers))
+
+    def get(self, job_id: str) -> Optional[TryOnJob]:
+        """Look up a job submitted to this process by id"""
+        return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Public representation of a job submitted to any worker process
+
+        Jobs of other processes are read from the shared state, which blocks; call from a thread.
+
+        Returns:
+            The job's `to_dict()`, or None if the job is unknown or has expired
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.shared is not None:
+            entry = self.shared.get(SHARED_NAMESPACE, job_id)
+            if entry is not None:
+                return entry[0]
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, job counts and rejections for health reporting"""
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {
+            "workers": self.workers,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queued_batch": sum(1 for job in self._jobs.values() if job.status == JOB_QUEUED and job.priority != PRIORITY_INTERACTIVE),
+            "jobs": counts,
+            "rejected": self.rejected,
+            "orphaned_threads": self.orphaned,
+            "avg_job_s": round(self.avg_job_seconds, 2) if self.avg_job_seconds is not None else None,
+        }
+
+    async def _worker(self, worker_id: int):
+        """Drain the queue, running each job in the thread pool"""
+        while True:
+            _, _, job = await self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            self._publish(job)
+            future = self._executor.submit(job.func)
+            try:
+                job.result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.job_timeout)
+                job.status = JOB_DONE
+                elapsed = time.time() - job.started_at
+                self.avg_job_seconds = elapsed if self.avg_job_seconds is None else 0.8 * self.avg_job_seconds + 0.2 * elapsed
+                logger.info(f"Try-on job {job.id} completed on worker {worker_id}")
+            except asyncio.TimeoutError:
+                # A call still waiting for a thread is dropped; a running one cannot be
+                # interrupted, so it finishes in the background
+                if not future.cancel() and not future.done():
+                    with self._orphan_lock:
+                        self.orphaned += 1
+                    future.add_done_callback(self._thread_finished)
+                job.status = JOB_FAILED
+                job.error = f"Try-on timed out after {self.job_timeout:.0f}s"
+                logger.error(f"Try-on job {job.id} timed out")
+            except asyncio.CancelledError:
+                job.status = JOB_FAILED
+                job.error = "Try-on job was cancelled"
+                raise
+            except Exception as e:
+                job.status = JOB_FAILED
+                job.error = str(e)
+                logger.error(f"Try-on job {job.id} failed: {e}", exc_info=True)
+            finally:
+                job.finished_at = time.time()
+                job.func = None
+                self._publish(job)
+                job._done.set()
+                self._queue.task_done()
+
+    def _thread_finished(self, _future):
+        """Done callback of a timed-out job's call; runs on the thread that made it"""
+        with self._orphan_lock:
+            self.orphaned -= 1
+        logger.info("Thread of a timed-out try-on job finished")
+
+    def _prune(self):
+        """Forget finished jobs older than the result TTL"""
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self._publisher is not None:
+            self._publisher.submit(self.shared.trim, SHARED_NAMESPACE, None, cutoff)
+
+    def _publish(self, job: TryOnJob):
+        """Queue a write of the job's current status to the shared state"""
+        if self._publisher is not None:
+            self._publisher.submit(self._write_status, job.id, job.to_dict())
+
+    def _write_status(self, job_id: str, status: Dict[str, Any]):
+        try:
+            self.shared.set(SHARED_NAMESPACE, job_id, status)
+        except Exception as e:
+            # Polling on this worker still works from memory
+            logger.warning(f"Could not publish try-on job {job_id} status: {e}")
+
+
+# Singleton instance
+_tryon_job_queue = None
+
+
+def get_tryon_job_queue() -> TryOnJobQueue:
+    """Get singleton try-on job queue instance"""
+    global _tryon_job_queue
+    if _tryon_job_queue is None:
+        _tryon_job_queue = TryOnJobQueue(
+            shared=get_shared_state(),
+            max_job_duration=get_idm_vton_service().max_duration() + JOB_TIMEOUT_MARGIN
+        )
+    return _tryon_job_queue
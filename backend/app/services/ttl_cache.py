@@ -0,0 +1,149 @@
+"""Size-bounded LRU cache with TTL, stale-while-revalidate and optional shared or persistent storage"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from .shared_state import SharedState, SQLiteSharedState
+
+logger = logging.getLogger(__name__)
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+# Writes between trims of the shared store to maxsize and the servable age
+_TRIM_INTERVAL = 100
+
+
+class TTLCache:
+    """
+    LRU cache whose entries are fresh for `ttl` seconds and may then be served
+    stale for another `stale_ttl` seconds while the caller refreshes them.
+
+    With a store (a shared-state backend, or a SQLite file of its own), entries are written
+    through to it and looked up there on a local miss, so they survive restarts and are shared
+    by every worker process. A stale local entry is also checked against the store in case
+    another worker has refreshed it. Values must then be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        path: Optional[Union[str, Path]] = None,
+        name: str = "cache",
+        shared: Optional[SharedState] = None,
+        namespace: Optional[str] = None
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Seconds an entry is fresh
+            stale_ttl: Seconds after expiry during which the entry can still be served stale
+            path: Optional SQLite file of its own to persist and share entries (takes precedence over `shared`)
+            name: Name used in logs
+            shared: Optional shared-state backend to persist and share entries
+            namespace: Key prefix in the store (default: `name`)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.namespace = namespace or name
+        self.store = SQLiteSharedState(path) if path else shared
+
+    async def get(self, key: str) -> Tuple[Optional[Any], str]:
+        """
+        Look up a value; the store is only read on a local miss or stale hit, off the event loop
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Tuple of (value, state) where state is "fresh", "stale" or "miss"
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if self.store is not None and (entry is None or now - entry[1] >= self.ttl):
+            # Another worker may have stored or refreshed it
+            shared = await asyncio.to_thread(self.store.get, self.namespace, key)
+            if shared is not None and (entry is None or shared[1] > entry[1]):
+                entry = shared
+                with self._lock:
+                    self._entries[key] = shared
+                    self._evict()
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+
+            value, stored_at = entry
+            age = now - stored_at
+            if age >= self.ttl + self.stale_ttl:
+                # Expired entries are dropped from the store by the periodic trim
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None, MISS
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            if age >= self.ttl:
+                self.stale_hits += 1
+                return value, STALE
+            self.hits += 1
+            return value, FRESH
+
+    async def set(self, key: str, value: Any):
+        """Store a value, evicting the least recently used entries beyond maxsize; the store is written off the event loop"""
+        stored_at = time.time()
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            self._evict()
+            self._writes += 1
+            trim = self._writes % _TRIM_INTERVAL == 0
+        if self.store is not None:
+            await asyncio.to_thread(self._write, key, value, stored_at, trim)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and hit/miss counters"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else None,
+        }
+
+    def _evict(self):
+        """Drop the least recently used local entries beyond maxsize (caller holds the lock)"""
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _write(self, key: str, value: Any, stored_at: float, trim: bool):
+        """Write an entry through to the store and, every _TRIM_INTERVAL writes, bound the store's size"""
+        self.store.set(self.namespace, key, value, stored_at)
+        if trim:
+            self.store.trim(self.namespace, self.maxsize, stored_at - (self.ttl + self.stale_ttl))
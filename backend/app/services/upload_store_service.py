@@ -0,0 +1,196 @@
+"""Content-addressed store for uploaded images"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+from .image_preprocessing_service import ImagePreprocessor, ImageTooLargeError, get_image_preprocessor
+from .image_sniffing import HEAD_SIZE, sniff_image
+from .storage_service import StorageManager, get_storage_manager
+
+logger = logging.getLogger(__name__)
+
+STORAGE_AREA = "uploads"
+
+_CHUNK_SIZE = 1024 * 1024
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the byte or pixel limit"""
+
+
+class UploadStore:
+    """Stores each distinct uploaded image once, normalized for the try-on model and named by its SHA-256 digest"""
+
+    def __init__(
+        self,
+        directory: Path,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        storage: Optional[StorageManager] = None
+    ):
+        """
+        Initialize the upload store
+
+        Args:
+            directory: Root directory for stored images (served under /files/uploads)
+            preprocessor: Preprocessor used to normalize new images (default: the shared instance)
+            storage: Storage manager tracking access to stored images (default: the shared instance)
+        """
+        self.directory = Path(directory)
+        self.preprocessor = preprocessor or get_image_preprocessor()
+        self.storage = storage or get_storage_manager()
+        self.max_bytes = int(float(os.getenv("UPLOAD_MAX_MB", "20")) * 1024 * 1024)
+        self.max_pixels = int(float(os.getenv("UPLOAD_MAX_MEGAPIXELS", "40")) * 1_000_000)
+        # Uploads up to this size are hashed and decoded in memory; larger ones are spooled to disk
+        self.memory_max_bytes = int(float(os.getenv("UPLOAD_MEMORY_MAX_MB", "8")) * 1024 * 1024)
+        self.incoming = self.directory / ".incoming"
+        self.incoming.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str) -> Path:
+        """Sharded location of the normalized image for a digest"""
+        return self.directory / digest[:2] / digest[2:4] / f"{digest}.jpg"
+
+    def url_for(self, digest: str) -> str:
+        """Public URL of the normalized image for a digest"""
+        return "/files/" + self.path_for(digest).relative_to(self.directory.parent).as_posix()
+
+    def get(self, digest: str) -> Optional[Path]:
+        """
+        Look up a previously stored image
+
+        Args:
+            digest: Image id returned by save
+
+        Returns:
+            Path to the normalized image, or None if no such image is stored
+        """
+        if not _DIGEST_RE.match(digest or ""):
+            return None
+        path = self.path_for(digest)
+        if not path.exists():
+            return None
+        self.storage.touch(STORAGE_AREA, path)
+        return path
+
+    async def save(self, fileobj: BinaryIO, filename: str) -> Tuple[str, Path]:
+        """
+        Store an uploaded image, validating and hashing it while it is received
+
+        The format and dimensions are sniffed from the first bytes, so non-images and images
+        over the pixel limit are rejected before the rest is read. The byte limit is enforced
+        as the stream is read. Uploads up to UPLOAD_MEMORY_MAX_MB are decoded from memory;
+        larger ones are spooled to a temp file first.
+
+        Args:
+            fileobj: Readable binary stream with the upload contents
+            filename: Original filename, used for logging and error messages
+
+        Returns:
+            Tuple of (digest, path to the normalized image)
+
+        Raises:
+            UploadTooLargeError: If the upload exceeds UPLOAD_MAX_MB or UPLOAD_MAX_MEGAPIXELS
+            ValueError: If the file is not a readable image
+        """
+        temp_path = self.incoming / uuid.uuid4().hex
+        normalized_path = temp_path.with_suffix(".jpg")
+        try:
+            # Reading the spooled upload and hashing it block, so they run off the event loop
+            image_id, content, size, image_format = await asyncio.to_thread(self._receive, fileobj, filename, temp_path)
+
+            stored_path = self.path_for(image_id)
+            if stored_path.exists():
+                logger.info(f"Upload {filename} already stored as {image_id}")
+                self.storage.touch(STORAGE_AREA, stored_path)
+                return image_id, stored_path
+
+            try:
+                await self.preprocessor.normalize(
+                    content if content is not None else temp_path,
+                    normalized_path,
+                    max_pixels=self.max_pixels
+                )
+            except ImageTooLargeError:
+                raise UploadTooLargeError(f"Image {filename} exceeds the {self.max_pixels / 1e6:g} megapixel limit")
+            except ValueError:
+                logger.error(f"Failed to normalize {filename} ({image_format}, {size} bytes).", exc_info=True)
+                raise ValueError(f"Invalid or unsupported image file: {filename}")
+
+            await asyncio.to_thread(self._publish, normalized_path, stored_path)
+            logger.info(f"Stored upload {filename} as {image_id}")
+            return image_id, stored_path
+        finally:
+            temp_path.unlink(missing_ok=True)
+            normalized_path.unlink(missing_ok=True)
+
+    def _receive(self, fileobj: BinaryIO, filename: str, temp_path: Path) -> Tuple[str, Optional[bytes], int, str]:
+        """
+        Validate, hash and buffer an upload; blocking
+
+        Returns:
+            Tuple of (digest, contents or None if spooled to temp_path, size in bytes, format)
+        """
+        head = fileobj.read(HEAD_SIZE)
+        try:
+            image_format, dimensions = sniff_image(head)
+        except ValueError as e:
+            raise ValueError(f"Invalid or unsupported image file: {filename} ({e})")
+        if dimensions and dimensions[0] * dimensions[1] > self.max_pixels:
+            raise UploadTooLargeError(
+                f"Image {filename} is {dimensions[0]}x{dimensions[1]}; "
+                f"the limit is {self.max_pixels / 1e6:g} megapixels"
+            )
+
+        digest = hashlib.sha256(head)
+        size = len(head)
+        buffer = bytearray(head)
+        spool: Optional[BinaryIO] = None
+        try:
+            for chunk in iter(lambda: fileobj.read(_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UploadTooLargeError(
+                        f"Image {filename} exceeds the {self.max_bytes / 1024 / 1024:g} MB upload limit"
+                    )
+                digest.update(chunk)
+                if spool is None and size > self.memory_max_bytes:
+                    spool = open(temp_path, "wb")
+                    spool.write(buffer)
+                    buffer = bytearray()
+                if spool is None:
+                    buffer += chunk
+                else:
+                    spool.write(chunk)
+        finally:
+            if spool is not None:
+                spool.close()
+        return digest.hexdigest(), bytes(buffer) if spool is None else None, size, image_format
+
+    def _publish(self, normalized_path: Path, stored_path: Path):
+        """Move a normalized image into place atomically, so concurrent readers never see a partial file"""
+        stored_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(normalized_path, stored_path)
+        self.storage.track(STORAGE_AREA, stored_path)
+
+
+# Singleton instance
+_upload_store = None
+
+
+def initialize_upload_store(directory: Path):
+    """Initialize the singleton store instance."""
+    global _upload_store
+    if _upload_store is None:
+        _upload_store = UploadStore(directory)
+
+
+def get_upload_store() -> UploadStore:
+    """Get singleton upload store instance"""
+    if _upload_store is None:
+        raise RuntimeError("Upload store has not been initialized")
+    return _upload_store
@@ -0,0 +1,78 @@
+"""
+Benchmark: loading the hairstyle dataset from folders vs. the packed format
+
+Compares walking the class folders and decoding every image (then resizing it to the packed
+resolution, as any consumer needing fixed-size arrays must) with opening the packed dataset and
+touching every pixel through its memory-mapped shards.
+
+Usage (from backend/, after `python -m scripts.pack_dataset`):
+    python -m benchmarks.bench_dataset_pack
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.services.dataset_pack import IMAGE_SUFFIXES, PackedDataset
+
+DATASETS = Path(__file__).resolve().parent.parent.parent / "datasets"
+CACHE = Path(__file__).resolve().parent.parent / ".cache"
+
+
+def load_folders(dataset_dir: Path, classes, width: int, height: int) -> int:
+    """The folder path: list, decode and resize every image; returns the number loaded"""
+    loaded = 0
+    for name in classes:
+        for path in sorted((dataset_dir / name).iterdir()):
+            if path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            image = cv2.imdecode(np.fromfile(str(path), dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is not None:
+                cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                loaded += 1
+    return loaded
+
+
+def run(args):
+    start = time.perf_counter()
+    dataset = PackedDataset(args.packed)
+    open_s = time.perf_counter() - start
+
+    # Read every pixel once so the comparison includes the data, not just the index
+    start = time.perf_counter()
+    checksum = 0
+    for images, _ in dataset.iter_batches(args.batch_size):
+        checksum += int(images.sum(dtype=np.uint64))
+    scan_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    folder_images = load_folders(args.dataset, dataset.classes, dataset.width, dataset.height)
+    folders_s = time.perf_counter() - start
+
+    return {
+        "folder_images": folder_images,
+        "packed_images": len(dataset),
+        "resolution": f"{dataset.width}x{dataset.height}",
+        "folders_decode_s": round(folders_s, 3),
+        "packed_open_s": round(open_s, 4),
+        "packed_full_scan_s": round(scan_s, 4),
+        "speedup_open": round(folders_s / open_s, 1),
+        "speedup_full_scan": round(folders_s / (open_s + scan_s), 1),
+        "checksum": checksum,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", type=Path, default=DATASETS, help="Directory with one folder per class")
+    parser.add_argument("--packed", type=Path, default=CACHE / "packed_hairstyles", help="Packed dataset directory")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size for the full scan")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Benchmark: throughput and tail latency of the API under concurrent load
+
+Starts local stand-ins for IDM-VTON (Gradio), OpenAI and Custom Search (see
+benchmarks/fake_upstreams.py), runs the backend under uvicorn in a subprocess pointed at them,
+with its own temporary datasets directory and an empty .env, then drives the selected endpoints
+from closed-loop workers. No real API is contacted and no quota is used.
+
+Every endpoint gets `--concurrency` workers that send one request after another for
+`--duration` seconds; requests finishing in the first `--warmup` seconds are not counted.
+Try-on latency is end to end: submit, then poll the job until it is done or failed. Requests
+are made unique (seeds, queries, messages) so the response caches do not answer them.
+
+The report (stdout, and `--output` if given) is JSON with, per endpoint, request and error
+counts, status codes, throughput and p50/p95/p99/max latency, plus the fakes' request counters.
+Compare `--backend-workers 1` and `--backend-workers N` to see how throughput and upstream
+calls scale with uvicorn worker processes sharing state.
+
+Usage (from backend/):
+    python -m benchmarks.bench_load --concurrency 8 --duration 30 \\
+        --endpoints tryon,search,chat,recommendations --gradio-latency lognormal:2:0.4 \\
+        --openai-latency uniform:0.3:1.2 --search-latency 0.2 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .fake_upstreams import FakeUpstream, ServerThread, gradio_app, openai_app, search_app
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+ENDPOINTS = ("tryon", "search", "chat", "chat_stream", "recommendations")
+
+PURPOSES = ["casual", "work", "gym", "date night", "wedding", "hiking", "travel"]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values), max(1, math.ceil(q / 100 * len(sorted_values)))) - 1
+    return sorted_values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def sample_image(color: Tuple[int, int, int]) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (768, 1024), color).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class Recorder:
+    """Latency samples and status codes of one endpoint"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors = 0
+
+    def add(self, latency: float, status: Any, ok: bool):
+        self.latencies.append(latency)
+        self.statuses[str(status)] += 1
+        if not ok:
+            self.errors += 1
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        values = sorted(self.latencies)
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "requests": len(values),
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(values), 4) if values else None,
+            "status_codes": dict(sorted(self.statuses.items())),
+            "throughput_rps": round(len(values) / seconds, 2) if seconds else None,
+            "p50_ms": ms(percentile(values, 50)),
+            "p95_ms": ms(percentile(values, 95)),
+            "p99_ms": ms(percentile(values, 99)),
+            "max_ms": ms(values[-1] if values else None),
+        }
+
+
+class LoadGenerator:
+    """Closed-loop workers issuing requests against a running backend"""
+
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.counter = itertools.count()
+        self.person_image_id: Optional[str] = None
+        self.clothing_image_id: Optional[str] = None
+
+    async def setup(self):
+        """Upload the try-on inputs once; workers refer to them by id"""
+        if "tryon" not in self.args.endpoints:
+            return
+        ids = []
+        for color in ((200, 170, 150), (40, 60, 120)):
+            response = await self.client.post(
+                "/api/uploads",
+                files={"image": ("image.jpg", sample_image(color), "image/jpeg")}
+            )
+            response.raise_for_status()
+            ids.append(response.json()["id"])
+        self.person_image_id, self.clothing_image_id = ids
+
+    async def tryon(self) -> Tuple[Any, bool]:
+        response = await self.client.post("/api/clothing/try-on", data={
+            "person_image_id": self.person_image_id,
+            "clothing_image_id": self.clothing_image_id,
+            "garment_description": "A denim jacket",
+            "seed": str(next(self.counter)),
+        })
+        if response.status_code not in (200, 202):
+            return response.status_code, False
+        body = response.json()
+        while body["status"] not in ("done", "failed"):
+            await asyncio.sleep(self.args.poll_interval)
+            poll = await self.client.get(f"/api/clothing/try-on/{body['job_id']}")
+            if poll.status_code != 200:
+                return poll.status_code, False
+            body = poll.json()
+        return body["status"], body["status"] == "done"
+
+    async def search(self) -> Tuple[Any, bool]:
+        n = next(self.counter)
+        response = await self.client.get("/api/search", params={
+            "query": f"men's {PURPOSES[n % len(PURPOSES)]} jacket {n}",
+            "num_results": 10,
+            "mode": self.args.search_mode,
+        })
+        return response.status_code, response.status_code == 200
+
+    def chat_body(self) -> Dict[str, Any]:
+        n = next(self.counter)
+        return {
+            "messages": [
+                {"type": "user", "text": f"What should I wear for {PURPOSES[n % len(PURPOSES)]}? (#{n})"}
+            ],
+            "context": {"preferences": {"style": "minimal"}},
+        }
+
+    async def chat(self) -> Tuple[Any, bool]:
+        response = await self.client.post("/api/ai/chat", json=self.chat_body())
+        return response.status_code, response.status_code == 200
+
+    async def chat_stream(self) -> Tuple[Any, bool]:
+        # Latency is until the last event, i.e. the full streamed answer
+        async with self.client.stream("POST", "/api/ai/chat/stream", json=self.chat_body()) as response:
+            failed = False
+            async for line in response.aiter_lines():
+                if line.startswith("event: error"):
+                    failed = True
+            return response.status_code, response.status_code == 200 and not failed
+
+    async def recommendations(self) -> Tuple[Any, bool]:
+        n = next(self.counter)
+        response = await self.client.post(
+            "/api/ai/recommendations",
+            params={"use_cache": "false"},
+            json={"purpose": PURPOSES[n % len(PURPOSES)], "brands": "any", "minPrice": "0", "maxPrice": str(100 + n)}
+        )
+        return response.status_code, response.status_code == 200
+
+    async def worker(self, endpoint: str, recorder: Recorder, measure_from: float, stop_at: float):
+        call = getattr(self, endpoint)
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                status, ok = await call()
+            except httpx.HTTPError as e:
+                status, ok = type(e).__name__, False
+            finished = time.perf_counter()
+            if started >= measure_from:
+                recorder.add(finished - started, status, ok)
+
+    async def run(self) -> Tuple[Dict[str, Recorder], float]:
+        await self.setup()
+        recorders = {endpoint: Recorder() for endpoint in self.args.endpoints}
+        started = time.perf_counter()
+        measure_from = started + self.args.warmup
+        stop_at = measure_from + self.args.duration
+        await asyncio.gather(*(
+            self.worker(endpoint, recorders[endpoint], measure_from, stop_at)
+            for endpoint in self.args.endpoints
+            for _ in range(self.args.concurrency)
+        ))
+        # In-flight requests finish after stop_at; they are counted, so measure until now
+        return recorders, time.perf_counter() - measure_from
+
+
+def start_backend(workdir: Path, port: int, env: Dict[str, str], workers: int = 1) -> subprocess.Popen:
+    """Run the API in a subprocess whose relative ../datasets paths resolve inside workdir"""
+    cwd = workdir / "backend"
+    cwd.mkdir(parents=True)
+    (workdir / "datasets").mkdir()
+    log = open(workdir / "backend.log", "w")
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"
+        ],
+        cwd=cwd,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("Backend did not become ready")
+
+
+async def drive(url: str, args) -> Tuple[Dict[str, Recorder], float]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=args.request_timeout, limits=limits) as client:
+        return await LoadGenerator(client, args).run()
+
+
+def run(args) -> Dict[str, Any]:
+    upstreams = {
+        "gradio": FakeUpstream("gradio", args.gradio_latency, args.gradio_error_rate, args.seed),
+        "openai": FakeUpstream("openai", args.openai_latency, args.openai_error_rate, args.seed),
+        "search": FakeUpstream("search", args.search_latency, args.search_error_rate, args.seed),
+    }
+    servers = {
+        "gradio": ServerThread(gradio_app(upstreams["gradio"])).start(),
+        "openai": ServerThread(openai_app(upstreams["openai"])).start(),
+        "search": ServerThread(search_app(upstreams["search"])).start(),
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench_load_") as tmp:
+        workdir = Path(tmp)
+        (workdir / ".env").touch()
+        port = free_port()
+        env = dict(
+            os.environ,
+            PYTHONPATH=str(BACKEND),
+            # An empty .env so a developer's real keys and endpoints cannot leak into the run
+            ENV_FILE=str(workdir / ".env"),
+            OPENAI_API_KEY="sk-load-test",
+            OPENAI_BASE_URL=servers["openai"].url,
+            GOOGLE_API_KEY="load-test",
+            CUSTOM_SEARCH_ENGINE_ID="load-test",
+            GOOGLE_SEARCH_BASE_URL=f"{servers['search'].url}/customsearch/v1",
+            PRODUCT_CATALOG_PATH=str(workdir / "product_catalog.sqlite3"),
+            SHARED_STATE_PATH=str(workdir / "shared_state.sqlite3"),
+            IDM_VTON_SPACES=f"{servers['gradio'].url}/",
+            HF_TOKEN="",
+            STARTUP_WARMUP="false",
+            **dict(item.split("=", 1) for item in args.env)
+        )
+        process = start_backend(workdir, port, env, args.backend_workers)
+        url = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(url, process)
+            recorders, seconds = asyncio.run(drive(url, args))
+        except Exception:
+            print((workdir / "backend.log").read_text()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            for server in servers.values():
+                server.stop()
+
+    return {
+        "backend_workers": args.backend_workers,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "measured_s": round(seconds, 2),
+        "warmup_s": args.warmup,
+        "search_mode": args.search_mode,
+        "endpoints": {endpoint: recorder.report(seconds) for endpoint, recorder in recorders.items()},
+        "upstreams": {name: upstream.stats() for name, upstream in upstreams.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent workers per endpoint")
+    parser.add_argument("--backend-workers", type=int, default=1, help="uvicorn worker processes serving the API")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds of load before measuring starts")
+    parser.add_argument(
+        "--endpoints",
+        type=lambda value: [e.strip() for e in value.split(",") if e.strip()],
+        default=["tryon", "search", "chat", "recommendations"],
+        help=f"Comma-separated subset of: {', '.join(ENDPOINTS)}"
+    )
+    parser.add_argument("--search-mode", default="google", choices=["auto", "local", "google"], help="mode passed to /api/search")
+    parser.add_argument("--gradio-latency", default="lognormal:1.5:0.3", help="Try-on prediction latency spec")
+    parser.add_argument("--openai-latency", default="lognormal:0.5:0.4", help="Chat completion latency spec (time to first byte)")
+    parser.add_argument("--search-latency", default="lognormal:0.15:0.3", help="Custom Search latency spec")
+    parser.add_argument("--error-rate", type=float, default=None, help="Error rate for every fake upstream")
+    parser.add_argument("--gradio-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Seconds between try-on status polls")
+    parser.add_argument("--request-timeout", type=float, default=120, help="Client timeout per request")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the fakes' latency and error sampling")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Extra backend environment variable (repeatable)")
+    parser.add_argument("--output", type=Path, default=None, help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    if args.error_rate is not None:
+        args.gradio_error_rate = args.openai_error_rate = args.search_error_rate = args.error_rate
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: upload normalization for try-on inputs
+
+Compares the previous path (decode at full resolution, convert to RGB, encode PNG on the
+request thread) with the preprocessing stage (JPEG draft decoding, EXIF orientation, fit and
+pad to 768x1024, JPEG encode in a process pool). Reports bytes that would be sent to the
+IDM-VTON Space and an end-to-end latency estimate including upload time at a given uplink
+bandwidth.
+
+Usage (from backend/):
+    python -m benchmarks.bench_preprocessing --images 8 --uplink-mbps 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.services.image_preprocessing_service import ImagePreprocessor, preprocess_image
+
+
+def make_photo(path: Path, width: int, height: int, seed: int):
+    """Write a synthetic phone-sized JPEG with smooth gradients plus sensor-like noise"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        127 + 100 * np.sin(x / (width / 3.0) + seed),
+        127 + 100 * np.cos(y / (height / 4.0)),
+        127 + 100 * np.sin((x + y) / (width / 2.0)),
+    ], axis=-1)
+    noise = rng.normal(0, 12, size=base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    Image.fromarray(pixels).save(path, "JPEG", quality=92)
+
+
+def legacy_convert(source: Path, destination: Path):
+    """The previous upload path: full-resolution decode and PNG encode"""
+    with Image.open(source) as img:
+        img.convert("RGB").save(destination, "PNG")
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        sources = []
+        for i in range(args.images):
+            path = tmp / f"photo_{i}.jpg"
+            make_photo(path, args.width, args.height, seed=i)
+            sources.append(path)
+
+        # Previous path: sequential, on the calling thread
+        legacy_times, legacy_bytes = [], []
+        start = time.perf_counter()
+        for i, source in enumerate(sources):
+            t0 = time.perf_counter()
+            destination = tmp / f"legacy_{i}.png"
+            legacy_convert(source, destination)
+            legacy_times.append(time.perf_counter() - t0)
+            legacy_bytes.append(destination.stat().st_size)
+        legacy_wall = time.perf_counter() - start
+
+        # Preprocessing stage, single image latency
+        new_times, new_bytes = [], []
+        for i, source in enumerate(sources):
+            t0 = time.perf_counter()
+            destination = tmp / f"single_{i}.jpg"
+            preprocess_image(str(source), str(destination))
+            new_times.append(time.perf_counter() - t0)
+            new_bytes.append(destination.stat().st_size)
+
+        # Preprocessing stage, all images in parallel through the process pool
+        preprocessor = ImagePreprocessor(workers=args.workers)
+        preprocessor.start()
+
+        async def normalize_all():
+            await asyncio.gather(*(
+                preprocessor.normalize(source, tmp / f"pool_{i}.jpg")
+                for i, source in enumerate(sources)
+            ))
+
+        # Warm the pool so process start-up is not counted
+        asyncio.run(preprocessor.normalize(sources[0], tmp / "warmup.jpg"))
+        start = time.perf_counter()
+        asyncio.run(normalize_all())
+        pool_wall = time.perf_counter() - start
+        preprocessor.shutdown()
+
+    bytes_per_second = args.uplink_mbps * 1_000_000 / 8
+    legacy_latency = statistics.median(legacy_times)
+    new_latency = statistics.median(new_times)
+    legacy_upload = statistics.median(legacy_bytes) / bytes_per_second
+    new_upload = statistics.median(new_bytes) / bytes_per_second
+
+    report = {
+        "images": args.images,
+        "source_resolution": f"{args.width}x{args.height}",
+        "uplink_mbps": args.uplink_mbps,
+        "legacy": {
+            "median_bytes": int(statistics.median(legacy_bytes)),
+            "median_convert_s": round(legacy_latency, 4),
+            "estimated_end_to_end_s": round(legacy_latency + legacy_upload, 4),
+            "batch_wall_s": round(legacy_wall, 4),
+        },
+        "preprocessed": {
+            "median_bytes": int(statistics.median(new_bytes)),
+            "median_convert_s": round(new_latency, 4),
+            "estimated_end_to_end_s": round(new_latency + new_upload, 4),
+            "batch_wall_s": round(pool_wall, 4),
+            "pool_workers": preprocessor.workers,
+        },
+    }
+    report["bytes_ratio"] = round(report["legacy"]["median_bytes"] / report["preprocessed"]["median_bytes"], 1)
+    report["end_to_end_speedup"] = round(
+        report["legacy"]["estimated_end_to_end_s"] / report["preprocessed"]["estimated_end_to_end_s"], 1
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=8, help="Number of synthetic photos")
+    parser.add_argument("--width", type=int, default=4032, help="Source width (default: 12 MP phone photo)")
+    parser.add_argument("--height", type=int, default=3024, help="Source height")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="Uplink bandwidth used to estimate upload time")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
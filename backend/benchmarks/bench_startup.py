@@ -0,0 +1,121 @@
+"""
+Benchmark: application import time and first-request latency
+
+Starts fresh interpreters that import `app.main`, run the lifespan startup and answer
+`GET /api/health`, with outbound connections disabled. Fails (exit status 1) when the median
+import or first-request time exceeds its budget, when startup tries to open a network
+connection, or when a lazily imported library (gradio_client, PIL, tiktoken, cv2, NumPy) is loaded by
+startup. Background warm-up is disabled so only the blocking startup path is measured.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup --runs 5 --import-budget 1.5 --request-budget 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+# Libraries that must stay off the startup path
+LAZY_MODULES = ("gradio_client", "PIL", "tiktoken", "googleapiclient", "cv2", "numpy")
+
+PROBE = """
+import json, socket, sys, time
+
+connects = []
+
+def refuse(self, address):
+    connects.append(str(address))
+    raise OSError("network access disabled by the startup benchmark")
+
+socket.socket.connect = refuse
+
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+from fastapi.testclient import TestClient
+client_ready = time.perf_counter()
+with TestClient(app.main.app) as client:
+    lifespan_done = time.perf_counter()
+    status = client.get("/api/health").status_code
+    answered = time.perf_counter()
+
+print(json.dumps({
+    "import_s": imported - started,
+    "first_request_s": (lifespan_done - client_ready) + (answered - lifespan_done),
+    "status": status,
+    "connects": connects,
+    "lazy_loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def probe() -> dict:
+    """Run one cold start in a fresh interpreter"""
+    env = dict(os.environ, STARTUP_WARMUP="false", PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(args):
+    # The first start may compile bytecode; it is not counted
+    probe()
+    runs = [probe() for _ in range(args.runs)]
+
+    import_s = statistics.median(r["import_s"] for r in runs)
+    first_request_s = statistics.median(r["first_request_s"] for r in runs)
+    connects = sorted({c for r in runs for c in r["connects"]})
+    lazy_loaded = sorted({m for r in runs for m in r["lazy_loaded"]})
+    statuses = sorted({r["status"] for r in runs})
+
+    failures = []
+    if import_s > args.import_budget:
+        failures.append(f"import took {import_s:.3f}s (budget {args.import_budget}s)")
+    if first_request_s > args.request_budget:
+        failures.append(f"first request took {first_request_s:.3f}s (budget {args.request_budget}s)")
+    if connects:
+        failures.append(f"startup opened network connections: {connects}")
+    if lazy_loaded:
+        failures.append(f"startup imported lazy modules: {lazy_loaded}")
+    if statuses != [200]:
+        failures.append(f"health check returned {statuses}")
+
+    return {
+        "runs": args.runs,
+        "median_import_s": round(import_s, 3),
+        "max_import_s": round(max(r["import_s"] for r in runs), 3),
+        "median_first_request_s": round(first_request_s, 3),
+        "max_first_request_s": round(max(r["first_request_s"] for r in runs), 3),
+        "import_budget_s": args.import_budget,
+        "request_budget_s": args.request_budget,
+        "network_connects": connects,
+        "lazy_modules_loaded": lazy_loaded,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to measure")
+    parser.add_argument("--import-budget", type=float, default=1.5, help="Maximum median seconds to import app.main")
+    parser.add_argument("--request-budget", type=float, default=0.5, help="Maximum median seconds for lifespan startup plus the first request")
+    args = parser.parse_args()
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Local stand-ins for the external APIs, used by the load-test benchmark
+
+Each fake answers the subset of its API the services use, after a delay drawn from a
+configurable latency distribution, and fails a configurable fraction of requests:
+
+- Gradio (IDM-VTON `/tryon`): the config, info, upload, queue and file routes gradio_client
+  talks to, with results delivered over the sse_v3 event stream
+- OpenAI `/chat/completions`: JSON responses and, with `"stream": true`, server-sent chunks
+- Custom Search `/customsearch/v1`: a page of product results
+
+Latency specs: `0.2` or `const:0.2` (seconds), `uniform:0.1:0.5`, `lognormal:0.3:0.5`
+(median and sigma), `exp:0.2` (mean). The servers run in background threads of the
+benchmark process.
+"""
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+ITEM_TYPES = [
+    "crew neck t-shirt", "slim fit chinos", "leather chelsea boots", "zip-up hoodie",
+    "denim trucker jacket", "performance running shorts", "oxford button-down shirt",
+    "training joggers", "wool overcoat", "canvas sneakers", "merino crew sweater",
+    "cargo pants", "linen shirt", "quilted vest", "suede loafers",
+]
+
+BRANDS = ["Nike", "Uniqlo", "Levi's", "Patagonia", "J.Crew", "Adidas", "Everlane", "Zara"]
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution spec into a sampler
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    kind, _, rest = spec.partition(":")
+    try:
+        if not rest:
+            value = float(kind)
+            return lambda rng: value
+        args = [float(a) for a in rest.split(":")]
+        if kind == "const" and len(args) == 1:
+            return lambda rng: args[0]
+        if kind == "uniform" and len(args) == 2:
+            return lambda rng: rng.uniform(args[0], args[1])
+        if kind == "lognormal" and len(args) == 2:
+            # Parameterized by the median, the usual way latency is quoted
+            median, sigma = args
+            return lambda rng: median * rng.lognormvariate(0, sigma)
+        if kind == "exp" and len(args) == 1:
+            return lambda rng: rng.expovariate(1 / args[0])
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec '{spec}'; expected e.g. 0.2, uniform:0.1:0.5 or lognormal:0.3:0.5")
+
+
+class FakeUpstream:
+    """Latency, error injection and request counters shared by the routes of one fake API"""
+
+    def __init__(self, name: str, latency: str = "0", error_rate: float = 0.0, seed: Optional[int] = None):
+        self.name = name
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    async def delay(self):
+        """Sleep for one latency sample"""
+        await asyncio.sleep(max(0.0, self.sample_latency(self.rng)))
+
+    def should_fail(self, operation: str) -> bool:
+        """Count a request and decide whether to fail it"""
+        self.counters[f"{operation}_requests"] += 1
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.counters[f"{operation}_errors"] += 1
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"latency": self.latency_spec, "error_rate": self.error_rate, **self.counters}
+
+
+def _result_image() -> bytes:
+    """A small PNG returned as every try-on result"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (384, 512), (180, 140, 120)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def gradio_app(upstream: FakeUpstream) -> FastAPI:
+    """
+    Gradio 5 app exposing `/tryon` with the IDM-VTON signature
+
+    Inputs are accepted and ignored; every successful prediction returns the same image.
+    Failed predictions complete with `success: false`, which gradio_client raises as an AppError.
+    """
+    app = FastAPI()
+    prefix = "/gradio_api"
+    image = _result_image()
+    parameters = ["dict", "garm_img", "garment_des", "is_checked", "is_checked_crop", "denoise_steps", "seed"]
+    # Per session: buffered messages and the number of events not yet completed
+    sessions: Dict[str, Dict[str, Any]] = {}
+
+    def session(session_hash: str) -> Dict[str, Any]:
+        if session_hash not in sessions:
+            sessions[session_hash] = {"messages": asyncio.Queue(), "pending": 0}
+        return sessions[session_hash]
+
+    def file_data(request: Request, path: str) -> Dict[str, Any]:
+        return {
+            "path": path,
+            "url": f"{str(request.base_url).rstrip('/')}{prefix}/file={path}",
+            "orig_name": "result.png",
+            "meta": {"_type": "gradio.FileData"},
+        }
+
+    @app.get("/config")
+    def config():
+        return {
+            "version": "5.0.0",
+            "protocol": "sse_v3",
+            "api_prefix": prefix,
+            "connect_heartbeat": False,
+            "components": [{"id": i, "type": "textbox"} for i in range(len(parameters) + 2)],
+            "dependencies": [{
+                "id": 0,
+                "api_name": "tryon",
+                "inputs": list(range(len(parameters))),
+                "outputs": [len(parameters), len(parameters) + 1],
+                "api_visibility": "public",
+            }],
+        }
+
+    @app.get(f"{prefix}/info")
+    def info():
+        return {
+            "named_endpoints": {"/tryon": {"parameters": [{"parameter_name": name} for name in parameters]}},
+            "unnamed_endpoints": {},
+        }
+
+    @app.post(f"{prefix}/upload")
+    async def upload(files: List[UploadFile] = File(...)):
+        for f in files:
+            await f.read()
+        upstream.counters["uploads"] += len(files)
+        return [f"/tmp/gradio/{uuid.uuid4().hex}/{f.filename}" for f in files]
+
+    async def run(request: Request, state: Dict[str, Any], event_id: str):
+        queue = state["messages"]
+        await queue.put({"msg": "process_starts", "event_id": event_id})
+        await upstream.delay()
+        if upstream.should_fail("predict"):
+            output = {"error": "Injected failure"}
+            success = False
+        else:
+            output = {"data": [file_data(request, "result.png"), file_data(request, "mask.png")]}
+            success = True
+        await queue.put({"msg": "process_completed", "event_id": event_id, "output": output, "success": success})
+
+    @app.post(f"{prefix}/queue/join")
+    async def join(request: Request):
+        body = await request.json()
+        state = session(body["session_hash"])
+        event_id = uuid.uuid4().hex
+        state["pending"] += 1
+        await state["messages"].put({"msg": "estimation", "event_id": event_id, "rank": 0, "queue_size": state["pending"]})
+        asyncio.create_task(run(request, state, event_id))
+        return {"event_id": event_id}
+
+    @app.get(f"{prefix}/queue/data")
+    async def data(session_hash: str):
+        state = session(session_hash)
+
+        async def events():
+            while True:
+                message = await state["messages"].get()
+                yield f"data: {json.dumps(message)}\n\n"
+                if message["msg"] == "process_completed":
+                    state["pending"] -= 1
+                    if state["pending"] == 0 and state["messages"].empty():
+                        yield f"data: {json.dumps({'msg': 'close_stream'})}\n\n"
+                        return
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get(prefix + "/file={path:path}")
+    def file(path: str):
+        return Response(image, media_type="image/png")
+
+    @app.post(f"{prefix}/reset")
+    @app.post(f"{prefix}/cancel")
+    def reset():
+        return {}
+
+    return app
+
+
+def openai_app(upstream: FakeUpstream) -> FastAPI:
+    """
+    OpenAI-compatible `/chat/completions`
+
+    The reply lists item types, one per line, which both the recommendations parser and the
+    chat endpoints accept. Failures are returned as HTTP 500 (or 429 for every third one).
+    """
+    app = FastAPI()
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        operation = "stream" if body.get("stream") else "completion"
+        await upstream.delay()
+        if upstream.should_fail(operation):
+            status = 429 if upstream.counters[f"{operation}_errors"] % 3 == 0 else 500
+            return JSONResponse({"error": {"message": "Injected failure", "type": "server_error"}}, status_code=status)
+
+        items = upstream.rng.sample(ITEM_TYPES, 5)
+        content = "\n".join(f"Item {i}: {item}" for i, item in enumerate(items, 1))
+        if not body.get("stream"):
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 30, "total_tokens": 130},
+            }
+
+        async def chunks():
+            for word in content.split(" "):
+                chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0.005)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def search_app(upstream: FakeUpstream) -> FastAPI:
+    """Custom Search JSON API `/customsearch/v1` returning product-like results"""
+    app = FastAPI()
+
+    @app.get("/customsearch/v1")
+    async def search(q: str, num: int = 10, start: int = 1):
+        await upstream.delay()
+        if upstream.should_fail("search"):
+            return JSONResponse({"error": {"code": 500, "message": "Injected failure"}}, status_code=500)
+
+        items = []
+        for i in range(start, start + min(num, 10)):
+            brand = BRANDS[(hash(q) + i) % len(BRANDS)]
+            price = f"{19.99 + (hash((q, i)) % 180):.2f}"
+            image = f"https://images.example.com/products/{abs(hash((q, i)))}.jpg"
+            items.append({
+                "title": f"{brand} {q} #{i}",
+                "link": f"https://shop.example.com/{brand.lower()}/{abs(hash((q, i)))}",
+                "snippet": f"{q} by {brand}. Free shipping on orders over $50.",
+                "pagemap": {
+                    "cse_image": [{"src": image}],
+                    "offer": [{"price": price, "pricecurrency": "USD"}],
+                    "metatags": [{"og:image": image, "og:site_name": brand, "product:brand": brand}],
+                },
+            })
+        return {"searchInformation": {"totalResults": "100"}, "items": items}
+
+    return app
+
+
+class ServerThread:
+    """A uvicorn server on an ephemeral localhost port, running in a daemon thread"""
+
+    def __init__(self, app: FastAPI):
+        self.server = uvicorn.Server(uvicorn.Config(
+            app,
+            host="127.0.0.1",
+            port=0,
+            log_level="warning",
+            timeout_graceful_shutdown=1
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout: float = 10.0) -> "ServerThread":
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Fake upstream server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
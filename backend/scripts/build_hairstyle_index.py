@@ -0,0 +1,30 @@
+"""
+Build or incrementally update the hairstyle similarity index
+
+Usage (from backend/):
+    python -m scripts.build_hairstyle_index
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+
+from app.services.hairstyle_index_service import HairstyleIndex
+
+DATASETS = Path(__file__).resolve().parent.parent.parent / "datasets"
+CACHE = Path(__file__).resolve().parent.parent / ".cache"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", type=Path, default=DATASETS, help="Directory with one folder per hairstyle")
+    parser.add_argument("--index", type=Path, default=CACHE / "hairstyle_index", help="Output directory")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(HairstyleIndex(args.dataset, args.index).build(workers=args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Pack the hairstyle image folders into memory-mappable shards
+
+Validates, deduplicates (sha256 and dHash), resizes to a fixed resolution and writes the
+images as raw RGB shards with an index; see app/services/dataset_pack.py for the format.
+
+Usage (from backend/):
+    python -m scripts.pack_dataset --size 256 256
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+
+from app.services.dataset_pack import pack_dataset
+from app.services.hairstyle_index_service import STYLES
+
+DATASETS = Path(__file__).resolve().parent.parent.parent / "datasets"
+CACHE = Path(__file__).resolve().parent.parent / ".cache"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", type=Path, default=DATASETS, help="Directory with one folder per class")
+    parser.add_argument("--output", type=Path, default=CACHE / "packed_hairstyles", help="Output directory")
+    parser.add_argument("--classes", nargs="+", default=list(STYLES), help="Class folders, in label order")
+    parser.add_argument("--size", type=int, nargs=2, default=(256, 256), metavar=("WIDTH", "HEIGHT"), help="Output resolution")
+    parser.add_argument("--shard-size", type=int, default=1024, help="Images per shard")
+    parser.add_argument("--max-hash-distance", type=int, default=4, help="dHash distance treated as a near-duplicate")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(pack_dataset(
+        args.dataset,
+        args.output,
+        args.classes,
+        size=tuple(args.size),
+        shard_size=args.shard_size,
+        max_hash_distance=args.max_hash_distance,
+        workers=args.workers
+    ), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Shared fixtures"""
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def per_process_state():
+    """Keep service state per process instead of in the shared store under datasets/cache"""
+    from app.services.shared_state import initialize_shared_state
+
+    initialize_shared_state(backend="none")
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """
+    The API module, imported from a temporary project tree
+
+    app.main resolves its data directories (../datasets/...) against the working directory
+    at import time, so the import runs from an empty backend/ directory next to an empty
+    datasets/ directory. Background warm-up is disabled so tests never reach the network.
+    """
+    root = tmp_path_factory.mktemp("project")
+    (root / "backend").mkdir()
+    (root / "datasets").mkdir()
+    cwd = os.getcwd()
+    os.chdir(root / "backend")
+    try:
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setenv("STARTUP_WARMUP", "false")
+            import app.main
+        yield app.main
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch):
+    """Keep services from persisting caches into the working tree"""
+    monkeypatch.setenv("OPENAI_CACHE_PATH", "")
+    monkeypatch.setenv("PRODUCT_CATALOG_PATH", "")
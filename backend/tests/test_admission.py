@@ -0,0 +1,203 @@
+"""Tests for the upstream admission controller"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController, UpstreamBusyError
+from app.services.shared_state import SQLiteSharedState
+
+
+def test_interactive_callers_are_admitted_before_batch():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1)
+        order = []
+        release = asyncio.Event()
+
+        async def call(label, priority):
+            async with controller.slot(priority):
+                order.append(label)
+                if label == "first":
+                    await release.wait()
+
+        first = asyncio.create_task(call("first", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0.01)
+        batch = asyncio.create_task(call("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(call("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["queued"] == 2
+
+        release.set()
+        await asyncio.gather(first, batch, interactive)
+        return order, controller.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["first", "interactive", "batch"]
+    assert stats["active"] == 0
+    assert stats["admitted"] == 3
+
+
+def test_callers_of_equal_priority_are_admitted_in_arrival_order():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1)
+        order = []
+        release = asyncio.Event()
+
+        async def call(label):
+            async with controller.slot(PRIORITY_BATCH):
+                order.append(label)
+                if label == 0:
+                    await release.wait()
+
+        tasks = []
+        for label in range(4):
+            tasks.append(asyncio.create_task(call(label)))
+            await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3]
+
+
+def test_full_queue_rejects_at_once():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(UpstreamBusyError) as excinfo:
+            async with controller.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return excinfo.value, controller.stats()
+
+    error, stats = asyncio.run(scenario())
+    assert error.retry_after >= 1
+    assert stats["rejected"] == 1
+    assert stats["admitted"] == 2
+
+
+def test_waiting_past_queue_timeout_raises_and_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, queue_timeout=0.1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        with pytest.raises(UpstreamBusyError):
+            async with controller.slot():
+                pass
+        waited = time.monotonic() - started
+        stats = controller.stats()
+        release.set()
+        await holder
+        return waited, stats, controller.stats()
+
+    waited, during, after = asyncio.run(scenario())
+    assert 0.1 <= waited < 1.0
+    assert during["timed_out"] == 1
+    assert during["queued"] == 0
+    assert after["active"] == 0
+
+
+def test_cancelled_waiter_does_not_block_the_queue():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1)
+        release = asyncio.Event()
+        admitted = []
+
+        async def call(label):
+            async with controller.slot():
+                admitted.append(label)
+                if label == "holder":
+                    await release.wait()
+
+        holder = asyncio.create_task(call("holder"))
+        await asyncio.sleep(0.01)
+        cancelled = asyncio.create_task(call("cancelled"))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(call("queued"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        release.set()
+        await asyncio.gather(holder, queued)
+        return admitted, controller.stats()
+
+    admitted, stats = asyncio.run(scenario())
+    assert admitted == ["holder", "queued"]
+    assert stats["queued"] == 0
+    assert stats["active"] == 0
+
+
+def test_local_token_bucket_spaces_out_calls():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=10, rate=20, burst=1)
+        started = time.monotonic()
+        for _ in range(3):
+            async with controller.slot():
+                pass
+        return time.monotonic() - started
+
+    # The first call uses the burst; the next two each wait for a token (1/20 s)
+    assert asyncio.run(scenario()) >= 0.09
+
+
+def test_shared_token_bucket_holds_across_controllers(tmp_path):
+    shared = SQLiteSharedState(tmp_path / "state.sqlite3")
+    first = AdmissionController("upstream", max_concurrency=1, rate=0.1, burst=1, queue_timeout=0.2, shared=shared)
+    second = AdmissionController("upstream", max_concurrency=1, rate=0.1, burst=1, queue_timeout=0.2, shared=shared)
+
+    async def scenario():
+        async with first.slot():
+            pass
+        with pytest.raises(UpstreamBusyError):
+            async with second.slot():
+                pass
+
+    asyncio.run(scenario())
+    # The rejected caller gave its slot back
+    assert second.stats()["active"] == 0
+    assert first.stats()["admitted"] == 1
+
+
+def test_slot_sync_limits_concurrency_across_threads():
+    controller = AdmissionController("test", max_concurrency=2)
+    lock = threading.Lock()
+    active = peak = 0
+
+    def call():
+        nonlocal active, peak
+        with controller.slot_sync():
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == 2
+    assert controller.stats()["admitted"] == 6
+    assert controller.stats()["active"] == 0
@@ -0,0 +1,177 @@
+"""Tests for token budgeting and rolling-summary compaction of chat history"""
+import asyncio
+
+import pytest
+
+from app.services.chat_compaction import ChatCompactor, count_message_tokens
+
+SYSTEM = {"role": "system", "content": "You are a stylist."}
+
+
+def conversation(turns, opening="I need an outfit for a summer wedding."):
+    messages = [SYSTEM, {"role": "user", "content": opening}]
+    for i in range(1, turns):
+        role = "assistant" if i % 2 else "user"
+        messages.append({"role": role, "content": f"message {i} " + "linen chinos loafers " * 5})
+    return messages
+
+
+class Summarizer:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, previous, messages):
+        self.calls.append((previous, len(messages)))
+        if self.fail:
+            raise RuntimeError("summary model unavailable")
+        return f"summary of {len(messages)} messages"
+
+
+@pytest.fixture
+def compactor():
+    return ChatCompactor(budget=300, keep_messages=2, summary_max_tokens=20)
+
+
+def compact(compactor, messages, summarizer):
+    return asyncio.run(compactor.compact(messages, summarizer))
+
+
+def test_prompt_within_budget_is_sent_unchanged(compactor):
+    messages = conversation(3)
+    summarizer = Summarizer()
+
+    compacted, usage = compact(compactor, messages, summarizer)
+
+    assert compacted == messages
+    assert usage["prompt_tokens"] == usage["original_prompt_tokens"] == count_message_tokens(messages)
+    assert usage["summarized_messages"] == 0
+    assert summarizer.calls == []
+
+
+def test_older_turns_are_folded_into_a_summary(compactor):
+    messages = conversation(20)
+    summarizer = Summarizer()
+
+    compacted, usage = compact(compactor, messages, summarizer)
+
+    covered = usage["summarized_messages"]
+    assert summarizer.calls == [(None, covered)]
+    assert compacted[0] == SYSTEM
+    assert compacted[1]["content"].endswith(f"summary of {covered} messages")
+    assert compacted[2:] == messages[1 + covered:]
+    assert len(compacted[2:]) >= compactor.keep_messages
+    assert usage["prompt_tokens"] <= compactor.budget < usage["original_prompt_tokens"]
+
+
+def test_next_turns_reuse_the_cached_summary(compactor):
+    summarizer = Summarizer()
+    _, first = compact(compactor, conversation(20), summarizer)
+
+    _, second = compact(compactor, conversation(22), summarizer)
+
+    assert len(summarizer.calls) == 1
+    assert second["summarized_messages"] == first["summarized_messages"]
+    assert second["prompt_tokens"] <= compactor.budget
+
+
+def test_later_turns_find_the_summary_with_one_lookup(compactor, monkeypatch):
+    summarizer = Summarizer()
+    compact(compactor, conversation(20), summarizer)
+    lookups = []
+    get = compactor.summaries.get
+
+    async def counting_get(key):
+        lookups.append(key)
+        return await get(key)
+
+    monkeypatch.setattr(compactor.summaries, "get", counting_get)
+    per_turn = []
+    for turns in (21, 22):
+        lookups.clear()
+        compact(compactor, conversation(turns), summarizer)
+        per_turn.append(len(lookups))
+
+    assert len(summarizer.calls) == 1
+    assert per_turn == [1, 1]
+
+
+def test_summary_is_extended_once_the_tail_outgrows_the_budget(compactor):
+    summarizer = Summarizer()
+    compact(compactor, conversation(20), summarizer)
+
+    turns = 22
+    while len(summarizer.calls) == 1:
+        turns += 2
+        _, usage = compact(compactor, conversation(turns), summarizer)
+
+    previous, _ = summarizer.calls[1]
+    assert previous.startswith("summary of")
+    assert usage["prompt_tokens"] <= compactor.budget
+
+
+def test_other_conversations_do_not_share_a_summary(compactor):
+    summarizer = Summarizer()
+    compact(compactor, conversation(20), summarizer)
+    compact(compactor, conversation(20, opening="What should I wear to a job interview?"), summarizer)
+
+    assert [previous for previous, _ in summarizer.calls] == [None, None]
+
+
+def test_conversations_with_the_same_opening_keep_their_own_summaries(compactor):
+    summarizer = Summarizer()
+    first = conversation(20)
+    second = conversation(20)
+    second[3] = {"role": "assistant", "content": "A different answer " * 5}
+    compact(compactor, first, summarizer)
+    compact(compactor, second, summarizer)
+
+    # Each conversation's next turn still finds its own summary
+    compact(compactor, first + conversation(22)[20:], summarizer)
+    compact(compactor, second + conversation(22)[20:], summarizer)
+
+    assert len(summarizer.calls) == 2
+
+
+def test_failed_summary_falls_back_to_truncation(compactor):
+    messages = conversation(20)
+
+    compacted, usage = compact(compactor, messages, Summarizer(fail=True))
+
+    assert compacted[0] == SYSTEM
+    assert all(message["role"] != "system" for message in compacted[1:])
+    assert compacted[1:] == messages[1 + usage["summarized_messages"]:]
+    assert usage["prompt_tokens"] <= compactor.budget
+
+
+def test_chat_response_reports_usage_after_compaction(monkeypatch):
+    import json
+
+    import httpx
+
+    from app.services.openai_service import OpenAIService
+
+    monkeypatch.setenv("CHAT_TOKEN_BUDGET", "300")
+    monkeypatch.setenv("CHAT_KEEP_MESSAGES", "2")
+    monkeypatch.setenv("CHAT_SUMMARY_MAX_TOKENS", "20")
+    bodies = []
+
+    def handler(request):
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "Short reply"}}]})
+
+    service = OpenAIService(api_key="test-key")
+    service._client = httpx.AsyncClient(base_url=service.base_url, transport=httpx.MockTransport(handler))
+    history = [
+        {"type": "user" if i % 2 == 0 else "ai", "text": f"turn {i} " + "navy blazer grey trousers " * 5}
+        for i in range(20)
+    ]
+
+    result = asyncio.run(service.get_chat_response(history))
+
+    assert result["response"] == "Short reply"
+    assert result["usage"]["summarized_messages"] > 0
+    assert result["usage"]["prompt_tokens"] <= 300
+    # One summary call, then the chat call with the summary in place of the older turns
+    assert len(bodies) == 2
+    assert bodies[1]["messages"][1]["content"].startswith("Summary of the earlier conversation")
@@ -0,0 +1,80 @@
+"""Tests for the streaming stylist chat"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.openai_service import OpenAIService
+
+MESSAGES = [{"type": "user", "text": "What goes with navy chinos?"}]
+
+
+def sse(*deltas):
+    """An OpenAI chat completion stream with one chunk per delta"""
+    lines = [
+        "data: " + json.dumps({"choices": [{"delta": {"content": delta}}]})
+        for delta in deltas
+    ]
+    return "\n\n".join(lines + ["data: [DONE]"]) + "\n\n"
+
+
+def make_service(handler, api_key="test-key"):
+    service = OpenAIService(api_key=api_key)
+    service._client = httpx.AsyncClient(base_url=service.base_url, transport=httpx.MockTransport(handler))
+    return service
+
+
+def read_events(body):
+    """Parse a text/event-stream body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+def test_service_yields_deltas_from_the_upstream_stream():
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, text=sse("A white ", "oxford ", "shirt."))
+
+    async def scenario():
+        return [delta async for delta in make_service(handler).stream_chat_response(MESSAGES)]
+
+    assert asyncio.run(scenario()) == ["A white ", "oxford ", "shirt."]
+    assert requests[0]["stream"] is True
+
+
+def test_endpoint_streams_delta_events_then_done(main, monkeypatch):
+    service = make_service(lambda request: httpx.Response(200, text=sse("Try ", "loafers.")))
+    monkeypatch.setattr(main, "get_openai_service", lambda: service)
+
+    with TestClient(main.app) as client:
+        response = client.post("/api/ai/chat/stream", json={"messages": MESSAGES})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = read_events(response.text)
+    assert events[:-1] == [
+        ("message", {"delta": "Try "}),
+        ("message", {"delta": "loafers."}),
+    ]
+    done = events[-1][1]
+    assert done["done"] is True
+    assert done["usage"]["prompt_tokens"] == done["usage"]["original_prompt_tokens"] > 0
+    assert done["usage"]["summarized_messages"] == 0
+
+
+@pytest.mark.parametrize("api_key, upstream_status", [("", 200), ("test-key", 401)])
+def test_errors_before_the_first_chunk_map_to_status_codes(main, monkeypatch, api_key, upstream_status):
+    service = make_service(lambda request: httpx.Response(upstream_status, text=sse("unused")), api_key=api_key)
+    monkeypatch.setattr(main, "get_openai_service", lambda: service)
+
+    with TestClient(main.app) as client:
+        response = client.post("/api/ai/chat/stream", json={"messages": MESSAGES})
+
+    assert response.status_code == 400
@@ -0,0 +1,129 @@
+"""Tests for packing the image dataset into memory-mapped shards"""
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services import dataset_pack
+from app.services.dataset_pack import PackedDataset, pack_dataset
+
+CLASSES = ["Straight", "curly"]
+
+
+def draw(path, seed, size=(120, 80)):
+    """A smooth random image: a coarse random grid scaled up, so each seed has a distinct, stable dHash"""
+    grid = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(grid).resize(size, Image.Resampling.BILINEAR)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image.save(path)
+    return path
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / "datasets"
+    draw(root / "Straight" / "a.png", 1)
+    draw(root / "Straight" / "b.png", 2)
+    draw(root / "Straight" / "c.png", 3, size=(80, 120))
+    draw(root / "curly" / "d.png", 4, size=(90, 90))
+    draw(root / "curly" / "e.png", 5, size=(100, 140))
+    # An exact copy, a re-encoded near-duplicate, a thumbnail and a file that is not an image
+    shutil.copy(root / "Straight" / "a.png", root / "curly" / "copy_of_a.png")
+    Image.open(root / "Straight" / "b.png").save(root / "curly" / "b_again.jpg", quality=85)
+    draw(root / "curly" / "thumb.png", 6, size=(32, 32))
+    (root / "curly" / "notes.jpg").write_bytes(b"not an image")
+    return root
+
+
+@pytest.fixture
+def packed(dataset, tmp_path):
+    counts = pack_dataset(dataset, tmp_path / "packed", CLASSES, size=(64, 48), shard_size=2, workers=1)
+    return counts, PackedDataset(tmp_path / "packed")
+
+
+def test_pack_drops_duplicates_and_invalid_images(packed):
+    counts, dataset = packed
+
+    assert {key: counts[key] for key in ("packed", "duplicate", "near_duplicate", "invalid", "too_small")} == {
+        "packed": 5, "duplicate": 1, "near_duplicate": 1, "invalid": 1, "too_small": 1
+    }
+    assert counts["shards"] == 3
+    assert len(dataset) == 5
+    assert [entry["source"] for entry in dataset.entries] == [
+        "Straight/a.png", "Straight/b.png", "Straight/c.png", "curly/d.png", "curly/e.png"
+    ]
+    assert dataset.labels.tolist() == [0, 0, 0, 1, 1]
+
+
+def test_images_are_letterboxed_to_the_packed_size(packed):
+    _, dataset = packed
+
+    tall = dataset[2]
+    assert tall.shape == (48, 64, 3)
+    # A portrait image is padded with white on the left and right
+    assert (tall[:, 0] == 255).all() and (tall[:, -1] == 255).all()
+    assert not (tall[:, 32] == 255).all()
+
+
+def test_batches_within_a_shard_are_zero_copy_views(packed):
+    _, dataset = packed
+
+    batches = list(dataset.iter_batches(batch_size=2))
+    assert [len(images) for images, _ in batches] == [2, 2, 1]
+    images, labels = batches[1]
+    assert np.shares_memory(images, dataset.shards[1])
+    assert labels.tolist() == [0, 1]
+
+
+def test_batch_across_shards_matches_single_images(packed):
+    _, dataset = packed
+
+    images, labels = dataset.batch(1, 5)
+
+    assert images.shape == (4, 48, 64, 3)
+    assert labels.tolist() == [0, 0, 1, 1]
+    for offset, image in enumerate(images):
+        assert np.array_equal(image, dataset[1 + offset])
+
+
+def test_repacking_replaces_old_shards(dataset, packed, tmp_path):
+    for path in (dataset / "curly").iterdir():
+        path.unlink()
+
+    counts = pack_dataset(dataset, tmp_path / "packed", CLASSES, size=(64, 48), shard_size=2, workers=1)
+
+    repacked = PackedDataset(tmp_path / "packed")
+    assert counts["packed"] == 3
+    assert sorted(path.name for path in (tmp_path / "packed").glob("shard_*.bin")) == [
+        shard.filename.name for shard in repacked.shards
+    ]
+    assert len(repacked) == 3
+
+
+def test_interrupted_repack_leaves_the_previous_pack_readable(dataset, packed, tmp_path, monkeypatch):
+    _, before = packed
+    images = np.array(before.batch(0, 5)[0])
+    for path in (dataset / "Straight").iterdir():
+        path.unlink()
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(dataset_pack.json, "dumps", fail)
+    with pytest.raises(OSError):
+        pack_dataset(dataset, tmp_path / "packed", CLASSES, size=(64, 48), shard_size=2, workers=1)
+
+    after = PackedDataset(tmp_path / "packed")
+    assert len(after) == 5
+    assert np.array_equal(after.batch(0, 5)[0], images)
+
+
+def test_near_duplicate_threshold_is_a_hamming_distance(dataset, tmp_path):
+    strict = pack_dataset(dataset, tmp_path / "strict", CLASSES, size=(64, 48), max_hash_distance=-1, workers=1)
+    loose = pack_dataset(dataset, tmp_path / "loose", CLASSES, size=(64, 48), max_hash_distance=64, workers=1)
+
+    # Below zero nothing is near enough; at the full 64 bits only the first image survives
+    assert (strict["packed"], strict["near_duplicate"]) == (6, 0)
+    assert (loose["packed"], loose["near_duplicate"]) == (1, 5)
+
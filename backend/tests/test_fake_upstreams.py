@@ -0,0 +1,91 @@
+"""Tests for the fake upstream APIs the load-test benchmark runs against"""
+import asyncio
+import json
+import random
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.services.google_search_service import GoogleSearchService
+from app.services.idm_vton_service import IDMVTONService
+from benchmarks.fake_upstreams import FakeUpstream, ServerThread, gradio_app, openai_app, parse_latency, search_app
+
+
+@pytest.mark.parametrize("spec, low, high", [
+    ("0.2", 0.2, 0.2),
+    ("const:0.3", 0.3, 0.3),
+    ("uniform:0.1:0.5", 0.1, 0.5),
+    ("lognormal:0.3:0.5", 0.0, float("inf")),
+    ("exp:0.2", 0.0, float("inf")),
+])
+def test_latency_specs_sample_within_their_range(spec, low, high):
+    sample = parse_latency(spec)
+    rng = random.Random(7)
+    assert all(low <= sample(rng) <= high for _ in range(100))
+
+
+@pytest.mark.parametrize("spec", ["", "fast", "uniform:0.1", "lognormal:a:b", "gamma:1:2"])
+def test_malformed_latency_specs_are_rejected(spec):
+    with pytest.raises(ValueError, match="Invalid latency spec"):
+        parse_latency(spec)
+
+
+def test_error_rate_fails_requests_and_counts_them():
+    upstream = FakeUpstream("search", error_rate=1.0, seed=1)
+    with TestClient(search_app(upstream)) as client:
+        response = client.get("/customsearch/v1", params={"q": "chinos"})
+
+    assert response.status_code == 500
+    assert upstream.stats() == {"latency": "0", "error_rate": 1.0, "search_requests": 1, "search_errors": 1}
+
+
+def test_search_service_reads_products_from_the_fake(monkeypatch):
+    monkeypatch.setenv("GOOGLE_SEARCH_BASE_URL", "http://search.test/customsearch/v1")
+    monkeypatch.delenv("SEARCH_CACHE_PATH", raising=False)
+    service = GoogleSearchService(api_key="secret-key", search_engine_id="engine")
+    service._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=search_app(FakeUpstream("search"))))
+
+    async def search():
+        try:
+            return await service.search_products("linen shirt", num_results=12)
+        finally:
+            await service.aclose()
+
+    results = asyncio.run(search())
+    assert len(results) == 12
+    assert all(result["image"].startswith("https://images.example.com/") for result in results)
+    assert all(result["brand"] and result["price"] for result in results)
+
+
+def test_openai_fake_answers_json_and_streamed_completions():
+    upstream = FakeUpstream("openai", seed=3)
+    with TestClient(openai_app(upstream)) as client:
+        completion = client.post("/chat/completions", json={"model": "gpt-4o-mini", "messages": []})
+        streamed = client.post("/chat/completions", json={"messages": [], "stream": True})
+
+    content = completion.json()["choices"][0]["message"]["content"]
+    assert len(content.splitlines()) == 5
+    events = [line[len("data: "):] for line in streamed.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    text = "".join(json.loads(event)["choices"][0]["delta"]["content"] for event in events[:-1])
+    assert len(text.strip().splitlines()) == 5
+    assert upstream.counters == {"completion_requests": 1, "stream_requests": 1}
+
+
+def test_idm_vton_service_completes_a_try_on_against_the_gradio_fake(tmp_path):
+    person, garment = tmp_path / "person.png", tmp_path / "garment.png"
+    Image.new("RGB", (48, 64), "beige").save(person)
+    Image.new("RGB", (48, 64), "navy").save(garment)
+    upstream = FakeUpstream("gradio")
+    server = ServerThread(gradio_app(upstream)).start()
+    try:
+        service = IDMVTONService(spaces=[server.url], hf_token=None)
+        result = service.try_on(person, garment, "navy shirt")
+    finally:
+        server.stop()
+
+    with Image.open(result) as image:
+        assert image.size == (384, 512)
+    assert upstream.counters["predict_requests"] == 1
@@ -0,0 +1,115 @@
+"""Tests for the hairstyle similarity index on a synthetic dataset"""
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services import hairstyle_index_service
+from app.services.hairstyle_index_service import STYLES, HairstyleIndex
+
+COLORS = ["saddlebrown", "black", "goldenrod", "firebrick", "slategray", "darkolivegreen"]
+
+
+def draw(path, color, stripes, vertical=False):
+    """A flat background with stripes; color drives the color histogram, stripes the texture and hash"""
+    image = Image.new("RGB", (96, 128), color)
+    canvas = ImageDraw.Draw(image)
+    for i in range(stripes):
+        offset = i * 96 // stripes
+        box = (offset, 0, offset + 4, 128) if vertical else (0, offset, 96, offset + 4)
+        canvas.rectangle(box, fill="white")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image.save(path)
+    return path
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / "datasets"
+    for s, style in enumerate(STYLES):
+        for i in range(3):
+            draw(root / style / f"{i}.png", COLORS[(s + i) % len(COLORS)], stripes=2 + s + i, vertical=i % 2 == 1)
+    return root
+
+
+@pytest.fixture
+def index(dataset, tmp_path):
+    index = HairstyleIndex(dataset, tmp_path / "index")
+    index.build(workers=1)
+    return index
+
+
+def test_build_indexes_every_style(index):
+    stats = index.stats()
+    assert stats["loaded"]
+    assert stats["images"] == 3 * len(STYLES)
+    assert set(stats["styles"].values()) == {3}
+
+
+def test_query_returns_the_nearest_references_in_order(index, dataset):
+    matches = index.query(dataset / "curly" / "1.png", k=4)
+
+    assert len(matches) == 4
+    assert matches[0]["path"] == "curly/1.png"
+    assert matches[0]["url"] == "/files/curly/1.png"
+    assert matches[0]["distance"] == pytest.approx(0, abs=1e-3)
+    distances = [match["distance"] for match in matches]
+    assert distances == sorted(distances)
+
+
+def test_query_can_be_restricted_to_a_style(index, dataset):
+    matches = index.query(dataset / "curly" / "1.png", k=3, style="Wavy")
+
+    assert [match["style"] for match in matches] == ["Wavy"] * 3
+    with pytest.raises(ValueError):
+        index.query(dataset / "curly" / "1.png", style="bob")
+
+
+def test_index_is_memory_mapped_when_loaded(index, dataset):
+    reloaded = HairstyleIndex(dataset, index.index_dir)
+
+    assert reloaded.load()
+    assert isinstance(reloaded._features, np.memmap)
+    assert reloaded.query(dataset / "kinky" / "2.png", k=1)[0]["path"] == "kinky/2.png"
+
+
+def test_rebuild_only_recomputes_changed_files(index, dataset):
+    assert index.build(workers=1)["reused"] == 3 * len(STYLES)
+
+    changed = draw(dataset / "Wavy" / "0.png", "white", stripes=9)
+    os.utime(changed, (changed.stat().st_atime, changed.stat().st_mtime + 10))
+    (dataset / "kinky" / "2.png").unlink()
+    draw(dataset / "Straight" / "new.png", "navy", stripes=5)
+    stats = index.build(workers=1)
+
+    assert (stats["computed"], stats["reused"], stats["removed"]) == (2, 3 * len(STYLES) - 2, 1)
+    assert index.query(changed, k=1)[0]["path"] == "Wavy/0.png"
+    assert index.stats()["images"] == 3 * len(STYLES)
+
+
+def test_unreadable_images_are_skipped_and_not_retried(index, dataset):
+    (dataset / "Wavy" / "broken.jpg").write_bytes(b"not an image")
+
+    assert index.build(workers=1)["unreadable"] == 1
+    stats = index.build(workers=1)
+    assert (stats["computed"], stats["unreadable"]) == (0, 1)
+
+
+def test_outdated_index_is_not_loaded(index, dataset, monkeypatch):
+    monkeypatch.setattr(hairstyle_index_service, "INDEX_VERSION", hairstyle_index_service.INDEX_VERSION + 1)
+
+    assert not HairstyleIndex(dataset, index.index_dir).load()
+    assert index.build(workers=1)["reused"] == 0
+
+
+def test_endpoint_reports_an_unbuilt_index(main):
+    from fastapi.testclient import TestClient
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (96, 128), "black").save(buffer, "PNG")
+    with TestClient(main.app) as client:
+        response = client.post("/api/hairstyles/similar", files={"image": ("me.png", buffer.getvalue(), "image/png")})
+
+    assert response.status_code == 503
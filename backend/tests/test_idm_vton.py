@@ -0,0 +1,122 @@
+"""Tests for load balancing and failover across IDM-VTON Spaces"""
+import threading
+
+import pytest
+
+from app.services.idm_vton_service import IDMVTONService
+
+
+class FakeSpaces:
+    """Replaces the Gradio call, failing for the named backends"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def __call__(self, backend, person_image, *args):
+        self.calls.append(backend.name)
+        if backend.name in self.failing:
+            raise RuntimeError(f"{backend.name} is down")
+        return f"{backend.name}/result.webp"
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("IDM_VTON_MAX_FAILURES", "2")
+    monkeypatch.setenv("IDM_VTON_COOLDOWN", "60")
+    return IDMVTONService(spaces=["space-a", "space-b"], hf_token="token")
+
+
+def test_spaces_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("IDM_VTON_SPACES", "space-a, https://example.test/gradio ,")
+    service = IDMVTONService(hf_token="token")
+    assert [backend.name for backend in service.backends] == ["space-a", "https://example.test/gradio"]
+
+
+def test_failed_backend_fails_over_to_the_next(service):
+    spaces = FakeSpaces(failing={"space-a"})
+    service._predict = spaces
+
+    assert service.try_on("person.jpg", "garment.jpg") == "space-b/result.webp"
+    assert spaces.calls == ["space-a", "space-b"]
+    stats = {entry["name"]: entry for entry in service.stats()}
+    assert stats["space-a"]["errors"] == 1
+    assert stats["space-a"]["last_error"] == "space-a is down"
+    assert stats["space-b"]["requests"] == 1
+    assert all(entry["in_flight"] == 0 for entry in stats.values())
+
+
+def test_error_is_raised_when_every_backend_fails(service):
+    service._predict = FakeSpaces(failing={"space-a", "space-b"})
+
+    with pytest.raises(RuntimeError, match="is down"):
+        service.try_on("person.jpg", "garment.jpg")
+
+
+def test_repeatedly_failing_backend_is_taken_out_of_rotation(service):
+    spaces = FakeSpaces(failing={"space-a"})
+    service._predict = spaces
+    for _ in range(2):
+        service.backends[1].in_flight += 1
+        service.try_on("person.jpg", "garment.jpg")
+        service.backends[1].in_flight -= 1
+    assert spaces.calls == ["space-a", "space-b"] * 2
+    assert not service.backends[0].healthy
+
+    # Even with more load on space-b, the unhealthy backend is skipped while it cools down
+    spaces.calls.clear()
+    service.backends[1].in_flight += 1
+    service.try_on("person.jpg", "garment.jpg")
+
+    assert spaces.calls == ["space-b"]
+
+
+def test_requests_go_to_the_least_loaded_backend(service):
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def predict(backend, *args):
+        calls.append(backend.name)
+        if len(calls) == 1:
+            started.set()
+            release.wait()
+        return backend.name
+
+    service._predict = predict
+    first = threading.Thread(target=service.try_on, args=("person.jpg", "garment.jpg"))
+    first.start()
+    started.wait()
+    try:
+        # A different garment, so the call is not coalesced with the one in flight
+        assert service.try_on("person.jpg", "other.jpg") != calls[0]
+    finally:
+        release.set()
+        first.join()
+
+
+def test_identical_concurrent_try_ons_share_one_prediction(service):
+    release = threading.Event()
+    calls = []
+
+    def predict(backend, *args):
+        calls.append(backend.name)
+        release.wait()
+        return f"{backend.name}/result.webp"
+
+    service._predict = predict
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(service.try_on("person.jpg", "garment.jpg", seed=3)))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    while service.flights.stats()["followers"] < 2:
+        threading.Event().wait(0.005)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and len(results) == 3
@@ -0,0 +1,81 @@
+"""Tests for the cached image variant endpoint"""
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+
+@pytest.fixture
+def client(main):
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def upload(client):
+    """Relative path (within /files/uploads) of a freshly uploaded 600x800 image"""
+    buffer = io.BytesIO()
+    Image.effect_noise((600, 800), 40).convert("RGB").save(buffer, "PNG")
+    response = client.post("/api/uploads", files={"image": ("photo.png", buffer.getvalue(), "image/png")})
+    return response.json()["url"].removeprefix("/files/uploads/")
+
+
+def test_variant_is_resized_and_cacheable(client, upload):
+    response = client.get(f"/api/images/uploads/{upload}", params={"w": 150, "format": "jpeg", "q": 70})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"].startswith('"')
+    assert "max-age=" in response.headers["cache-control"]
+    assert "Accept" not in response.headers.get("vary", "")
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.size == (150, 200)
+
+
+def test_matching_if_none_match_returns_304(client, upload):
+    url = f"/api/images/uploads/{upload}?w=150&format=jpeg"
+    etag = client.get(url).headers["etag"]
+
+    revalidated = client.get(url, headers={"If-None-Match": f'W/"other", {etag}'})
+    changed = client.get(url.replace("w=150", "w=160"), headers={"If-None-Match": etag})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert revalidated.content == b""
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_auto_format_negotiates_on_accept(client, upload):
+    webp = client.get(f"/api/images/uploads/{upload}?w=100", headers={"Accept": "image/avif,image/webp,*/*"})
+    jpeg = client.get(f"/api/images/uploads/{upload}?w=100", headers={"Accept": "image/*"})
+
+    assert webp.headers["content-type"] == "image/webp"
+    assert jpeg.headers["content-type"] == "image/jpeg"
+    assert "Accept" in webp.headers["vary"] and "Accept" in jpeg.headers["vary"]
+    assert webp.headers["etag"] != jpeg.headers["etag"]
+
+
+def test_images_are_never_upscaled(client, upload):
+    response = client.get(f"/api/images/uploads/{upload}?w=2000&format=jpeg")
+
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.size == (600, 800)
+
+
+def test_hidden_and_outside_paths_are_not_found(client, main, upload):
+    uploads = main.get_image_variant_store().roots["uploads"]
+    hidden = uploads / ".incoming" / "pending.png"
+    Image.new("RGB", (10, 10)).save(hidden)
+
+    assert client.get("/api/images/uploads/.incoming/pending.png").status_code == 404
+    Image.new("RGB", (10, 10)).save(uploads.parent / "outside.png")
+    assert client.get("/api/images/uploads/%2E%2E/outside.png").status_code == 404
+    assert client.get("/api/images/uploads/missing.png").status_code == 404
+
+
+def test_invalid_parameters_are_rejected(client, upload):
+    assert client.get(f"/api/images/uploads/{upload}?format=gif").status_code == 400
+    assert client.get(f"/api/images/uploads/{upload}?w=0").status_code == 400
+    assert client.get(f"/api/images/cache/{upload}").status_code == 400
@@ -0,0 +1,143 @@
+"""Tests for the Prometheus text exposition and the /api/metrics endpoint"""
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services import metrics
+from app.services.metrics import Counter, Gauge, Histogram
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """Parse exposition text into {name: {type, help, samples: [(labels, value)]}}"""
+    families = {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, documentation = line[7:].split(" ", 1)
+            families.setdefault(name, {"samples": []})["help"] = documentation
+        elif line.startswith("# TYPE "):
+            name, kind = line[7:].split(" ", 1)
+            families.setdefault(name, {"samples": []})["type"] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"malformed sample line: {line!r}"
+            name, labels, value = match.groups()
+            family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in families else name
+            assert family in families, f"sample {name} precedes its TYPE line"
+            labels = {key: unescape(value) for key, value in LABEL.findall(labels or "")}
+            families[family]["samples"].append((name, labels, float(value)))
+    return families
+
+
+def unescape(value):
+    return re.sub(r"\\(.)", lambda m: {"n": "\n"}.get(m.group(1), m.group(1)), value)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry, so test metrics do not leak into the module-level one"""
+    monkeypatch.setattr(metrics, "_metrics", [])
+    return metrics._metrics
+
+
+def test_counter_and_gauge_render_help_type_and_samples(registry):
+    requests = Counter("test_requests_total", "Requests handled", ["method"])
+    depth = Gauge("test_depth", "Queue depth")
+    requests.inc(method="GET")
+    requests.inc(2, method="GET")
+    requests.inc(method="POST")
+    depth.inc(3)
+    depth.dec()
+
+    assert metrics.render() == (
+        "# HELP test_requests_total Requests handled\n"
+        "# TYPE test_requests_total counter\n"
+        'test_requests_total{method="GET"} 3\n'
+        'test_requests_total{method="POST"} 1\n'
+        "# HELP test_depth Queue depth\n"
+        "# TYPE test_depth gauge\n"
+        "test_depth 2\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative_with_inf_sum_and_count(registry):
+    latency = Histogram("test_seconds", "Latency", ["stage"], buckets=(0.1, 1.0, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.7, 2.0):
+        latency.observe(value, stage="save")
+
+    samples = parse(metrics.render())["test_seconds"]["samples"]
+    buckets = [(labels["le"], value) for name, labels, value in samples if name == "test_seconds_bucket"]
+    # Bounds are sorted and a value equal to a bound falls in that bound's bucket
+    assert buckets == [("0.1", 2), ("0.5", 3), ("1.0", 4), ("+Inf", 5)]
+    totals = {name: value for name, labels, value in samples if name != "test_seconds_bucket"}
+    assert totals["test_seconds_count"] == 5
+    assert totals["test_seconds_sum"] == pytest.approx(3.15)
+
+
+def test_histogram_time_observes_blocks_that_raise(registry):
+    latency = Histogram("test_seconds", "Latency")
+    with pytest.raises(RuntimeError):
+        with latency.time():
+            raise RuntimeError("boom")
+
+    assert "test_seconds_count 1" in metrics.render()
+
+
+def test_label_values_are_escaped(registry):
+    errors = Counter("test_errors_total", "Errors", ["message"])
+    value = 'path C:\\tmp "quoted"\nnext line'
+    errors.inc(message=value)
+
+    rendered = metrics.render()
+    assert 'message="path C:\\\\tmp \\"quoted\\"\\nnext line"' in rendered
+    assert "\nnext line" not in rendered
+    (_, labels, _), = parse(rendered)["test_errors_total"]["samples"]
+    assert labels["message"] == value
+
+
+def test_wrong_label_count_is_rejected(registry):
+    counter = Counter("test_total", "Total", ["upstream"])
+    with pytest.raises(ValueError):
+        counter.inc(upstream="openai", operation="predict")
+
+
+def test_upstream_call_records_latency_and_errors_by_type(registry, monkeypatch):
+    seconds = Histogram("test_upstream_seconds", "Latency", ["upstream", "operation"])
+    in_flight = Gauge("test_upstream_in_flight", "In flight", ["upstream"])
+    errors = Counter("test_upstream_errors_total", "Errors", ["upstream", "operation", "type"])
+    monkeypatch.setattr(metrics, "UPSTREAM_SECONDS", seconds)
+    monkeypatch.setattr(metrics, "UPSTREAM_IN_FLIGHT", in_flight)
+    monkeypatch.setattr(metrics, "UPSTREAM_ERRORS", errors)
+
+    with metrics.upstream_call("openai", "chat"):
+        assert in_flight._values[("openai",)] == 1
+    with pytest.raises(TimeoutError):
+        with metrics.upstream_call("openai", "chat"):
+            raise TimeoutError()
+
+    assert in_flight._values[("openai",)] == 0
+    assert 'test_upstream_seconds_count{upstream="openai",operation="chat"} 2' in metrics.render()
+    assert errors._values == {("openai", "chat", "timeout"): 1}
+
+
+def test_metrics_endpoint_renders_parseable_exposition(main):
+    with TestClient(main.app) as client:
+        assert client.get("/api/health").status_code == 200
+        response = client.get("/api/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    families = parse(response.text)
+    assert families["wardrobe_http_request_duration_seconds"]["type"] == "histogram"
+    assert families["wardrobe_tryon_queue_depth"]["type"] == "gauge"
+    routes = {
+        labels["route"]
+        for name, labels, _ in families["wardrobe_http_request_duration_seconds"]["samples"]
+        if name.endswith("_count")
+    }
+    assert "/api/health" in routes
+    caches = {labels["cache"] for _, labels, _ in families["wardrobe_cache_lookups"]["samples"]}
+    assert {"search", "openai", "tryon_results", "image_variants"} <= caches
@@ -0,0 +1,80 @@
+"""Tests for the OpenAI response cache"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services.openai_service import OpenAIService
+
+
+@pytest.fixture
+def make_service(monkeypatch, tmp_path):
+    """OpenAI services sharing one on-disk response cache, answering with a call counter"""
+    monkeypatch.setenv("OPENAI_CACHE_PATH", str(tmp_path / "openai.sqlite3"))
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"analysis {len(requests)}"}}]})
+
+    def make():
+        service = OpenAIService(api_key="test-key")
+        service._client = httpx.AsyncClient(base_url=service.base_url, transport=httpx.MockTransport(handler))
+        return service
+
+    make.requests = requests
+    return make
+
+
+def test_repeated_analysis_is_served_from_cache(make_service):
+    service = make_service()
+
+    async def scenario():
+        return [await service.analyze_image("https://shop.test/jacket.jpg") for _ in range(2)]
+
+    assert asyncio.run(scenario()) == ["analysis 1", "analysis 1"]
+    assert len(make_service.requests) == 1
+    assert service.cache_stats()["hits"] == 1
+
+
+def test_key_covers_the_prompt_and_image(make_service):
+    service = make_service()
+
+    async def scenario():
+        await service.analyze_image("https://shop.test/jacket.jpg")
+        await service.analyze_image("https://shop.test/jacket.jpg", prompt="Name the fabric")
+        await service.analyze_image("https://shop.test/coat.jpg")
+
+    asyncio.run(scenario())
+    assert len(make_service.requests) == 3
+
+
+def test_use_cache_false_forces_a_fresh_completion_and_stores_it(make_service):
+    service = make_service()
+
+    async def scenario():
+        await service.analyze_image("https://shop.test/jacket.jpg")
+        forced = await service.analyze_image("https://shop.test/jacket.jpg", use_cache=False)
+        return forced, await service.analyze_image("https://shop.test/jacket.jpg")
+
+    assert asyncio.run(scenario()) == ("analysis 2", "analysis 2")
+
+
+def test_cache_survives_a_restart(make_service):
+    asyncio.run(make_service().analyze_image("https://shop.test/jacket.jpg"))
+    restarted = make_service()
+
+    assert asyncio.run(restarted.analyze_image("https://shop.test/jacket.jpg")) == "analysis 1"
+    assert len(make_service.requests) == 1
+
+
+def test_chat_is_not_cached(make_service):
+    service = make_service()
+
+    async def scenario():
+        for _ in range(2):
+            await service.get_chat_response([{"type": "user", "text": "Hi"}])
+
+    asyncio.run(scenario())
+    assert len(make_service.requests) == 2
@@ -0,0 +1,78 @@
+"""Tests for the pooled OpenAI HTTP client"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services.openai_service import OpenAIService
+
+
+class FakeOpenAI:
+    """Records chat completion requests and answers with a fixed reply"""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "Try a navy blazer."}}]})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Route every client the service creates to a fake OpenAI, counting the clients"""
+    fake = FakeOpenAI()
+    fake.clients = []
+    real_client = httpx.AsyncClient
+
+    def client(**kwargs):
+        fake.clients.append(kwargs)
+        return real_client(transport=httpx.MockTransport(fake), **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", client)
+    return fake
+
+
+def test_calls_share_one_client_until_closed(upstream):
+    service = OpenAIService(api_key="test-key", base_url="http://openai.test/v1/")
+
+    async def scenario():
+        await service.startup()
+        replies = [(await service.get_chat_response([{"type": "user", "text": "Hi"}]))["response"] for _ in range(3)]
+        await service.analyze_image("https://shop.test/jacket.jpg")
+        await service.aclose()
+        return replies
+
+    replies = asyncio.run(scenario())
+    assert replies == ["Try a navy blazer."] * 3
+    assert len(upstream.clients) == 1
+    assert service._client is None
+    assert [str(r.url) for r in upstream.requests] == ["http://openai.test/v1/chat/completions"] * 4
+    assert upstream.requests[0].headers["Authorization"] == "Bearer test-key"
+
+
+def test_pool_and_timeouts_come_from_the_environment(upstream, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("OPENAI_CHAT_TIMEOUT", "3")
+    service = OpenAIService(api_key="test-key")
+
+    asyncio.run(service.get_chat_response([{"type": "user", "text": "Hi"}]))
+
+    limits = upstream.clients[0]["limits"]
+    assert limits.max_connections == 7
+    assert upstream.requests[0].extensions["timeout"]["read"] == 3
+
+
+def test_chat_messages_are_mapped_to_openai_roles(upstream):
+    service = OpenAIService(api_key="test-key")
+
+    asyncio.run(service.get_chat_response([
+        {"type": "user", "text": "I need shoes"},
+        {"type": "ai", "text": "For what occasion?"},
+    ], context={"closetName": "Work"}))
+
+    body = json.loads(upstream.requests[0].content)
+    assert [m["role"] for m in body["messages"]] == ["system", "user", "assistant"]
+    assert "Closet: Work" in body["messages"][0]["content"]
+    assert body["model"] == service.model
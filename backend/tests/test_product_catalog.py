@@ -0,0 +1,210 @@
+"""Tests for the local product catalog and how search uses it"""
+import asyncio
+import sqlite3
+import time
+
+import httpx
+import pytest
+
+from app.services.google_search_service import GoogleSearchService
+from app.services.product_catalog import ProductCatalog, parse_price
+
+PRODUCTS = [
+    {"link": "https://shop.test/1", "name": "Trail Running Shoes", "description": "Grippy outsole", "brand": "Salomon", "price": "$129.99"},
+    {"link": "https://shop.test/2", "name": "Canvas Sneakers", "description": "Great for running errands", "brand": "Vans", "price": "USD 55"},
+    {"link": "https://shop.test/3", "name": "Road Running Shoe", "description": "Lightweight trainer", "brand": "Nike", "price": "$1,299.00"},
+    {"link": "https://shop.test/4", "name": "Running Socks", "description": "Cushioned", "brand": "Nike", "price": "N/A"},
+]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = ProductCatalog(tmp_path / "catalog.sqlite3")
+    catalog.upsert(PRODUCTS)
+    yield catalog
+    catalog.close()
+
+
+@pytest.mark.parametrize("price, amount", [
+    ("$129.99", 129.99),
+    ("USD 55", 55.0),
+    ("$1,299.00", 1299.0),
+    ("From 40 to 60", 40.0),
+    ("N/A", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_price(price, amount):
+    assert parse_price(price) == amount
+
+
+def names(results):
+    return [item["name"] for item in results]
+
+
+def test_name_matches_rank_above_description_matches(catalog):
+    results = catalog.search("running")
+    assert names(results)[-1] == "Canvas Sneakers"
+    assert set(names(results)) == {item["name"] for item in PRODUCTS}
+
+
+def test_every_word_must_match_after_stemming(catalog):
+    assert set(names(catalog.search("running shoes"))) == {"Trail Running Shoes", "Road Running Shoe"}
+    assert names(catalog.search("trail shoe")) == ["Trail Running Shoes"]
+    assert catalog.search("sandals") == []
+    assert catalog.search("!!") == []
+
+
+def test_brand_and_price_filters(catalog):
+    assert set(names(catalog.search("running", brand="nik"))) == {"Road Running Shoe", "Running Socks"}
+    assert names(catalog.search("running", min_price=100, max_price=200)) == ["Trail Running Shoes"]
+    # Products without a price never match a price filter
+    assert "Running Socks" not in names(catalog.search("running", max_price=10_000))
+
+
+def test_brand_filter_matches_percent_and_underscore_literally(catalog):
+    catalog.upsert([
+        {"link": "https://shop.test/5", "name": "Running Tights", "brand": "100% Run", "price": "$40"},
+        {"link": "https://shop.test/6", "name": "Running Cap", "brand": "Run_Club", "price": "$20"},
+    ])
+
+    assert names(catalog.search("running", brand="%")) == ["Running Tights"]
+    assert names(catalog.search("running", brand="_")) == ["Running Cap"]
+
+
+def test_products_not_refreshed_within_max_age_are_pruned(tmp_path):
+    catalog = ProductCatalog(tmp_path / "catalog.sqlite3", max_age_days=1)
+    catalog.upsert(PRODUCTS)
+    with catalog._lock:
+        catalog._db.execute("UPDATE products SET updated_at = ? WHERE link != ?", (time.time() - 2 * 86400, PRODUCTS[0]["link"]))
+        catalog._db.commit()
+
+    assert catalog.prune() == len(PRODUCTS) - 1
+    assert names(catalog.search("running")) == ["Trail Running Shoes"]
+    catalog.close()
+
+
+def test_prune_is_disabled_by_a_zero_max_age(tmp_path):
+    catalog = ProductCatalog(tmp_path / "catalog.sqlite3", max_age_days=0)
+    catalog.upsert(PRODUCTS)
+    with catalog._lock:
+        catalog._db.execute("UPDATE products SET updated_at = 0")
+        catalog._db.commit()
+
+    assert catalog.prune() == 0
+    assert catalog.count() == len(PRODUCTS)
+    catalog.close()
+
+
+def test_upsert_refreshes_products_by_link(catalog):
+    catalog.upsert([{**PRODUCTS[1], "name": "Canvas Slip-Ons"}])
+
+    assert catalog.count() == len(PRODUCTS)
+    assert names(catalog.search("slip")) == ["Canvas Slip-Ons"]
+    assert catalog.search("sneakers") == []
+
+
+class FakeCustomSearch:
+    def __init__(self, status=200):
+        self.status = status
+        self.requests = 0
+
+    def __call__(self, request):
+        self.requests += 1
+        items = [{"title": f"Google Running Shoe {i}", "link": f"https://google.test/{i}"} for i in range(10)]
+        return httpx.Response(self.status, json={"items": items} if self.status == 200 else {})
+
+
+@pytest.fixture
+def make_search(monkeypatch, tmp_path):
+    monkeypatch.setenv("PRODUCT_CATALOG_PATH", str(tmp_path / "catalog.sqlite3"))
+
+    def make(upstream, min_recall=None):
+        if min_recall is not None:
+            monkeypatch.setenv("PRODUCT_CATALOG_MIN_RECALL", str(min_recall))
+        service = GoogleSearchService(api_key="key", search_engine_id="engine")
+        service._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        service.catalog.upsert(PRODUCTS)
+        return service
+
+    return make
+
+
+def search(service, query, **kwargs):
+    async def scenario():
+        try:
+            return await service.search_products(query, **kwargs)
+        finally:
+            await service.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_auto_mode_is_answered_locally_when_recall_is_high_enough(make_search):
+    upstream = FakeCustomSearch()
+    service = make_search(upstream)
+
+    results = search(service, "running", num_results=4, mode="auto")
+
+    assert len(results) == 4
+    assert upstream.requests == 0
+    assert service.local_served == 1
+
+
+def test_auto_mode_queries_google_when_local_recall_is_low(make_search):
+    upstream = FakeCustomSearch()
+    service = make_search(upstream)
+
+    results = search(service, "running", num_results=10, mode="auto")
+
+    assert upstream.requests == 1
+    assert names(results)[0] == "Google Running Shoe 0"
+    assert service.google_fallthroughs == 1
+
+
+def test_min_recall_can_be_lowered_from_the_environment(make_search):
+    upstream = FakeCustomSearch()
+    service = make_search(upstream, min_recall=0.4)
+
+    assert len(search(service, "running", num_results=10, mode="auto")) == 4
+    assert upstream.requests == 0
+
+
+def test_local_results_are_returned_when_google_fails(make_search):
+    service = make_search(FakeCustomSearch(status=429))
+
+    results = search(service, "running", num_results=10, mode="auto")
+
+    assert len(results) == 4
+    assert service.local_fallbacks == 1
+
+
+def test_google_results_feed_the_catalog(make_search):
+    service = make_search(FakeCustomSearch())
+    catalog = service.catalog
+
+    search(service, "shoe", num_results=10, mode="google")
+
+    reopened = ProductCatalog(catalog.path)
+    assert reopened.count() == len(PRODUCTS) + 10
+    reopened.close()
+
+
+def test_aclose_closes_the_catalog(make_search):
+    service = make_search(FakeCustomSearch())
+    catalog = service.catalog
+
+    asyncio.run(service.aclose())
+
+    assert service.catalog is None
+    with pytest.raises(sqlite3.ProgrammingError):
+        catalog.count()
+
+
+def test_local_mode_never_calls_google_and_unknown_modes_are_rejected(make_search):
+    upstream = FakeCustomSearch()
+    assert search(make_search(upstream), "sandals", mode="local") == []
+    assert upstream.requests == 0
+
+    with pytest.raises(ValueError):
+        search(make_search(upstream), "running", mode="everything")
@@ -0,0 +1,87 @@
+"""Tests for the concurrent product search fan-out behind recommendations"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services.admission import PRIORITY_BATCH
+from app.services.openai_service import OpenAIService
+
+ITEM_TYPES = "Item 1: running shorts\nItem 2: crew neck t-shirt\nItem 3: training joggers\nItem 4: sneakers\nItem 5: hoodie"
+
+
+@pytest.fixture
+def openai():
+    """An OpenAI service whose chat completions return five item types"""
+    def completions(request):
+        return httpx.Response(200, json={"choices": [{"message": {"content": ITEM_TYPES}}]})
+
+    service = OpenAIService(api_key="test-key")
+    service._client = httpx.AsyncClient(base_url=service.base_url, transport=httpx.MockTransport(completions))
+    return service
+
+
+class FakeSearch:
+    """Product search with a per-item-type delay, failure or result"""
+
+    def __init__(self, delays=None, failing=(), shared_link=None):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.shared_link = shared_link
+        self.queries = []
+        self.priorities = set()
+
+    async def search_products(self, query, num_results=10, priority=None):
+        self.queries.append(query)
+        self.priorities.add(priority)
+        item_type = query.split("men's ", 1)[1]
+        await asyncio.sleep(self.delays.get(item_type, 0.01))
+        if item_type in self.failing:
+            raise RuntimeError("search failed")
+        results = [{"name": item_type, "link": f"https://shop.test/{item_type.replace(' ', '-')}"}]
+        if self.shared_link:
+            results.insert(0, {"name": f"shared {item_type}", "link": self.shared_link})
+        return results
+
+
+def recommend(openai, search, **kwargs):
+    return asyncio.run(openai.generate_clothing_recommendations({"purpose": "gym"}, search, **kwargs))
+
+
+def test_searches_run_concurrently(openai):
+    search = FakeSearch(delays={item: 0.2 for item in ("running shorts", "crew neck t-shirt", "training joggers", "sneakers", "hoodie")})
+
+    started = time.monotonic()
+    results = recommend(openai, search)
+
+    assert time.monotonic() - started < 0.6
+    assert [item["name"] for item in results] == ["running shorts", "crew neck t-shirt", "training joggers", "sneakers", "hoodie"]
+    assert all(item["id"] for item in results)
+    # Recommendation searches queue behind interactive ones when Custom Search is busy
+    assert search.priorities == {PRIORITY_BATCH}
+
+
+def test_late_and_failed_searches_are_skipped(openai):
+    search = FakeSearch(delays={"sneakers": 5}, failing={"hoodie"})
+
+    started = time.monotonic()
+    results = recommend(openai, search, deadline=0.2)
+
+    assert time.monotonic() - started < 1
+    assert [item["name"] for item in results] == ["running shorts", "crew neck t-shirt", "training joggers"]
+
+
+def test_brand_is_added_to_each_search(openai):
+    search = FakeSearch()
+    asyncio.run(openai.generate_clothing_recommendations({"brands": "Nike"}, search))
+
+    assert search.queries[0] == "Nike men's running shorts"
+
+
+def test_a_product_is_recommended_for_one_item_type_only(openai):
+    search = FakeSearch(shared_link="https://shop.test/multipack")
+    results = recommend(openai, search)
+
+    assert [item["link"] for item in results].count("https://shop.test/multipack") == 1
+    assert len(results) == 5
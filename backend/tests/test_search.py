@@ -0,0 +1,166 @@
+"""Tests for paged, cached product search against a fake Custom Search API"""
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import ttl_cache
+from app.services.google_search_service import GoogleSearchService
+
+
+class FakeCustomSearch:
+    """Answers Custom Search requests with numbered items and records what was asked"""
+
+    def __init__(self, delay=0.02, failing_starts=(), duplicate_links=False):
+        self.requests = []
+        self.delay = delay
+        self.failing_starts = set(failing_starts)
+        self.duplicate_links = duplicate_links
+        self.active = self.peak = 0
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        start, num = int(request.url.params["start"]), int(request.url.params["num"])
+        if start in self.failing_starts:
+            return httpx.Response(500, json={"error": "backend error"})
+        links = [f"https://shop.test/p/{0 if self.duplicate_links else i}" for i in range(start, start + num)]
+        items = [{"title": f"Item {i}", "link": link} for i, link in zip(range(start, start + num), links)]
+        return httpx.Response(200, json={"items": items})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(ttl_cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def make_search(monkeypatch, clock):
+    monkeypatch.setenv("SEARCH_CACHE_TTL", "60")
+    monkeypatch.setenv("SEARCH_CACHE_STALE_TTL", "600")
+    monkeypatch.delenv("SEARCH_CACHE_PATH", raising=False)
+
+    def make(upstream):
+        service = GoogleSearchService(api_key="secret-key", search_engine_id="engine")
+        service._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        return service
+
+    return make
+
+
+def run(service, *calls):
+    """Run search calls in order on one event loop, then close the client"""
+    async def scenario():
+        try:
+            results = []
+            for call in calls:
+                results.append(await call(service))
+            return results
+        finally:
+            await service.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_pages_are_fetched_concurrently_and_merged(make_search):
+    upstream = FakeCustomSearch()
+    [results] = run(make_search(upstream), lambda s: s.search_products("jeans", num_results=25))
+
+    assert [(r.url.params["start"], r.url.params["num"]) for r in upstream.requests] == [
+        ("1", "10"), ("11", "10"), ("21", "5")
+    ]
+    assert upstream.peak == 3
+    assert [item["name"] for item in results] == [f"Item {i}" for i in range(1, 26)]
+
+
+def test_api_key_is_sent_as_a_header(make_search):
+    upstream = FakeCustomSearch()
+    run(make_search(upstream), lambda s: s.search_products("jeans"))
+
+    request = upstream.requests[0]
+    assert request.headers["X-goog-api-key"] == "secret-key"
+    assert "secret-key" not in str(request.url)
+
+
+def test_failed_later_page_returns_partial_results(make_search):
+    upstream = FakeCustomSearch(failing_starts={11})
+    [results] = run(make_search(upstream), lambda s: s.search_products("jeans", num_results=20))
+
+    assert [item["name"] for item in results] == [f"Item {i}" for i in range(1, 11)]
+
+
+def test_failed_first_page_returns_fallback_results_and_is_not_cached(make_search):
+    upstream = FakeCustomSearch(failing_starts={1})
+    service = make_search(upstream)
+    [results] = run(service, lambda s: s.search_products("jeans"))
+
+    assert results and all("shop.test" not in item["link"] for item in results)
+    assert service.cache_stats()["entries"] == 0
+
+
+def test_links_repeated_across_pages_are_dropped(make_search):
+    upstream = FakeCustomSearch(duplicate_links=True)
+    [results] = run(make_search(upstream), lambda s: s.search_products("jeans", num_results=20))
+
+    assert len(results) == 1
+
+
+def test_equivalent_queries_share_a_cache_entry(make_search):
+    upstream = FakeCustomSearch()
+    service = make_search(upstream)
+    first, second, other = run(
+        service,
+        lambda s: s.search_products("Red  Running Shoes", num_results=5),
+        lambda s: s.search_products("red running shoes ", num_results=5),
+        lambda s: s.search_products("red running shoes", num_results=5, search_type="image"),
+    )
+
+    assert first == second
+    assert len(upstream.requests) == 2
+    assert upstream.requests[1].url.params["searchType"] == "image"
+    assert service.cache_stats()["hits"] == 1
+
+
+def test_stale_results_are_served_once_and_refreshed_in_the_background(make_search, clock):
+    upstream = FakeCustomSearch()
+    service = make_search(upstream)
+
+    async def go_stale(s):
+        clock.value += 61
+        results = await asyncio.gather(*(s.search_products("jeans") for _ in range(5)))
+        await asyncio.gather(*s._refresh_tasks.values())
+        return results
+
+    first, stale, fresh = run(
+        service,
+        lambda s: s.search_products("jeans"),
+        go_stale,
+        lambda s: s.search_products("jeans"),
+    )
+
+    assert all(results == first for results in stale)
+    assert fresh == first
+    assert len(upstream.requests) == 2
+    assert service.cache_stats()["stale_hits"] == 5
+
+
+def test_concurrent_identical_misses_share_one_upstream_request(make_search):
+    upstream = FakeCustomSearch()
+    service = make_search(upstream)
+
+    async def search_together(s):
+        return await asyncio.gather(*(s.search_products("jeans") for _ in range(5)))
+
+    [results] = run(service, search_together)
+
+    assert len(upstream.requests) == 1
+    assert all(result == results[0] for result in results)
+    assert service.flights.stats()["followers"] == 4
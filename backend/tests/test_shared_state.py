@@ -0,0 +1,104 @@
+"""Tests for the SQLite shared-state backend and the state it shares between workers"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.shared_state import SQLiteSharedState
+from app.services.tryon_job_service import JOB_DONE, TryOnJobQueue
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "state.sqlite3"
+
+
+def test_entries_are_visible_to_another_connection(path):
+    SQLiteSharedState(path).set("jobs", "abc", {"status": "done"}, stored_at=100.0)
+    other = SQLiteSharedState(path)
+
+    assert other.get("jobs", "abc") == ({"status": "done"}, 100.0)
+    assert other.get("other", "abc") is None
+    other.delete("jobs", "abc")
+    assert other.get("jobs", "abc") is None
+
+
+def test_trim_drops_old_entries_then_all_but_the_newest(path):
+    state = SQLiteSharedState(path)
+    for i in range(6):
+        state.set("cache", f"key{i}", i, stored_at=100.0 + i)
+
+    assert state.trim("cache", keep=2, before=101.5) == 4
+    assert [i for i in range(6) if state.get("cache", f"key{i}") is not None] == [4, 5]
+
+
+def test_trim_keeps_exactly_the_newest_entries_written_at_the_same_instant(path):
+    state = SQLiteSharedState(path)
+    for i in range(5):
+        state.set("cache", f"key{i}", i, stored_at=100.0)
+
+    assert state.trim("cache", keep=3, before=0) == 2
+    assert state.stats()["entries"]["cache"] == 3
+
+
+def test_token_bucket_is_shared_between_connections(path):
+    first, second = SQLiteSharedState(path), SQLiteSharedState(path)
+
+    assert first.take_token("openai", rate=1.0, burst=2) == 0
+    assert second.take_token("openai", rate=1.0, burst=2) == 0
+    wait = first.take_token("openai", rate=1.0, burst=2)
+    assert 0 < wait <= 1.0
+    assert second.tokens("openai", rate=1.0, burst=2) < 1
+
+
+def test_lease_is_held_by_one_holder_until_it_expires(path):
+    first, second = SQLiteSharedState(path), SQLiteSharedState(path)
+
+    assert first.try_lease("storage_sweep", "worker-1", ttl=60)
+    assert not second.try_lease("storage_sweep", "worker-2", ttl=60)
+    assert first.try_lease("storage_sweep", "worker-1", ttl=60)
+
+    assert first.try_lease("sweep_short", "worker-1", ttl=0)
+    assert second.try_lease("sweep_short", "worker-2", ttl=60)
+
+
+def test_concurrent_writers_do_not_lose_tokens(path):
+    states = [SQLiteSharedState(path) for _ in range(4)]
+    taken = []
+
+    def take(state):
+        for _ in range(10):
+            if state.take_token("bucket", rate=0.001, burst=20) == 0:
+                taken.append(1)
+
+    threads = [threading.Thread(target=take, args=(state,)) for state in states]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(taken) == 20
+
+
+def test_job_status_can_be_polled_from_another_worker(path):
+    async def scenario():
+        worker = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=5, shared=SQLiteSharedState(path))
+        other = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=5, shared=SQLiteSharedState(path))
+        await worker.start()
+        try:
+            job = worker.submit(lambda: "/files/generated/result.png")
+            await asyncio.wait_for(job.wait(), 2)
+            # Status is published by a background thread, so the other worker may briefly lag
+            deadline = time.monotonic() + 2
+            while (other.status(job.id) or {}).get("status") != JOB_DONE and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            return job.id, other.status(job.id), other.status("0" * 32)
+        finally:
+            await worker.stop()
+
+    job_id, status, unknown = asyncio.run(scenario())
+    assert status["job_id"] == job_id
+    assert status["status"] == JOB_DONE
+    assert status["result"] == "/files/generated/result.png"
+    assert unknown is None
@@ -0,0 +1,147 @@
+"""Tests for coalescing of identical in-flight calls"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return {"value": 42}
+
+        results = await asyncio.gather(*(flight.run("key", fetch) for _ in range(5)))
+        return calls, results, flight.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert all(result == {"value": 42} for result in results)
+    assert stats == {"in_flight": 0, "leaders": 1, "followers": 4, "cancelled": 0}
+
+
+def test_different_keys_are_not_coalesced():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fetch(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.run("a", lambda: fetch("a")), flight.run("b", lambda: fetch("b")))
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+
+def test_exception_is_delivered_to_every_waiter():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        return await asyncio.gather(*(flight.run("key", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["upstream down"] * 3
+
+
+def test_finished_call_is_not_remembered():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        return await flight.run("key", fetch), await flight.run("key", fetch)
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.create_task(flight.run("key", fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.run("key", fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, flight.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == "done"
+    assert stats["cancelled"] == 0
+
+
+def test_call_is_cancelled_once_every_waiter_is_gone():
+    async def scenario():
+        flight = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.run("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flight.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["cancelled"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_run_sync_coalesces_threads():
+    flight = SingleFlight("test")
+    calls = 0
+    started = threading.Event()
+    results = []
+
+    def fetch():
+        nonlocal calls
+        calls += 1
+        started.set()
+        time.sleep(0.05)
+        return "value"
+
+    def call():
+        results.append(flight.run_sync("key", fetch))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert calls == 1
+    assert results == ["value"] * 4
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,38 @@
+"""Tests that application startup stays fast and offline"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.bench_startup import PROBE
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def test_startup_opens_no_connections_and_defers_heavy_imports(tmp_path):
+    (tmp_path / "backend").mkdir()
+    (tmp_path / "datasets").mkdir()
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(BACKEND),
+        STARTUP_WARMUP="false",
+        OPENAI_CACHE_PATH="",
+        PRODUCT_CATALOG_PATH="",
+        SHARED_STATE_BACKEND="none",
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=tmp_path / "backend",
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["status"] == 200
+    assert report["connects"] == []
+    assert report["lazy_loaded"] == []
@@ -0,0 +1,148 @@
+"""Tests for storage budgets, LRU eviction and pins"""
+import os
+import time
+
+import pytest
+
+from app.services.storage_service import StorageManager, shard_path
+
+FILE_SIZE = 1000
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return StorageManager(tmp_path / "index.sqlite3", sweep_interval=300, grace=0)
+
+
+def write(manager, directory, name, levels=1):
+    """Write and track a sharded file, spaced out so access times are ordered"""
+    path = shard_path(directory, name) if levels == 1 else directory / name[:2] / name[2:4] / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(os.urandom(FILE_SIZE))
+    manager.track(directory.name, path)
+    time.sleep(0.01)
+    return path
+
+
+def test_least_recently_used_files_are_evicted_over_budget(storage, tmp_path):
+    area = tmp_path / "generated"
+    storage.add_area("generated", area, max_mb=2.5 * FILE_SIZE / 1024 / 1024, max_age_days=0)
+    first, second, third = (write(storage, area, f"{c * 64}.png") for c in "abc")
+    storage.touch("generated", first)
+
+    result = storage.sweep()
+
+    assert result["generated"] == {"files": 1, "bytes": FILE_SIZE}
+    assert first.exists() and third.exists()
+    assert not second.exists()
+
+
+def test_pinned_files_are_never_evicted(storage, tmp_path):
+    area = tmp_path / "generated"
+    storage.add_area("generated", area, max_mb=0.5 * FILE_SIZE / 1024 / 1024, max_age_days=0)
+    first, second = (write(storage, area, f"{c * 64}.png") for c in "ab")
+    assert storage.pin("generated", first)
+
+    storage.sweep()
+    assert first.exists()
+    assert not second.exists()
+
+    assert storage.unpin("generated", first)
+    storage.sweep()
+    assert not first.exists()
+
+
+def test_pin_of_a_missing_file_fails(storage, tmp_path):
+    area = tmp_path / "generated"
+    storage.add_area("generated", area, max_mb=1, max_age_days=0)
+    assert not storage.pin("generated", shard_path(area, "f" * 64 + ".png"))
+
+
+def test_idle_files_are_evicted_by_age(storage, tmp_path):
+    area = tmp_path / "uploads"
+    storage.add_area("uploads", area, max_mb=0, max_age_days=0.05 / 86400)
+    idle = write(storage, area, "a" * 64 + ".jpg")
+    time.sleep(0.05)
+    recent = write(storage, area, "b" * 64 + ".jpg")
+
+    storage.sweep()
+
+    assert not idle.exists()
+    assert recent.exists()
+
+
+def test_grace_period_protects_recent_files(tmp_path):
+    storage = StorageManager(tmp_path / "index.sqlite3", sweep_interval=300, grace=60)
+    area = tmp_path / "uploads"
+    storage.add_area("uploads", area, max_mb=0.5 * FILE_SIZE / 1024 / 1024, max_age_days=0)
+    path = write(storage, area, "a" * 64 + ".jpg")
+
+    assert storage.sweep()["uploads"]["files"] == 0
+    assert path.exists()
+
+
+def test_eviction_removes_empty_shard_directories(storage, tmp_path):
+    # Uploads are sharded two levels deep (`22/f0/22f0....jpg`)
+    area = tmp_path / "uploads"
+    storage.add_area("uploads", area, max_mb=0.5 * FILE_SIZE / 1024 / 1024, max_age_days=0)
+    evicted = write(storage, area, "22f0" + "a" * 60 + ".jpg", levels=2)
+    neighbour = write(storage, area, "22f1" + "b" * 60 + ".jpg", levels=2)
+    storage.pin("uploads", neighbour)
+
+    storage.sweep()
+
+    assert not evicted.parent.exists()
+    assert neighbour.exists()
+    assert (area / "22").is_dir()
+
+    storage.unpin("uploads", neighbour)
+    storage.sweep()
+    assert list(area.iterdir()) == []
+
+
+def test_files_written_outside_the_manager_are_indexed(storage, tmp_path):
+    area = tmp_path / "generated"
+    area.mkdir()
+    (area / "legacy.png").write_bytes(os.urandom(FILE_SIZE))
+    storage.add_area("generated", area, max_mb=0.5 * FILE_SIZE / 1024 / 1024, max_age_days=0)
+
+    assert storage.sweep()["generated"]["files"] == 1
+    assert not (area / "legacy.png").exists()
+
+
+def test_resolve_maps_urls_and_rejects_traversal(storage, tmp_path):
+    area = tmp_path / "generated"
+    storage.add_area("generated", area, max_mb=1, max_age_days=0)
+    area.mkdir()
+
+    name, path = storage.resolve("/files/generated/ab/cd/x.png?w=200")
+    assert name == "generated"
+    assert path == area.resolve() / "ab" / "cd" / "x.png"
+
+    for url in ("/files/generated/../../etc/passwd", "/files/other/x.png", "/api/health"):
+        with pytest.raises(ValueError):
+            storage.resolve(url)
+
+
+def test_pins_endpoint_pins_and_unpins_uploads(main):
+    import io
+
+    from fastapi.testclient import TestClient
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 60), "teal").save(buffer, "PNG")
+    with TestClient(main.app) as client:
+        url = client.post("/api/uploads", files={"image": ("look.png", buffer.getvalue(), "image/png")}).json()["url"]
+
+        pinned = client.post("/api/storage/pins", json={"url": url})
+        unpinned = client.request("DELETE", "/api/storage/pins", json={"url": url})
+        missing = client.post("/api/storage/pins", json={"url": "/files/uploads/00/00/" + "0" * 64 + ".jpg"})
+        outside = client.post("/api/storage/pins", json={"url": "/files/../backend/app/main.py"})
+
+    assert pinned.status_code == 200
+    assert pinned.json()["area"] == "uploads"
+    assert url.endswith(pinned.json()["path"])
+    assert unpinned.json()["pinned"] is False
+    assert missing.status_code == 404
+    assert outside.status_code == 400
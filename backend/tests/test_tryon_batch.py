@@ -0,0 +1,85 @@
+"""Tests for the streaming batch try-on endpoint"""
+import io
+import json
+import threading
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+
+def encode(color, size=(48, 64)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FakeService:
+    """Stands in for IDM-VTON, returning the person image as the result"""
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def try_on(self, person_image, garment_image, garment_description, **kwargs):
+        with self.lock:
+            self.calls.append(garment_description)
+        if garment_description == self.fail_on:
+            raise RuntimeError("Space unavailable")
+        return str(person_image)
+
+
+def run_batch(client, garments, descriptions, garment_ids=()):
+    response = client.post(
+        "/api/clothing/try-on/batch",
+        files=[("person_image", ("person.png", encode("beige"), "image/png"))] + [
+            ("clothing_images", (f"garment{i}.png", data, "image/png")) for i, data in enumerate(garments)
+        ],
+        data={"garment_descriptions": descriptions, "clothing_image_ids": list(garment_ids), "seed": "11"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_streams_one_result_per_garment(main, monkeypatch):
+    service = FakeService(fail_on="broken")
+    monkeypatch.setattr(main, "get_idm_vton_service", lambda: service)
+
+    with TestClient(main.app) as client:
+        lines = run_batch(client, [encode("navy"), encode("olive")], ["shirt", "broken"], ["0" * 64])
+
+    header, results = lines[0], sorted(lines[1:], key=lambda line: line["index"])
+    assert header["type"] == "batch"
+    assert header["count"] == 3
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert results[0]["status"] == "done"
+    assert results[0]["result"].startswith("/files/generated/")
+    assert results[1]["status"] == "failed"
+    assert results[1]["error"] == "Space unavailable"
+    assert results[2]["status"] == "failed"
+    assert "Unknown clothing_image_id" in results[2]["error"]
+    assert sorted(service.calls) == ["broken", "shirt"]
+
+
+def test_repeated_batch_is_served_from_cache(main, monkeypatch):
+    service = FakeService()
+    monkeypatch.setattr(main, "get_idm_vton_service", lambda: service)
+
+    with TestClient(main.app) as client:
+        first = run_batch(client, [encode("maroon"), encode("teal")], ["jacket", "scarf"])
+        second = run_batch(client, [encode("maroon"), encode("teal")], ["jacket", "scarf"])
+
+    assert [line["cached"] for line in second[1:]] == [True, True]
+    assert {line["result"] for line in first[1:]} == {line["result"] for line in second[1:]}
+    assert len(service.calls) == 2
+
+
+def test_batch_without_garments_is_rejected(main):
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/clothing/try-on/batch",
+            files={"person_image": ("person.png", encode("beige"), "image/png")},
+        )
+
+    assert response.status_code == 400
@@ -0,0 +1,120 @@
+"""Tests for the content-addressed try-on result cache"""
+import hashlib
+import time
+
+import pytest
+from PIL import Image
+
+from app.services.admission import PRIORITY_INTERACTIVE
+from app.services.storage_service import StorageManager
+from app.services.tryon_cache_service import TryOnResultCache
+
+PARAMS = {
+    "garment_description": "A navy linen shirt",
+    "auto_mask": True,
+    "auto_crop": False,
+    "denoise_steps": 30,
+    "seed": 42,
+}
+
+
+@pytest.fixture
+def images(tmp_path):
+    person, garment = tmp_path / "person.png", tmp_path / "garment.png"
+    Image.new("RGB", (32, 48), "beige").save(person)
+    Image.new("RGB", (32, 32), "navy").save(garment)
+    return person, garment
+
+
+@pytest.fixture
+def cache(tmp_path):
+    storage = StorageManager(tmp_path / "index.sqlite3", sweep_interval=300, grace=0)
+    storage.add_area("generated", tmp_path / "generated", max_mb=0, max_age_days=0)
+    return TryOnResultCache(tmp_path / "generated", storage=storage)
+
+
+def digest(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_key_depends_on_which_image_is_which(images):
+    person, garment = (digest(path) for path in images)
+
+    assert TryOnResultCache.make_key(person, garment, **PARAMS) == TryOnResultCache.make_key(person, garment, **PARAMS)
+    assert TryOnResultCache.make_key(person, garment, **PARAMS) != TryOnResultCache.make_key(garment, person, **PARAMS)
+
+
+def test_key_ignores_parameter_order_but_not_values(images):
+    person, garment = (digest(path) for path in images)
+    key = TryOnResultCache.make_key(person, garment, **PARAMS)
+
+    assert key == TryOnResultCache.make_key(person, garment, **dict(reversed(list(PARAMS.items()))))
+    assert key != TryOnResultCache.make_key(person, garment, **{**PARAMS, "seed": 43})
+    assert key != TryOnResultCache.make_key(person, garment, **{**PARAMS, "auto_crop": True})
+
+
+def test_put_then_get_hits(cache, images):
+    person, garment = images
+    key = TryOnResultCache.make_key(digest(person), digest(garment), **PARAMS)
+
+    assert cache.get(key) is None
+    stored = cache.put(key, person)
+    assert stored == f"{key[:2]}/{key}.png"
+    assert cache.get(key) == stored
+    assert (cache.directory / stored).read_bytes() == person.read_bytes()
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_queued_tryon_is_served_from_cache(main, images, monkeypatch):
+    person, garment = images
+    calls = []
+
+    class FakeService:
+        def try_on(self, **kwargs):
+            calls.append(kwargs)
+            return str(person)
+
+    monkeypatch.setattr(main, "get_idm_vton_service", lambda: FakeService())
+    key = TryOnResultCache.make_key(digest(person), digest(garment), **PARAMS)
+    args = (key, person, garment, PARAMS["garment_description"], True, False, 30, 42, PRIORITY_INTERACTIVE)
+
+    first = main.run_clothing_tryon(*args)
+    second = main.run_clothing_tryon(*args)
+
+    assert first == second == f"/files/generated/{key[:2]}/{key}.png"
+    assert len(calls) == 1
+
+
+def test_repeated_tryon_request_is_answered_from_cache(main, images, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    person, garment = images
+    calls = []
+
+    class FakeService:
+        def try_on(self, **kwargs):
+            calls.append(kwargs)
+            return str(person)
+
+    monkeypatch.setattr(main, "get_idm_vton_service", lambda: FakeService())
+    files = {
+        "person_image": ("person.png", person.read_bytes(), "image/png"),
+        "clothing_image": ("garment.png", garment.read_bytes(), "image/png"),
+    }
+    with TestClient(main.app) as client:
+        queued = client.post("/api/clothing/try-on", files=files, data={"seed": "7"})
+        assert queued.status_code == 202
+        assert queued.json()["cached"] is False
+        for _ in range(200):
+            status = client.get(queued.json()["status_url"]).json()
+            if status["status"] == "done":
+                break
+            time.sleep(0.01)
+        assert status["status"] == "done"
+
+        repeated = client.post("/api/clothing/try-on", files=files, data={"seed": "7"})
+
+    assert repeated.status_code == 200
+    assert repeated.json()["cached"] is True
+    assert repeated.json()["result"] == status["result"]
+    assert len(calls) == 1
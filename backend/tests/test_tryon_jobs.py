@@ -0,0 +1,250 @@
+"""Tests for the background try-on job queue"""
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from app.services.admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from app.services.idm_vton_service import IDMVTONService
+from app.services.tryon_job_service import (
+    JOB_DONE,
+    JOB_FAILED,
+    QueueFullError,
+    TryOnJobQueue,
+    WorkersStalledError,
+)
+
+
+async def finished(queue, job, timeout=2.0):
+    """Poll a job until it is done or failed"""
+    deadline = time.monotonic() + timeout
+    while not queue.get(job.id).finished:
+        assert time.monotonic() < deadline, f"job {job.id} did not finish"
+        await asyncio.sleep(0.01)
+    return queue.get(job.id)
+
+
+def test_jobs_run_off_the_event_loop_and_report_their_result():
+    async def scenario():
+        queue = TryOnJobQueue(workers=2, max_queue_size=4, job_timeout=5)
+        await queue.start()
+        loop_thread = threading.get_ident()
+        try:
+            job = queue.submit(lambda: threading.get_ident() != loop_thread)
+            return (await finished(queue, job)).to_dict(), queue.stats()
+        finally:
+            await queue.stop()
+
+    status, stats = asyncio.run(scenario())
+    assert status["status"] == JOB_DONE
+    assert status["result"] is True
+    assert status["started_at"] <= status["finished_at"]
+    assert stats["jobs"][JOB_DONE] == 1
+
+
+def test_failed_job_reports_its_error():
+    def fail():
+        raise RuntimeError("Space unavailable")
+
+    async def scenario():
+        queue = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=5)
+        await queue.start()
+        try:
+            return await finished(queue, queue.submit(fail))
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(scenario())
+    assert job.status == JOB_FAILED
+    assert job.error == "Space unavailable"
+
+
+def test_workers_bound_the_number_of_concurrent_jobs():
+    lock = threading.Lock()
+    running = peak = 0
+
+    def work():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.03)
+        with lock:
+            running -= 1
+
+    async def scenario():
+        queue = TryOnJobQueue(workers=2, max_queue_size=8, job_timeout=5)
+        await queue.start()
+        try:
+            jobs = [queue.submit(work) for _ in range(6)]
+            for job in jobs:
+                await finished(queue, job)
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+    assert peak == 2
+
+
+def test_submit_rejects_jobs_when_the_queue_is_full():
+    release = threading.Event()
+
+    async def scenario():
+        queue = TryOnJobQueue(workers=1, max_queue_size=1, job_timeout=5)
+        await queue.start()
+        try:
+            running = queue.submit(release.wait)
+            await asyncio.sleep(0.05)
+            waiting = queue.submit(lambda: "queued")
+            with pytest.raises(QueueFullError):
+                queue.submit(lambda: "rejected")
+            release.set()
+            return (await finished(queue, running)).status, (await finished(queue, waiting)).result
+        finally:
+            release.set()
+            await queue.stop()
+
+    assert asyncio.run(scenario()) == (JOB_DONE, "queued")
+
+
+def test_interactive_jobs_start_before_queued_batch_jobs():
+    release = threading.Event()
+    order = []
+
+    async def scenario():
+        queue = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=5)
+        await queue.start()
+        try:
+            running = queue.submit(release.wait)
+            await asyncio.sleep(0.05)
+            jobs = [
+                queue.submit(lambda: order.append("batch 1"), priority=PRIORITY_BATCH),
+                queue.submit(lambda: order.append("batch 2"), priority=PRIORITY_BATCH),
+                queue.submit(lambda: order.append("single"), priority=PRIORITY_INTERACTIVE),
+            ]
+            release.set()
+            for job in [running, *jobs]:
+                await finished(queue, job)
+        finally:
+            release.set()
+            await queue.stop()
+
+    asyncio.run(scenario())
+    assert order == ["single", "batch 1", "batch 2"]
+
+
+def test_full_queue_is_answered_with_429_and_retry_after(main, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    def submit(func, priority=PRIORITY_INTERACTIVE):
+        raise QueueFullError("Try-on queue is full", 12)
+
+    uploaded = {}
+    monkeypatch.setattr(main.get_tryon_job_queue(), "submit", submit)
+    with TestClient(main.app) as client:
+        for name, color in (("person", "beige"), ("garment", "navy")):
+            image = io.BytesIO()
+            Image.new("RGB", (30, 40), color).save(image, "PNG")
+            response = client.post("/api/uploads", files={"image": (f"{name}.png", image.getvalue(), "image/png")})
+            uploaded[name] = response.json()["id"]
+        response = client.post("/api/clothing/try-on", data={
+            "person_image_id": uploaded["person"],
+            "clothing_image_id": uploaded["garment"],
+        })
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "12"
+
+
+def test_job_running_past_the_timeout_is_failed():
+    release = threading.Event()
+
+    async def scenario():
+        queue = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=0.1)
+        await queue.start()
+        try:
+            stuck = queue.submit(release.wait)
+            job = await finished(queue, stuck)
+            return job.status, job.error
+        finally:
+            release.set()
+            await queue.stop()
+
+    status, error = asyncio.run(scenario())
+    assert status == JOB_FAILED
+    assert "timed out" in error
+
+
+def test_worker_carries_on_while_a_timed_out_thread_is_still_running():
+    release = threading.Event()
+
+    async def scenario():
+        queue = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=0.1, max_orphaned=2)
+        await queue.start()
+        try:
+            stuck = await finished(queue, queue.submit(release.wait))
+            after = await finished(queue, queue.submit(lambda: "next"))
+            orphaned = queue.stats()["orphaned_threads"]
+            release.set()
+            await asyncio.sleep(0.05)
+            return stuck.status, after.result, orphaned, queue.stats()["orphaned_threads"]
+        finally:
+            release.set()
+            await queue.stop()
+
+    assert asyncio.run(scenario()) == (JOB_FAILED, "next", 1, 0)
+
+
+def test_new_jobs_are_rejected_while_too_many_timed_out_threads_are_running():
+    release = threading.Event()
+
+    async def scenario():
+        queue = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=0.1, max_orphaned=2)
+        await queue.start()
+        try:
+            for _ in range(2):
+                await finished(queue, queue.submit(release.wait))
+            with pytest.raises(WorkersStalledError) as excinfo:
+                queue.submit(lambda: "rejected")
+            release.set()
+            while queue.stats()["orphaned_threads"]:
+                await asyncio.sleep(0.01)
+            return excinfo.value.retry_after, (await finished(queue, queue.submit(lambda: "accepted"))).result
+        finally:
+            release.set()
+            await queue.stop()
+
+    assert asyncio.run(scenario()) == (1, "accepted")
+
+
+def test_explicit_job_timeout_is_respected_even_when_shorter_than_failover(monkeypatch, caplog):
+    monkeypatch.setenv("TRYON_JOB_TIMEOUT", "60")
+
+    assert TryOnJobQueue(max_job_duration=300).job_timeout == 60
+    assert "shorter than a try-on failing over" in caplog.text
+    monkeypatch.delenv("TRYON_JOB_TIMEOUT")
+    assert TryOnJobQueue(max_job_duration=300).job_timeout == 300
+
+
+def test_failover_duration_excludes_the_admission_wait(monkeypatch):
+    monkeypatch.setenv("IDM_VTON_QUEUE_TIMEOUT", "500")
+    service = IDMVTONService(spaces=["space-a", "space-b"], hf_token="token", timeout=90)
+
+    assert service.max_duration() == 180
+
+
+def test_wait_returns_once_the_job_has_finished():
+    async def scenario():
+        queue = TryOnJobQueue(workers=1, max_queue_size=4, job_timeout=5)
+        await queue.start()
+        try:
+            job = queue.submit(lambda: "result")
+            return await asyncio.wait_for(job.wait(), 2)
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.result) == (JOB_DONE, "result")
@@ -0,0 +1,118 @@
+"""Tests for the TTL/LRU cache with stale-while-revalidate and shared storage"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ttl_cache
+from app.services.shared_state import SQLiteSharedState
+from app.services.ttl_cache import FRESH, MISS, STALE, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable wall clock for the cache module"""
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(ttl_cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_entry_is_fresh_then_stale_then_expired(clock):
+    async def scenario():
+        cache = TTLCache(maxsize=10, ttl=60, stale_ttl=30)
+        await cache.set("key", "value")
+        states = [await cache.get("key")]
+        clock.value += 61
+        states.append(await cache.get("key"))
+        clock.value += 30
+        states.append(await cache.get("key"))
+        return states, cache.stats()
+
+    states, stats = asyncio.run(scenario())
+    assert states == [("value", FRESH), ("value", STALE), (None, MISS)]
+    assert (stats["hits"], stats["stale_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["entries"] == 0
+
+
+def test_refresh_makes_a_stale_entry_fresh(clock):
+    async def scenario():
+        cache = TTLCache(maxsize=10, ttl=60, stale_ttl=30)
+        await cache.set("key", "old")
+        clock.value += 70
+        stale = await cache.get("key")
+        await cache.set("key", "new")
+        return stale, await cache.get("key")
+
+    assert asyncio.run(scenario()) == (("old", STALE), ("new", FRESH))
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    async def scenario():
+        cache = TTLCache(maxsize=2, ttl=60)
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.get("a")
+        await cache.set("c", 3)
+        return [await cache.get(key) for key in ("a", "b", "c")], cache.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [(1, FRESH), (None, MISS), (3, FRESH)]
+    assert stats["evictions"] == 1
+
+
+def test_entries_are_shared_through_the_store(tmp_path, clock):
+    shared = SQLiteSharedState(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        writer = TTLCache(maxsize=10, ttl=60, shared=shared, namespace="test")
+        reader = TTLCache(maxsize=10, ttl=60, shared=shared, namespace="test")
+        await writer.set("key", {"results": [1, 2]})
+        return await reader.get("key")
+
+    assert asyncio.run(scenario()) == ({"results": [1, 2]}, FRESH)
+
+
+def test_stale_local_entry_picks_up_a_refresh_by_another_worker(tmp_path, clock):
+    shared = SQLiteSharedState(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        first = TTLCache(maxsize=10, ttl=60, stale_ttl=60, shared=shared, namespace="test")
+        second = TTLCache(maxsize=10, ttl=60, stale_ttl=60, shared=shared, namespace="test")
+        await first.set("key", "old")
+        clock.value += 70
+        await second.set("key", "new")
+        return await first.get("key")
+
+    assert asyncio.run(scenario()) == ("new", FRESH)
+
+
+def test_path_store_survives_a_restart(tmp_path, clock):
+    async def scenario():
+        await TTLCache(maxsize=10, ttl=60, path=tmp_path / "cache.sqlite3").set("key", "value")
+        return await TTLCache(maxsize=10, ttl=60, path=tmp_path / "cache.sqlite3").get("key")
+
+    assert asyncio.run(scenario()) == ("value", FRESH)
+
+
+def test_store_is_trimmed_to_maxsize_and_servable_age(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(ttl_cache, "_TRIM_INTERVAL", 5)
+    shared = SQLiteSharedState(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        cache = TTLCache(maxsize=3, ttl=60, stale_ttl=30, shared=shared, namespace="test")
+        for i in range(5):
+            clock.value += 1
+            await cache.set(f"key{i}", i)
+        after_size_trim = shared.stats()["entries"]["test"]
+
+        # Everything written so far is past ttl + stale_ttl when the next trim runs, and the
+        # next batch is written at the same instant, so only the key breaks the tie
+        clock.value += 100
+        for i in range(5, 10):
+            await cache.set(f"key{i}", i)
+        return after_size_trim, shared.stats()["entries"]["test"], shared.get("test", "key4")
+
+    after_size_trim, after_age_trim, expired = asyncio.run(scenario())
+    assert after_size_trim == 3
+    assert after_age_trim == 3
+    assert expired is None
@@ -0,0 +1,221 @@
+"""Tests for upload sniffing, size limits, preprocessing and the content-addressed upload store"""
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.services.image_preprocessing_service import ImagePreprocessor, ImageTooLargeError, preprocess_image
+from app.services.image_sniffing import sniff_image
+from app.services.storage_service import StorageManager
+from app.services.upload_store_service import UploadStore, UploadTooLargeError
+
+
+def encode(image_format, size=(64, 48), noise=False, **options):
+    image = Image.effect_noise(size, 64).convert("RGB") if noise else Image.new("RGB", size, "navy")
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    storage = StorageManager(tmp_path / "index.sqlite3", sweep_interval=300, grace=0)
+    storage.add_area("uploads", tmp_path / "uploads", max_mb=0, max_age_days=0)
+    return UploadStore(tmp_path / "uploads", preprocessor=ImagePreprocessor(workers=1), storage=storage)
+
+
+def save(store, data, filename="photo.png"):
+    return asyncio.run(store.save(io.BytesIO(data), filename))
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "PNG", "GIF", "BMP", "WEBP"])
+def test_sniff_reads_format_and_dimensions(image_format):
+    assert sniff_image(encode(image_format, (321, 123))) == (image_format, (321, 123))
+
+
+def test_sniff_identifies_tiff_without_dimensions():
+    assert sniff_image(encode("TIFF")) == ("TIFF", None)
+
+
+def test_sniff_rejects_non_images():
+    with pytest.raises(ValueError):
+        sniff_image(b"%PDF-1.7 not an image")
+
+
+def test_save_stores_a_normalized_copy_named_by_digest(store):
+    data = encode("PNG")
+    image_id, path = save(store, data)
+
+    assert image_id == hashlib.sha256(data).hexdigest()
+    assert path == store.directory / image_id[:2] / image_id[2:4] / f"{image_id}.jpg"
+    with Image.open(path) as image:
+        assert image.format == "JPEG"
+    assert store.get(image_id) == path
+    assert store.url_for(image_id) == f"/files/uploads/{image_id[:2]}/{image_id[2:4]}/{image_id}.jpg"
+
+
+def test_identical_uploads_are_stored_once(store):
+    data = encode("PNG")
+    first, _ = save(store, data)
+    second, _ = save(store, data, "copy.png")
+
+    assert first == second
+    assert len(list(store.directory.rglob("*.jpg"))) == 1
+    assert list(store.incoming.iterdir()) == []
+
+
+def test_unknown_or_malformed_ids_are_not_found(store):
+    assert store.get("0" * 64) is None
+    assert store.get("../" + "0" * 61) is None
+    assert store.get("") is None
+
+
+def test_large_uploads_are_spooled_to_disk(store):
+    store.memory_max_bytes = 1024
+    data = encode("PNG", (256, 256), noise=True)
+    assert len(data) > store.memory_max_bytes
+
+    image_id, path = save(store, data)
+
+    assert image_id == hashlib.sha256(data).hexdigest()
+    assert path.exists()
+    assert list(store.incoming.iterdir()) == []
+
+
+def test_upload_over_the_byte_limit_is_rejected(store):
+    store.max_bytes = 10_000
+    data = encode("PNG", (256, 256), noise=True)
+    assert len(data) > store.max_bytes
+
+    with pytest.raises(UploadTooLargeError, match="upload limit"):
+        save(store, data)
+    assert list(store.incoming.iterdir()) == []
+
+
+def test_upload_over_the_pixel_limit_is_rejected_from_its_header(store):
+    store.max_pixels = 100 * 100
+    with pytest.raises(UploadTooLargeError, match="megapixels"):
+        save(store, encode("PNG", (200, 200)))
+
+
+def test_pixel_limit_is_enforced_when_the_header_has_no_dimensions(store):
+    store.max_pixels = 100 * 100
+    with pytest.raises(UploadTooLargeError, match="megapixel limit"):
+        save(store, encode("TIFF", (200, 200)), "photo.tiff")
+    assert list(store.incoming.iterdir()) == []
+
+
+def test_non_image_upload_is_rejected(store):
+    with pytest.raises(ValueError) as excinfo:
+        save(store, b"just some text", "notes.txt")
+    assert not isinstance(excinfo.value, UploadTooLargeError)
+    assert list(store.incoming.iterdir()) == []
+
+
+def test_corrupt_image_is_rejected(store):
+    data = encode("PNG")
+    with pytest.raises(ValueError) as excinfo:
+        save(store, data[:40] + b"\x00" * 200)
+    assert not isinstance(excinfo.value, UploadTooLargeError)
+    assert list(store.incoming.iterdir()) == []
+
+
+def test_large_image_is_scaled_down_and_padded_to_the_model_aspect_ratio(tmp_path):
+    source, destination = tmp_path / "wide.jpg", tmp_path / "out.jpg"
+    source.write_bytes(encode("JPEG", (3000, 1500)))
+
+    result = preprocess_image(str(source), str(destination))
+
+    assert result == {"original_size": (3000, 1500), "size": (768, 1024)}
+    with Image.open(destination) as image:
+        assert image.size == (768, 1024)
+
+
+def test_small_image_is_padded_but_not_scaled_up(tmp_path):
+    source, destination = tmp_path / "small.png", tmp_path / "out.jpg"
+    source.write_bytes(encode("PNG", (300, 300)))
+
+    assert preprocess_image(str(source), str(destination))["size"] == (300, 400)
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    source, destination = tmp_path / "rotated.jpg", tmp_path / "out.jpg"
+    source.write_bytes(encode("JPEG", (400, 300), exif=exif.tobytes()))
+
+    # Rotating 400x300 by 90 degrees gives an exact 3:4 portrait, so no padding is needed
+    assert preprocess_image(str(source), str(destination))["size"] == (300, 400)
+
+
+def test_tryon_accepts_ids_of_stored_uploads(main, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(main, "run_clothing_tryon", lambda *args: "/files/generated/result.png")
+    with TestClient(main.app) as client:
+        person = client.post("/api/uploads", files={"image": ("person.png", encode("PNG", (40, 60)), "image/png")})
+        garment = client.post("/api/uploads", files={"image": ("garment.jpg", encode("JPEG"), "image/jpeg")})
+        assert person.status_code == garment.status_code == 200
+
+        queued = client.post("/api/clothing/try-on", data={
+            "person_image_id": person.json()["id"],
+            "clothing_image_id": garment.json()["id"],
+        })
+        unknown = client.post("/api/clothing/try-on", data={
+            "person_image_id": "0" * 64,
+            "clothing_image_id": garment.json()["id"],
+        })
+        missing = client.post("/api/clothing/try-on", data={"person_image_id": person.json()["id"]})
+
+    assert queued.status_code == 202
+    assert queued.json()["person_image_id"] == person.json()["id"]
+    assert unknown.status_code == 404
+    assert missing.status_code == 400
+
+
+def test_preprocess_raises_a_dedicated_error_over_the_pixel_limit(tmp_path):
+    with pytest.raises(ImageTooLargeError):
+        preprocess_image(encode("PNG", (200, 200)), str(tmp_path / "out.jpg"), max_pixels=100 * 100)
+
+
+def test_request_body_limit_rejects_by_content_length_and_while_streaming(main):
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    client = TestClient(main.RequestSizeLimitMiddleware(app, max_bytes=100))
+
+    assert client.post("/echo", content=b"x" * 100).json() == {"size": 100}
+    assert client.post("/echo", content=b"x" * 101).status_code == 413
+    # Without a Content-Length the limit is enforced on the bytes received
+    assert client.post("/echo", content=iter([b"x" * 60, b"x" * 60])).status_code == 413
+
+
+def test_upload_endpoint_answers_413_over_the_pixel_limit(main, monkeypatch):
+    monkeypatch.setattr(main.get_upload_store(), "max_pixels", 100 * 100)
+    with TestClient(main.app) as client:
+        response = client.post("/api/uploads", files={"image": ("big.png", encode("PNG", (200, 200)), "image/png")})
+        rejected = client.post("/api/uploads", files={"image": ("notes.txt", b"just some text", "text/plain")})
+
+    assert response.status_code == 413
+    assert "megapixels" in response.json()["detail"]
+    assert rejected.status_code == 400
+
+
+def test_files_under_hidden_directories_are_not_served(main):
+    incoming = main.UPLOADS / ".incoming"
+    incoming.mkdir(exist_ok=True)
+    (incoming / "pending.jpg").write_bytes(encode("JPEG"))
+    (main.UPLOADS / "visible.jpg").write_bytes(encode("JPEG"))
+    try:
+        with TestClient(main.app) as client:
+            assert client.get("/files/uploads/visible.jpg").status_code == 200
+            assert client.get("/files/uploads/.incoming/pending.jpg").status_code == 404
+    finally:
+        (main.UPLOADS / "visible.jpg").unlink()
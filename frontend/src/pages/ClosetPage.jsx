@@ -164,7 +164,8 @@ function ClosetPage({ onNavigate, closetData }) {
           tryOnImages.clothing.file
         );
 
-        const imageUrl = backendApi.getResultImageUrl(result.result);
+        // Display-sized WebP instead of the full lossless PNG
+        const imageUrl = backendApi.getVariantUrl(result.result, { width: 768 });
         setTryOnResult(imageUrl);
       } catch (error) {
         console.error("Try-on error:", error);
@@ -21,7 +21,79 @@ export const backendApi = {
       throw new Error(errorData.detail || 'Clothing try-on failed');
     }
 
-    return response.json();
+    const job = await response.json();
+    // Cached results come back already completed
+    if (job.status === 'done') {
+      return job;
+    }
+    return this.waitForTryOnJob(job.job_id, options);
+  },
+
+  async waitForTryOnJob(jobId, options = {}) {
+    const pollInterval = options.pollInterval || 2000;
+
+    // Try-ons run in a background queue; poll until the job finishes
+    for (;;) {
+      const response = await fetch(`${API_URL}/api/clothing/try-on/${jobId}`);
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.detail || 'Clothing try-on failed');
+      }
+
+      const job = await response.json();
+      if (job.status === 'done') {
+        return job;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Clothing try-on failed');
+      }
+      await new Promise((resolve) => setTimeout(resolve, pollInterval));
+    }
+  },
+
+  async clothingTryOnBatch(personImage, clothingImages, options = {}, onResult = () => {}) {
+    const formData = new FormData();
+    formData.append('person_image', personImage);
+    clothingImages.forEach((image) => formData.append('clothing_images', image));
+    (options.garmentDescriptions || []).forEach((description) => {
+      formData.append('garment_descriptions', description);
+    });
+    formData.append('auto_mask', options.autoMask !== undefined ? options.autoMask : true);
+    formData.append('auto_crop', options.autoCrop || false);
+    formData.append('denoise_steps', options.denoiseSteps || 30);
+    formData.append('seed', options.seed || 42);
+
+    const response = await fetch(`${API_URL}/api/clothing/try-on/batch`, {
+      method: 'POST',
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || 'Batch clothing try-on failed');
+    }
+
+    // Results arrive as NDJSON in completion order; hand each one over as soon as it is parsed
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const results = [];
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const message = JSON.parse(line);
+        if (message.type === 'result') {
+          results[message.index] = message;
+          onResult(message);
+        }
+      }
+      if (done) break;
+    }
+    return results;
   },
 
   async checkHealth() {
@@ -40,5 +112,18 @@ export const backendApi = {
     // Remove leading slash if present
     const cleanPath = resultPath.startsWith('/') ? resultPath.substring(1) : resultPath;
     return `${API_URL}/${cleanPath}`;
+  },
+
+  getVariantUrl(resultPath, { width, height, format = 'auto', quality } = {}) {
+    // Resized WebP/JPEG variant of an uploaded or generated image (/files/<root>/<path>)
+    const match = resultPath.match(/\/files\/(uploads|generated)\/(.+)$/);
+    if (!match) {
+      return this.getResultImageUrl(resultPath);
+    }
+    const params = new URLSearchParams({ format });
+    if (width) params.set('w', width);
+    if (height) params.set('h', height);
+    if (quality) params.set('q', quality);
+    return `${API_URL}/api/images/${match[1]}/${match[2]}?${params}`;
   }
 };
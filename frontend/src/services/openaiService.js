@@ -27,6 +27,58 @@ export const openaiService = {
     }
   },
 
+  async streamChatResponse(messages, context = {}, onDelta, signal) {
+    const response = await fetch(`${API_URL}/api/ai/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        messages,
+        context
+      }),
+      signal
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.detail || 'Failed to get AI response');
+    }
+
+    // Server-sent events separated by blank lines
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        const isError = raw.split('\n').some((line) => line === 'event: error');
+        const dataLine = raw.split('\n').find((line) => line.startsWith('data: '));
+        if (!dataLine) continue;
+
+        const data = JSON.parse(dataLine.slice(6));
+        if (isError) {
+          throw new Error(data.detail || 'AI response was interrupted');
+        }
+        if (data.delta) {
+          text += data.delta;
+          if (onDelta) onDelta(data.delta, text);
+        }
+      }
+    }
+
+    return text;
+  },
+
   async analyzeImage(imageUrl, prompt) {
     try {
       const response = await fetch(`${API_URL}/api/ai/analyze-image`, {